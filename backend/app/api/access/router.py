@@ -1,4 +1,4 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Response, status
 from sqlalchemy.orm import Session
 from typing import List, Optional
 from datetime import datetime, date, time
@@ -6,161 +6,62 @@ from datetime import datetime, date, time
 from app.database.database import get_db
 from app.models import models
 from app.api.access import schemas
+from app.api.pagination import after_id, before_time, paginate, set_next_cursor
+from app.services.access_index import permission_index
+from app.services.access_audit import access_audit_writer
+from app.services.stats_aggregator import live_stats
+from app.services.candidate_index import candidate_index
+from app.services.access_service import check_access, decide_access, replay_time
+from app.services.index_sync import publish_change
 
 router = APIRouter()
 
 @router.post("/control", response_model=schemas.AccessControlResult)
 def check_access_control(request: schemas.AccessControlRequest, db: Session = Depends(get_db)):
     """检查访问控制权限"""
-    # 获取会员信息
-    member = db.query(models.Member).filter(models.Member.id == request.member_id).first()
-    if not member:
-        # 记录访问控制日志
-        access_log = models.AccessControl(
-            member_id=None,
-            device_id=request.device_id,
-            access_type=request.access_type,
-            status="denied",
-            reason="会员不存在",
-            recognition_method=request.recognition_method
-        )
-        db.add(access_log)
-        db.commit()
-        
-        return schemas.AccessControlResult(
-            allowed=False,
-            reason="会员不存在"
-        )
-    
-    # 检查会员状态
-    if member.status != "active":
-        reason = "会员状态异常"
-        if member.status == "expired":
-            reason = "会员已过期"
-        elif member.status == "inactive":
-            reason = "会员已停用"
-        
-        # 记录访问控制日志
-        access_log = models.AccessControl(
-            member_id=member.id,
-            device_id=request.device_id,
-            access_type=request.access_type,
-            status="denied",
-            reason=reason,
-            recognition_method=request.recognition_method
-        )
-        db.add(access_log)
-        db.commit()
-        
-        return schemas.AccessControlResult(
-            allowed=False,
-            reason=reason
-        )
-    
-    # 检查会员权限
-    current_time = datetime.now().time()
-    current_date = date.today()
-    current_weekday = str(current_date.weekday() + 1)  # 1-7表示周一到周日
-    
-    # 查找适用的权限规则
-    permissions = db.query(models.AccessPermission).filter(
-        models.AccessPermission.member_id == member.id,
-        models.AccessPermission.status == "active"
-    ).all()
-    
-    # 如果没有权限规则，默认允许
-    if not permissions:
-        # 记录访问控制日志
-        access_log = models.AccessControl(
-            member_id=member.id,
-            device_id=request.device_id,
-            access_type=request.access_type,
-            status="allowed",
-            recognition_method=request.recognition_method
-        )
-        db.add(access_log)
-        db.commit()
-        
-        return schemas.AccessControlResult(
-            allowed=True,
-            member_info={
-                "id": member.id,
-                "name": member.name,
-                "member_number": member.member_number,
-                "membership_type": member.membership_type
-            }
-        )
+    return check_access(db, request)
+
+@router.post("/control/batch", response_model=schemas.AccessControlBatchResult)
+def check_access_control_batch(request: schemas.AccessControlBatchRequest, db: Session = Depends(get_db)):
+    """批量检查访问控制权限，用于中间件重连后回放缓存的事件"""
+    permission_index.ensure_loaded(db)
+    now = datetime.now()
     
-    # 检查权限规则
-    for permission in permissions:
-        # 检查设备权限
-        if permission.device_id and permission.device_id != request.device_id:
-            continue
-        
-        # 检查日期范围
-        if permission.start_date and current_date < permission.start_date:
-            continue
-        if permission.end_date and current_date > permission.end_date:
-            continue
-        
-        # 检查星期几
-        if current_weekday not in permission.days_of_week:
-            continue
-        
-        # 检查时间范围
-        if permission.start_time and permission.end_time:
-            if not (permission.start_time <= current_time <= permission.end_time):
-                continue
-        
-        # 如果通过所有检查，允许访问
-        access_log = models.AccessControl(
-            member_id=member.id,
-            device_id=request.device_id,
-            access_type=request.access_type,
-            status="allowed",
-            recognition_method=request.recognition_method
-        )
-        db.add(access_log)
-        db.commit()
-        
-        return schemas.AccessControlResult(
-            allowed=True,
-            member_info={
-                "id": member.id,
-                "name": member.name,
-                "member_number": member.member_number,
-                "membership_type": member.membership_type
-            }
-        )
+    results = []
+    access_logs = []
+    for item in request.requests:
+        # 离线缓存的事件按设备上的刷卡时间判定和记录
+        result, access_log = decide_access(item, replay_time(item.event_time, now))
+        results.append(result)
+        access_logs.append(access_log)
     
-    # 如果没有匹配的权限规则，拒绝访问
-    access_log = models.AccessControl(
-        member_id=member.id,
-        device_id=request.device_id,
-        access_type=request.access_type,
-        status="denied",
-        reason="无访问权限",
-        recognition_method=request.recognition_method
-    )
-    db.add(access_log)
-    db.commit()
+    # 整批日志一起入队，由后台写入器按批大小合并为多行INSERT写入
+    access_audit_writer.enqueue_many(access_logs)
+    live_stats.record_access(access_logs)
     
-    return schemas.AccessControlResult(
-        allowed=False,
-        reason="无访问权限"
-    )
+    return schemas.AccessControlBatchResult(results=results)
+
+@router.get("/audit/stats")
+def get_access_audit_stats():
+    """获取访问日志写入队列状态"""
+    return access_audit_writer.stats()
 
 @router.get("/logs", response_model=List[schemas.AccessControlResponse])
 def get_access_logs(
+    response: Response,
     skip: int = 0,
     limit: int = 100,
+    cursor: Optional[str] = None,
     member_id: Optional[int] = None,
     device_id: Optional[int] = None,
     access_type: Optional[str] = None,
     status: Optional[str] = None,
     db: Session = Depends(get_db)
 ):
-    """获取访问控制日志"""
+    """获取访问控制日志，按时间倒序
+
+    传入上一页响应头 X-Next-Cursor 中的游标获取下一页，任意深度的翻页开销相同。
+    """
     query = db.query(
         models.AccessControl,
         models.Member.name.label("member_name"),
@@ -183,10 +84,11 @@ def get_access_logs(
     if status:
         query = query.filter(models.AccessControl.status == status)
     
-    # 按时间倒序排列
-    query = query.order_by(models.AccessControl.access_time.desc())
+    # 按 (时间, ID) 倒序排列，从游标位置继续
+    query = before_time(query, models.AccessControl.access_time, models.AccessControl.id, datetime, cursor)
     
-    logs = query.offset(skip).limit(limit).all()
+    logs = paginate(query, skip, limit, cursor).all()
+    set_next_cursor(response, logs, limit, lambda row: (row[0].access_time, row[0].id))
     
     result = []
     for log, member_name, device_name in logs:
@@ -207,8 +109,10 @@ def get_access_logs(
 
 @router.get("/permissions", response_model=List[schemas.AccessPermissionResponse])
 def get_access_permissions(
+    response: Response,
     skip: int = 0,
     limit: int = 100,
+    cursor: Optional[str] = None,
     member_id: Optional[int] = None,
     device_id: Optional[int] = None,
     db: Session = Depends(get_db)
@@ -232,7 +136,9 @@ def get_access_permissions(
     if device_id:
         query = query.filter(models.AccessPermission.device_id == device_id)
     
-    permissions = query.offset(skip).limit(limit).all()
+    query = after_id(query, models.AccessPermission.id, cursor)
+    permissions = paginate(query, skip, limit, cursor).all()
+    set_next_cursor(response, permissions, limit, lambda row: (row[0].id,))
     
     result = []
     for permission, member_name, device_name in permissions:
@@ -290,6 +196,9 @@ def create_access_permission(permission: schemas.AccessPermissionCreate, db: Ses
     db.add(db_permission)
     db.commit()
     db.refresh(db_permission)
+    permission_index.upsert_permission(db_permission)
+    candidate_index.upsert_permission(db_permission)
+    publish_change("permission", db_permission.id)
     
     # 获取关联信息
     member_name = member.name
@@ -343,6 +252,9 @@ def update_access_permission(
     
     db.commit()
     db.refresh(db_permission)
+    permission_index.upsert_permission(db_permission)
+    candidate_index.upsert_permission(db_permission)
+    publish_change("permission", db_permission.id)
     
     # 获取关联信息
     member = db.query(models.Member).filter(models.Member.id == permission.member_id).first()
@@ -382,5 +294,8 @@ def delete_access_permission(permission_id: int, db: Session = Depends(get_db)):
     
     db.delete(db_permission)
     db.commit()
+    permission_index.remove_permission(permission_id)
+    candidate_index.remove_permission(permission_id)
+    publish_change("permission", permission_id)
     
     return None 
\ No newline at end of file
@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import Optional, List
 from datetime import datetime, date, time
 
@@ -55,9 +55,18 @@ class AccessControlRequest(BaseModel):
     device_id: int
     access_type: str  # entry, exit
     recognition_method: str = "fingerprint"
+    event_time: Optional[datetime] = None  # 设备上的刷卡时间，仅批量回放时使用
 
 class AccessControlResult(BaseModel):
     """访问控制结果"""
     allowed: bool
     reason: Optional[str] = None
-    member_info: Optional[dict] = None 
\ No newline at end of file
+    member_info: Optional[dict] = None
+
+class AccessControlBatchRequest(BaseModel):
+    """批量访问控制请求"""
+    requests: List[AccessControlRequest] = Field(..., max_length=1000)
+
+class AccessControlBatchResult(BaseModel):
+    """批量访问控制结果，顺序与请求一致"""
+    results: List[AccessControlResult] 
\ No newline at end of file
@@ -1,18 +1,31 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
-from sqlalchemy import func, and_
+from sqlalchemy import func, and_, select
 from typing import List, Optional
 from datetime import datetime, date, timedelta
+import csv
+import io
 
-from app.database.database import get_db
+from app.database.database import get_db, SessionLocal
 from app.models import models
 from app.api.attendance import schemas
+from app.api.pagination import before_time, paginate, set_next_cursor
+from app.services.attendance_service import check_in, check_out, get_daily_summary
+from app.services.attendance_consumer import attendance_consumer
+from app.services.attendance_sweeper import attendance_sweeper
 
 router = APIRouter()
 
+# 流式导出考勤统计时每批读取的行数
+STATISTICS_BATCH_SIZE = 1000
+
 @router.post("/check", response_model=schemas.CheckInOutResult)
 def check_in_out(request: schemas.CheckInOutRequest, db: Session = Depends(get_db)):
-    """处理签到签退"""
+    """处理签到签退
+
+    门禁允许通行的进出事件由后台任务自动记为签到签退，此接口用于手动签到签退。
+    """
     # 验证会员和设备
     member = db.query(models.Member).filter(models.Member.id == request.member_id).first()
     if not member:
@@ -28,86 +41,34 @@ def check_in_out(request: schemas.CheckInOutRequest, db: Session = Depends(get_d
             message="设备不存在"
         )
     
+    # 签到签退各是一条原子语句，并发的重复刷卡不会产生重复记录或丢失签退
     current_time = datetime.now()
-    current_date = current_time.date()
-    
-    # 查找今天的考勤记录
-    attendance_record = db.query(models.AttendanceRecord).filter(
-        models.AttendanceRecord.member_id == request.member_id,
-        models.AttendanceRecord.date == current_date
-    ).first()
-    
     if request.check_type == "check_in":
-        if attendance_record and attendance_record.check_in_time:
-            return schemas.CheckInOutResult(
-                success=False,
-                message="今日已签到"
-            )
-        
-        if not attendance_record:
-            # 创建新的考勤记录
-            attendance_record = models.AttendanceRecord(
-                member_id=request.member_id,
-                device_id=request.device_id,
-                date=current_date,
-                check_in_time=current_time,
-                status="incomplete"
-            )
-            db.add(attendance_record)
-        else:
-            # 更新签到时间
-            attendance_record.check_in_time = current_time
-            attendance_record.device_id = request.device_id
-        
-        db.commit()
-        db.refresh(attendance_record)
-        
-        return schemas.CheckInOutResult(
-            success=True,
-            message="签到成功",
-            record_id=attendance_record.id,
-            check_time=current_time
-        )
-    
+        return check_in(db, request.member_id, request.device_id, device.branch_id, current_time)
     elif request.check_type == "check_out":
-        if not attendance_record or not attendance_record.check_in_time:
-            return schemas.CheckInOutResult(
-                success=False,
-                message="请先签到"
-            )
-        
-        if attendance_record.check_out_time:
-            return schemas.CheckInOutResult(
-                success=False,
-                message="今日已签退"
-            )
-        
-        # 更新签退时间和计算停留时间
-        attendance_record.check_out_time = current_time
-        duration = current_time - attendance_record.check_in_time
-        attendance_record.duration_minutes = int(duration.total_seconds() / 60)
-        attendance_record.status = "complete"
-        
-        db.commit()
-        db.refresh(attendance_record)
-        
-        return schemas.CheckInOutResult(
-            success=True,
-            message="签退成功",
-            record_id=attendance_record.id,
-            check_time=current_time
-        )
-    
+        return check_out(db, request.member_id, current_time)
     else:
         return schemas.CheckInOutResult(
             success=False,
             message="无效的操作类型"
         )
 
+@router.get("/consumer/stats")
+def get_attendance_consumer_stats():
+    """获取从访问日志派生考勤的后台任务的进度和延迟"""
+    return attendance_consumer.stats()
+
+@router.get("/sweeper/stats")
+def get_attendance_sweeper_stats():
+    """获取超时未签退自动关闭任务的状态"""
+    return attendance_sweeper.stats()
+
 @router.get("/records", response_model=List[schemas.AttendanceRecordResponse])
 def get_attendance_records(
+    response: Response,
     skip: int = 0,
     limit: int = 100,
+    cursor: Optional[str] = None,
     member_id: Optional[int] = None,
     device_id: Optional[int] = None,
     start_date: Optional[date] = None,
@@ -115,7 +76,10 @@ def get_attendance_records(
     status: Optional[str] = None,
     db: Session = Depends(get_db)
 ):
-    """获取考勤记录"""
+    """获取考勤记录，按日期倒序
+
+    传入上一页响应头 X-Next-Cursor 中的游标获取下一页，任意深度的翻页开销相同。
+    """
     query = db.query(
         models.AttendanceRecord,
         models.Member.name.label("member_name"),
@@ -140,10 +104,11 @@ def get_attendance_records(
     if status:
         query = query.filter(models.AttendanceRecord.status == status)
     
-    # 按日期倒序排列
-    query = query.order_by(models.AttendanceRecord.date.desc())
+    # 按 (日期, ID) 倒序排列，从游标位置继续
+    query = before_time(query, models.AttendanceRecord.date, models.AttendanceRecord.id, date, cursor)
     
-    records = query.offset(skip).limit(limit).all()
+    records = paginate(query, skip, limit, cursor).all()
+    set_next_cursor(response, records, limit, lambda row: (row[0].date, row[0].id))
     
     result = []
     for record, member_name, device_name in records:
@@ -162,58 +127,116 @@ def get_attendance_records(
     
     return result
 
+def _statistics_query(start_date: date, end_date: date, member_id: Optional[int] = None):
+    """按会员汇总日期范围内的签到天数和停留时间，一条分组聚合左连接会员表
+
+    指定会员时在分组子查询中同样过滤，只聚合该会员的考勤记录。
+    """
+    totals = select(
+        models.AttendanceRecord.member_id,
+        func.count(models.AttendanceRecord.check_in_time).label("present_days"),
+        func.coalesce(func.sum(models.AttendanceRecord.duration_minutes), 0).label("total_minutes")
+    ).where(
+        models.AttendanceRecord.date >= start_date,
+        models.AttendanceRecord.date <= end_date
+    )
+    if member_id:
+        totals = totals.where(models.AttendanceRecord.member_id == member_id)
+    totals = totals.group_by(
+        models.AttendanceRecord.member_id
+    ).subquery()
+    
+    query = select(
+        models.Member.id,
+        models.Member.name,
+        func.coalesce(totals.c.present_days, 0),
+        func.coalesce(totals.c.total_minutes, 0)
+    ).outerjoin(
+        totals,
+        totals.c.member_id == models.Member.id
+    ).order_by(models.Member.id)
+    if member_id:
+        query = query.where(models.Member.id == member_id)
+    return query
+
+def _statistics_row(member_id: int, member_name: str, present_days: int, total_minutes: int, total_days: int):
+    """由聚合结果计算一个会员的考勤统计"""
+    present_days = int(present_days)
+    absent_days = total_days - present_days
+    
+    # 计算总工作时间（小时）
+    total_hours = int(total_minutes) / 60.0
+    average_hours = total_hours / present_days if present_days > 0 else 0
+    attendance_rate = (present_days / total_days) * 100 if total_days > 0 else 0
+    
+    return schemas.AttendanceStatistics(
+        member_id=member_id,
+        member_name=member_name,
+        total_days=total_days,
+        present_days=present_days,
+        absent_days=absent_days,
+        total_hours=round(total_hours, 2),
+        average_hours=round(average_hours, 2),
+        attendance_rate=round(attendance_rate, 2)
+    )
+
+def _stream_statistics(query, total_days: int, report_format: str):
+    """在独立会话中以服务端游标逐批读取统计行并编码输出，内存占用与会员数无关"""
+    db = SessionLocal()
+    try:
+        result = db.execute(query.execution_options(yield_per=STATISTICS_BATCH_SIZE))
+        if report_format == "csv":
+            # 带BOM，Excel可直接识别中文姓名
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            writer.writerow(schemas.AttendanceStatistics.model_fields.keys())
+            yield "\ufeff" + buffer.getvalue()
+        for rows in result.partitions():
+            if report_format == "csv":
+                buffer = io.StringIO()
+                writer = csv.writer(buffer)
+                for row in rows:
+                    writer.writerow(_statistics_row(*row, total_days).model_dump().values())
+                yield buffer.getvalue()
+            else:
+                yield "".join(_statistics_row(*row, total_days).model_dump_json() + "\n" for row in rows)
+    finally:
+        db.close()
+
 @router.get("/statistics", response_model=schemas.AttendanceReport)
 def get_attendance_statistics(
     start_date: date,
     end_date: date,
     member_id: Optional[int] = None,
+    report_format: str = Query("json", alias="format", pattern="^(json|ndjson|csv)$"),
     db: Session = Depends(get_db)
 ):
-    """获取考勤统计报表"""
+    """获取考勤统计报表
+
+    format=json 返回完整报表；format=ndjson 或 csv 时逐行流式输出每个会员的统计，
+    适用于会员数量较多的导出。
+    """
     # 计算日期范围内的总天数
     total_days = (end_date - start_date).days + 1
+    query = _statistics_query(start_date, end_date, member_id)
     
-    # 构建查询
-    query = db.query(models.Member)
-    if member_id:
-        query = query.filter(models.Member.id == member_id)
-    
-    members = query.all()
-    statistics = []
-    
-    for member in members:
-        # 查询该会员在日期范围内的考勤记录
-        attendance_records = db.query(models.AttendanceRecord).filter(
-            models.AttendanceRecord.member_id == member.id,
-            models.AttendanceRecord.date >= start_date,
-            models.AttendanceRecord.date <= end_date
-        ).all()
-        
-        # 计算统计数据
-        present_days = len([r for r in attendance_records if r.check_in_time])
-        absent_days = total_days - present_days
-        
-        # 计算总工作时间（分钟）
-        total_minutes = sum([r.duration_minutes for r in attendance_records if r.duration_minutes])
-        total_hours = total_minutes / 60.0
-        average_hours = total_hours / present_days if present_days > 0 else 0
-        attendance_rate = (present_days / total_days) * 100 if total_days > 0 else 0
-        
-        statistics.append(schemas.AttendanceStatistics(
-            member_id=member.id,
-            member_name=member.name,
-            total_days=total_days,
-            present_days=present_days,
-            absent_days=absent_days,
-            total_hours=round(total_hours, 2),
-            average_hours=round(average_hours, 2),
-            attendance_rate=round(attendance_rate, 2)
-        ))
+    if report_format == "ndjson":
+        return StreamingResponse(
+            _stream_statistics(query, total_days, report_format),
+            media_type="application/x-ndjson"
+        )
+    if report_format == "csv":
+        return StreamingResponse(
+            _stream_statistics(query, total_days, report_format),
+            media_type="text/csv; charset=utf-8",
+            headers={"Content-Disposition": f"attachment; filename=attendance_{start_date}_{end_date}.csv"}
+        )
     
+    statistics = [_statistics_row(*row, total_days) for row in db.execute(query)]
     return schemas.AttendanceReport(
         start_date=start_date,
         end_date=end_date,
-        total_members=len(members),
+        total_members=len(statistics),
         statistics=statistics
     )
 
@@ -245,7 +268,10 @@ def get_member_today_attendance(member_id: int, db: Session = Depends(get_db)):
         }
     
     status_text = "not_checked_in"
-    if attendance_record.check_in_time and not attendance_record.check_out_time:
+    if attendance_record.status == "abnormal":
+        # 超时未签退，已被自动关闭
+        status_text = "auto_closed"
+    elif attendance_record.check_in_time and not attendance_record.check_out_time:
         status_text = "checked_in"
     elif attendance_record.check_in_time and attendance_record.check_out_time:
         status_text = "checked_out"
@@ -263,33 +289,11 @@ def get_member_today_attendance(member_id: int, db: Session = Depends(get_db)):
 @router.get("/daily-summary")
 def get_daily_attendance_summary(
     target_date: Optional[date] = None,
+    branch_id: Optional[int] = None,
     db: Session = Depends(get_db)
 ):
-    """获取每日考勤汇总"""
+    """获取每日考勤汇总，读取签到签退时维护的汇总表，可按分支过滤"""
     if not target_date:
         target_date = date.today()
     
-    # 获取当日所有考勤记录
-    records = db.query(models.AttendanceRecord).filter(
-        models.AttendanceRecord.date == target_date
-    ).all()
-    
-    # 统计数据
-    total_records = len(records)
-    checked_in = len([r for r in records if r.check_in_time])
-    checked_out = len([r for r in records if r.check_out_time])
-    still_in = checked_in - checked_out
-    
-    # 计算平均停留时间
-    completed_records = [r for r in records if r.duration_minutes]
-    average_duration = sum([r.duration_minutes for r in completed_records]) / len(completed_records) if completed_records else 0
-    
-    return {
-        "date": target_date,
-        "total_records": total_records,
-        "checked_in": checked_in,
-        "checked_out": checked_out,
-        "still_in": still_in,
-        "average_duration_minutes": round(average_duration, 2),
-        "average_duration_hours": round(average_duration / 60, 2)
-    } 
\ No newline at end of file
+    return get_daily_summary(db, target_date, branch_id)
@@ -39,6 +39,7 @@ def get_all_branches(
             manager=branch.manager,
             phone=branch.phone,
             status=branch.status,
+            auto_checkout_hours=branch.auto_checkout_hours,
             created_at=branch.created_at,
             updated_at=branch.updated_at,
             device_count=device_count,
@@ -66,7 +67,8 @@ def create_branch(branch: schemas.BranchCreate, db: Session = Depends(get_db)):
         address=branch.address,
         manager=branch.manager,
         phone=branch.phone,
-        status=branch.status
+        status=branch.status,
+        auto_checkout_hours=branch.auto_checkout_hours
     )
     db.add(db_branch)
     db.commit()
@@ -80,6 +82,7 @@ def create_branch(branch: schemas.BranchCreate, db: Session = Depends(get_db)):
         manager=db_branch.manager,
         phone=db_branch.phone,
         status=db_branch.status,
+        auto_checkout_hours=db_branch.auto_checkout_hours,
         created_at=db_branch.created_at,
         updated_at=db_branch.updated_at,
         device_count=0,
@@ -130,6 +133,7 @@ def get_branch(branch_id: int, db: Session = Depends(get_db)):
         "manager": branch.manager,
         "phone": branch.phone,
         "status": branch.status,
+        "auto_checkout_hours": branch.auto_checkout_hours,
         "created_at": branch.created_at,
         "updated_at": branch.updated_at,
         "device_count": len(device_list),
@@ -164,6 +168,7 @@ def update_branch(branch_id: int, branch: schemas.BranchUpdate, db: Session = De
     db_branch.manager = branch.manager
     db_branch.phone = branch.phone
     db_branch.status = branch.status
+    db_branch.auto_checkout_hours = branch.auto_checkout_hours
     db_branch.updated_at = datetime.now()
     
     db.commit()
@@ -181,6 +186,7 @@ def update_branch(branch_id: int, branch: schemas.BranchUpdate, db: Session = De
         manager=db_branch.manager,
         phone=db_branch.phone,
         status=db_branch.status,
+        auto_checkout_hours=db_branch.auto_checkout_hours,
         created_at=db_branch.created_at,
         updated_at=db_branch.updated_at,
         device_count=device_count,
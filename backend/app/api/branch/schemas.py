@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import Optional, List
 from datetime import datetime
 
@@ -9,6 +9,7 @@ class BranchBase(BaseModel):
     manager: Optional[str] = None
     phone: Optional[str] = None
     status: str = "active"
+    auto_checkout_hours: Optional[int] = Field(None, gt=0)  # 为空时使用全局设置
 
 class BranchCreate(BranchBase):
     pass
@@ -0,0 +1 @@
+# 会员卡API模块 
\ No newline at end of file
@@ -0,0 +1,211 @@
+from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy.orm import Session
+from typing import List, Optional
+from datetime import datetime
+import base64
+
+from app.database.database import get_db
+from app.models import models
+from app.api.card import schemas
+from app.services.card_index import card_index
+from app.services.index_sync import publish_change
+from app.services.fingerprint_matcher import template_gallery
+from app.services.stats_aggregator import live_stats
+
+router = APIRouter()
+
+@router.get("/", response_model=List[schemas.CardResponse])
+def get_cards(
+    member_id: Optional[int] = None,
+    status: Optional[str] = None,
+    skip: int = 0,
+    limit: int = 100,
+    db: Session = Depends(get_db)
+):
+    """获取会员卡列表，支持按会员和状态过滤"""
+    query = db.query(models.MemberCard)
+    if member_id:
+        query = query.filter(models.MemberCard.member_id == member_id)
+    if status:
+        query = query.filter(models.MemberCard.status == status)
+    return query.order_by(models.MemberCard.id).offset(skip).limit(limit).all()
+
+@router.post("/", response_model=schemas.CardResponse, status_code=status.HTTP_201_CREATED)
+def create_card(card: schemas.CardCreate, db: Session = Depends(get_db)):
+    """为会员发卡"""
+    member = db.query(models.Member).filter(models.Member.id == card.member_id).first()
+    if not member:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="会员不存在"
+        )
+
+    existing_card = db.query(models.MemberCard).filter(
+        models.MemberCard.card_number == card.card_number
+    ).first()
+    if existing_card:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="卡号已存在"
+        )
+
+    db_card = models.MemberCard(
+        member_id=card.member_id,
+        card_number=card.card_number,
+        status=card.status
+    )
+    db.add(db_card)
+    db.commit()
+    db.refresh(db_card)
+
+    card_index.upsert_card(db_card)
+    publish_change("card", db_card.id)
+    return db_card
+
+@router.put("/{card_id}", response_model=schemas.CardResponse)
+def update_card(card_id: int, card: schemas.CardUpdate, db: Session = Depends(get_db)):
+    """更新会员卡（换卡、挂失、停用）"""
+    db_card = db.query(models.MemberCard).filter(models.MemberCard.id == card_id).first()
+    if not db_card:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="会员卡不存在"
+        )
+
+    if card.member_id != db_card.member_id:
+        member = db.query(models.Member).filter(models.Member.id == card.member_id).first()
+        if not member:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="会员不存在"
+            )
+
+    if card.card_number != db_card.card_number:
+        existing_card = db.query(models.MemberCard).filter(
+            models.MemberCard.card_number == card.card_number
+        ).first()
+        if existing_card:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="卡号已存在"
+            )
+
+    db_card.member_id = card.member_id
+    db_card.card_number = card.card_number
+    db_card.status = card.status
+    db.commit()
+    db.refresh(db_card)
+
+    card_index.upsert_card(db_card)
+    publish_change("card", db_card.id)
+    return db_card
+
+@router.delete("/{card_id}", response_model=schemas.CardDeleteResponse)
+def delete_card(card_id: int, db: Session = Depends(get_db)):
+    """删除会员卡"""
+    db_card = db.query(models.MemberCard).filter(models.MemberCard.id == card_id).first()
+    if not db_card:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="会员卡不存在"
+        )
+
+    db.delete(db_card)
+    db.commit()
+
+    card_index.remove_card(card_id)
+    publish_change("card", card_id)
+    return schemas.CardDeleteResponse(success=True, message="会员卡删除成功")
+
+@router.post("/verify", response_model=schemas.CardVerifyResponse)
+def verify_card(request: schemas.CardVerifyRequest, db: Session = Depends(get_db)):
+    """刷卡验证接口
+
+    先按卡号在内存索引中定位会员；如同时提交了指纹模板，只与该会员自己的
+    指纹模板做1:1比对，比对开销与模板库规模无关。
+    """
+    device = db.query(models.Device).filter(models.Device.id == request.device_id).first()
+    if not device:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="设备不存在"
+        )
+
+    def fail(message: str, member_id: Optional[int] = None) -> schemas.CardVerifyResponse:
+        db_recognition_log = models.RecognitionLog(
+            member_id=member_id,
+            device_id=request.device_id,
+            status="failed",
+            confidence=0,
+            recognition_type="card"
+        )
+        db.add(db_recognition_log)
+        db.commit()
+        live_stats.record_recognition(
+            db_recognition_log.id, None, device.id, device.name,
+            "failed", 0, db_recognition_log.recognized_at
+        )
+        return schemas.CardVerifyResponse(success=False, message=message, timestamp=datetime.now())
+
+    card_index.ensure_loaded(db)
+    card = card_index.lookup(request.card_number)
+    if card is None:
+        return fail("卡片未登记")
+    _, member_id, card_status = card
+    if card_status == "lost":
+        return fail("卡片已挂失", member_id)
+    if card_status != "active":
+        return fail("卡片已停用", member_id)
+
+    member = db.query(models.Member).filter(models.Member.id == member_id).first()
+    if not member:
+        return fail("会员不存在")
+
+    confidence = None
+    template_id = None
+    verified_by = "card"
+    if request.template_data is not None:
+        try:
+            probe = base64.b64decode(request.template_data)
+        except ValueError:
+            probe = None
+        if not probe:
+            return fail("未采集到有效的指纹模板", member_id)
+
+        template_gallery.ensure_loaded(db)
+        if not template_gallery.member_template_ids(member_id):
+            return fail("该会员未录入指纹", member_id)
+        candidate = template_gallery.verify(probe, member_id)
+        if candidate is None:
+            return fail("指纹与卡片持有人不匹配", member_id)
+        confidence = candidate.confidence
+        template_id = candidate.template_id
+        verified_by = "card+fingerprint"
+
+    db_recognition_log = models.RecognitionLog(
+        member_id=member.id,
+        device_id=request.device_id,
+        status="success",
+        confidence=confidence,
+        recognition_type="card"
+    )
+    db.add(db_recognition_log)
+    db.commit()
+    live_stats.record_recognition(
+        db_recognition_log.id, member.name, device.id, device.name,
+        "success", confidence, db_recognition_log.recognized_at
+    )
+
+    return schemas.CardVerifyResponse(
+        success=True,
+        message="验证成功",
+        verified_by=verified_by,
+        member=schemas.VerifiedMember(
+            id=member.id,
+            name=member.name,
+            phone=member.phone,
+            confidence=confidence,
+            template_id=template_id
+        ),
+        timestamp=datetime.now()
+    )
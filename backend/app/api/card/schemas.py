@@ -0,0 +1,53 @@
+from pydantic import BaseModel, Field
+from typing import Optional
+from datetime import datetime
+
+class CardBase(BaseModel):
+    """会员卡基础模型"""
+    member_id: int = Field(..., description="会员ID")
+    card_number: str = Field(..., min_length=1, max_length=50, description="卡号")
+    status: str = Field("active", description="状态: active, lost, inactive")
+
+class CardCreate(CardBase):
+    """创建会员卡请求模型"""
+    pass
+
+class CardUpdate(CardBase):
+    """更新会员卡请求模型"""
+    pass
+
+class CardResponse(CardBase):
+    """会员卡响应模型"""
+    id: int
+    created_at: datetime
+    updated_at: datetime
+
+    class Config:
+        from_attributes = True
+
+class CardVerifyRequest(BaseModel):
+    """刷卡验证请求模型"""
+    device_id: int = Field(..., description="设备ID")
+    card_number: str = Field(..., description="卡号")
+    template_data: Optional[str] = Field(None, description="刷卡后采集的指纹模板，Base64编码；为空时仅验证卡片")
+
+class VerifiedMember(BaseModel):
+    """验证通过的会员信息"""
+    id: int
+    name: str
+    phone: str
+    confidence: Optional[int] = None
+    template_id: Optional[int] = None
+
+class CardVerifyResponse(BaseModel):
+    """刷卡验证响应模型"""
+    success: bool
+    message: str
+    verified_by: Optional[str] = None  # card, card+fingerprint
+    member: Optional[VerifiedMember] = None
+    timestamp: datetime = Field(default_factory=datetime.now)
+
+class CardDeleteResponse(BaseModel):
+    """删除会员卡响应模型"""
+    success: bool
+    message: str
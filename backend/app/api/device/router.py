@@ -1,31 +1,44 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Response, status
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from typing import List, Optional
 from datetime import datetime
-import requests
 import json
 
-from app.database.database import get_db
+from app.database.database import get_db, get_async_db
 from app.models import models
 from app.api.device import schemas
+from app.api.pagination import after_id, paginate, set_next_cursor
+from app.services.candidate_index import candidate_index
+from app.services.index_sync import publish_change
+from app.services.middleware_client import middleware_client
+from app.services.stats_aggregator import live_stats
 
 router = APIRouter()
 
 @router.get("/", response_model=List[schemas.DeviceResponse])
 def get_all_devices(
+    response: Response,
     skip: int = 0, 
     limit: int = 100, 
+    cursor: Optional[str] = None,
     status: Optional[str] = None,
     db: Session = Depends(get_db)
 ):
-    """获取所有设备列表，支持分页和状态过滤"""
+    """获取所有设备列表，支持分页和状态过滤
+
+    按ID升序排列，传入上一页响应头 X-Next-Cursor 中的游标获取下一页。
+    """
     query = db.query(models.Device)
     
     # 根据状态过滤
     if status:
         query = query.filter(models.Device.status == status)
     
-    devices = query.offset(skip).limit(limit).all()
+    query = after_id(query, models.Device.id, cursor)
+    devices = paginate(query, skip, limit, cursor).all()
+    set_next_cursor(response, devices, limit, lambda device: (device.id,))
     
     # 获取每个设备的指纹数量
     result = []
@@ -69,11 +82,15 @@ def create_device(device: schemas.DeviceCreate, db: Session = Depends(get_db)):
     db_device = models.Device(
         name=device.name,
         ip_address=device.ip_address,
-        port=device.port
+        port=device.port,
+        branch_id=device.branch_id
     )
     db.add(db_device)
     db.commit()
     db.refresh(db_device)
+    candidate_index.upsert_device(db_device)
+    publish_change("device", db_device.id)
+    live_stats.set_device(db_device.id, db_device.name, db_device.status == "online")
     
     return schemas.DeviceResponse(
         id=db_device.id,
@@ -141,10 +158,14 @@ def update_device(device_id: int, device: schemas.DeviceUpdate, db: Session = De
     db_device.name = device.name
     db_device.ip_address = device.ip_address
     db_device.port = device.port
+    db_device.branch_id = device.branch_id
     db_device.updated_at = datetime.now()
     
     db.commit()
     db.refresh(db_device)
+    candidate_index.upsert_device(db_device)
+    publish_change("device", db_device.id)
+    live_stats.set_device(db_device.id, db_device.name, db_device.status == "online")
     
     # 计算设备上的指纹数量
     fingerprint_count = db.query(models.FingerprintTemplate).join(
@@ -179,13 +200,16 @@ def delete_device(device_id: int, db: Session = Depends(get_db)):
     
     db.delete(db_device)
     db.commit()
+    candidate_index.remove_device(device_id)
+    publish_change("device", device_id)
+    live_stats.remove_device(device_id)
     
     return None
 
 @router.post("/connect", response_model=schemas.DeviceConnectResponse)
-async def connect_device(request: schemas.DeviceConnectRequest, db: Session = Depends(get_db)):
+async def connect_device(request: schemas.DeviceConnectRequest, db: AsyncSession = Depends(get_async_db)):
     """连接设备"""
-    device = db.query(models.Device).filter(models.Device.id == request.device_id).first()
+    device = await db.get(models.Device, request.device_id)
     if not device:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -193,37 +217,27 @@ async def connect_device(request: schemas.DeviceConnectRequest, db: Session = De
         )
     
     try:
-        # 这里应该调用中间件服务来连接设备
-        # 模拟调用中间件服务
-        middleware_url = "http://localhost:9000/api/device/connect"
-        payload = {
-            "ip": device.ip_address,
-            "port": device.port
-        }
-        
-        # 在实际项目中，这里应该是真实的HTTP请求
-        # response = requests.post(middleware_url, json=payload)
-        # if response.status_code == 200:
-        #     result = response.json()
+        # 调用中间件服务连接设备
+        result = await middleware_client.connect_device(device.ip_address, device.port)
         
-        # 模拟成功响应
-        result = {"success": True, "message": "设备连接成功"}
-        
-        if result["success"]:
+        if result.get("success"):
             # 更新设备状态
             device.status = "online"
             device.last_heartbeat = datetime.now()
-            db.commit()
-            db.refresh(device)
+            await db.commit()
+            await db.refresh(device)
+            live_stats.set_device(device.id, device.name, True)
             
             # 计算设备上的指纹数量
-            fingerprint_count = db.query(models.FingerprintTemplate).join(
-                models.EnrollmentLog,
-                models.EnrollmentLog.member_id == models.FingerprintTemplate.member_id
-            ).filter(
-                models.EnrollmentLog.device_id == device.id,
-                models.EnrollmentLog.status == "success"
-            ).count()
+            fingerprint_count = await db.scalar(
+                select(func.count()).select_from(models.FingerprintTemplate).join(
+                    models.EnrollmentLog,
+                    models.EnrollmentLog.member_id == models.FingerprintTemplate.member_id
+                ).where(
+                    models.EnrollmentLog.device_id == device.id,
+                    models.EnrollmentLog.status == "success"
+                )
+            )
             
             return schemas.DeviceConnectResponse(
                 success=True,
@@ -253,9 +267,9 @@ async def connect_device(request: schemas.DeviceConnectRequest, db: Session = De
         )
 
 @router.post("/sync", response_model=schemas.DeviceSyncResponse)
-async def sync_device(request: schemas.DeviceSyncRequest, db: Session = Depends(get_db)):
+async def sync_device(request: schemas.DeviceSyncRequest, db: AsyncSession = Depends(get_async_db)):
     """同步设备数据"""
-    device = db.query(models.Device).filter(models.Device.id == request.device_id).first()
+    device = await db.get(models.Device, request.device_id)
     if not device:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -269,26 +283,14 @@ async def sync_device(request: schemas.DeviceSyncRequest, db: Session = Depends(
         )
     
     try:
-        # 这里应该调用中间件服务来同步设备数据
-        # 模拟调用中间件服务
-        middleware_url = "http://localhost:9000/api/device/sync"
-        payload = {
-            "device_id": device.id
-        }
-        
-        # 在实际项目中，这里应该是真实的HTTP请求
-        # response = requests.post(middleware_url, json=payload)
-        # if response.status_code == 200:
-        #     result = response.json()
+        # 调用中间件服务同步设备数据
+        result = await middleware_client.sync_device(device.ip_address, device.port)
         
-        # 模拟成功响应
-        result = {"success": True, "message": "数据同步成功", "fingerprint_count": 10}
-        
-        if result["success"]:
+        if result.get("success"):
             return schemas.DeviceSyncResponse(
                 success=True,
                 message="数据同步成功",
-                fingerprint_count=result.get("fingerprint_count", 0)
+                fingerprint_count=result.get("fingerprintCount", 0)
             )
         else:
             return schemas.DeviceSyncResponse(
@@ -301,3 +303,8 @@ async def sync_device(request: schemas.DeviceSyncRequest, db: Session = Depends(
             success=False,
             message=f"数据同步失败: {str(e)}"
         )
+
+@router.get("/middleware/stats")
+def get_middleware_stats():
+    """获取中间件客户端的调用统计和熔断状态"""
+    return middleware_client.stats()
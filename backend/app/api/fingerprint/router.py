@@ -1,263 +1,84 @@
-from fastapi import APIRouter, Depends, HTTPException, status, WebSocket
+from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from typing import List, Optional
-from datetime import datetime
-import base64
-import json
+from typing import List
 
-from app.database.database import get_db
+from app.database.database import get_db, get_async_db
 from app.models import models
 from app.api.fingerprint import schemas
-from app.websocket.connection_manager import ConnectionManager
+from app.services.fingerprint_matcher import template_gallery
+from app.services.candidate_index import candidate_index
+from app.services.fingerprint_service import recognize_fingerprint as recognize_probe
+from app.services.index_sync import publish_change
+from app.services.job_engine import job_engine, DeviceBusyError, DeviceLockError, JobQueueFullError
 
 router = APIRouter()
-manager = ConnectionManager()
 
-@router.post("/enroll", response_model=schemas.FingerprintEnrollResponse)
-async def enroll_fingerprint(
-    request: schemas.FingerprintEnrollRequest, 
-    db: Session = Depends(get_db)
-):
-    """指纹录入接口"""
-    # 检查会员是否存在
-    member = db.query(models.Member).filter(models.Member.id == request.member_id).first()
-    if not member:
+async def _run_device_job(kind: str, request):
+    """在设备任务队列中执行，与同一设备上的其他采集依次进行"""
+    try:
+        job = job_engine.submit(kind, request.device_id, request)
+    except JobQueueFullError as e:
         raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="会员不存在"
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=str(e)
         )
-    
-    # 检查设备是否存在
-    device = db.query(models.Device).filter(models.Device.id == request.device_id).first()
-    if not device:
+    try:
+        return await job.result()
+    except LookupError as e:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
-            detail="设备不存在"
-        )
-    
-    # 检查设备是否在线
-    if device.status != "online":
-        return schemas.FingerprintEnrollResponse(
-            success=False,
-            message="设备离线，无法录入指纹"
-        )
-    
-    # 检查该手指是否已经录入过指纹
-    existing_template = db.query(models.FingerprintTemplate).filter(
-        models.FingerprintTemplate.member_id == request.member_id,
-        models.FingerprintTemplate.finger_index == request.finger_index
-    ).first()
-    
-    if existing_template:
-        return schemas.FingerprintEnrollResponse(
-            success=False,
-            message=f"该手指(索引: {request.finger_index})已录入指纹，请先删除"
-        )
-    
-    try:
-        # 这里应该调用中间件服务来进行指纹录入
-        # 模拟调用中间件服务
-        middleware_url = "http://localhost:9000/api/fingerprint/enroll"
-        payload = {
-            "device_id": device.id,
-            "finger_index": request.finger_index
-        }
-        
-        # 在实际项目中，这里应该是真实的HTTP请求
-        # response = requests.post(middleware_url, json=payload)
-        # if response.status_code == 200:
-        #     result = response.json()
-        
-        # 模拟成功响应
-        # 在实际项目中，这里应该是从中间件获取的指纹模板数据
-        template_data = b"SIMULATED_FINGERPRINT_TEMPLATE_DATA"
-        
-        # 创建指纹模板记录
-        db_template = models.FingerprintTemplate(
-            member_id=request.member_id,
-            template_data=template_data,
-            finger_index=request.finger_index
+            detail=str(e)
         )
-        db.add(db_template)
-        
-        # 创建录入记录
-        db_enrollment_log = models.EnrollmentLog(
-            member_id=request.member_id,
-            device_id=request.device_id,
-            status="success",
-            finger_index=request.finger_index
-        )
-        db.add(db_enrollment_log)
-        
-        db.commit()
-        db.refresh(db_template)
-        
-        # 通过WebSocket广播录入成功消息
-        await manager.broadcast({
-            "type": "enrollment_status",
-            "success": True,
-            "message": "指纹录入成功",
-            "member_id": request.member_id,
-            "finger_index": request.finger_index
-        })
-        
-        return schemas.FingerprintEnrollResponse(
-            success=True,
-            message="指纹录入成功",
-            template_id=db_template.id
+    except DeviceBusyError as e:
+        # 设备一直被其他服务进程占用
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=str(e)
         )
-    
-    except Exception as e:
-        # 创建录入失败记录
-        db_enrollment_log = models.EnrollmentLog(
-            member_id=request.member_id,
-            device_id=request.device_id,
-            status="failed",
-            finger_index=request.finger_index
+    except DeviceLockError as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=str(e)
         )
-        db.add(db_enrollment_log)
-        db.commit()
-        
-        # 通过WebSocket广播录入失败消息
-        await manager.broadcast({
-            "type": "enrollment_status",
-            "success": False,
-            "message": f"指纹录入失败: {str(e)}",
-            "member_id": request.member_id,
-            "finger_index": request.finger_index
-        })
-        
-        return schemas.FingerprintEnrollResponse(
-            success=False,
-            message=f"指纹录入失败: {str(e)}"
+    except SQLAlchemyError:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="数据库暂不可用，请稍后重试"
         )
 
+@router.post("/enroll", response_model=schemas.FingerprintEnrollResponse)
+async def enroll_fingerprint(request: schemas.FingerprintEnrollRequest):
+    """指纹录入接口"""
+    return await _run_device_job("enrollment", request)
+
 @router.post("/recognize", response_model=schemas.FingerprintRecognitionResponse)
 async def recognize_fingerprint(
     request: schemas.FingerprintRecognitionRequest, 
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """指纹识别接口"""
-    # 检查设备是否存在
-    device = db.query(models.Device).filter(models.Device.id == request.device_id).first()
-    if not device:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="设备不存在"
-        )
-    
-    # 检查设备是否在线
-    if device.status != "online":
-        return schemas.FingerprintRecognitionResponse(
-            success=False,
-            message="设备离线，无法识别指纹",
-            timestamp=datetime.now()
-        )
+    if not request.template_data:
+        # 需要在设备上采集，排入设备任务队列
+        return await _run_device_job("recognition", request)
     
+    # 已携带探针模板，无需占用设备，直接比对
     try:
-        # 这里应该调用中间件服务来进行指纹识别
-        # 模拟调用中间件服务
-        middleware_url = "http://localhost:9000/api/fingerprint/recognize"
-        payload = {
-            "device_id": device.id
-        }
-        
-        # 在实际项目中，这里应该是真实的HTTP请求
-        # response = requests.post(middleware_url, json=payload)
-        # if response.status_code == 200:
-        #     result = response.json()
-        
-        # 模拟成功响应
-        # 在实际项目中，这里应该是从中间件获取的识别结果
-        # 随机选择一个会员作为识别结果
-        member = db.query(models.Member).first()
-        
-        if member:
-            # 创建识别成功记录
-            db_recognition_log = models.RecognitionLog(
-                member_id=member.id,
-                device_id=request.device_id,
-                status="success",
-                confidence=85  # 模拟置信度
-            )
-            db.add(db_recognition_log)
-            db.commit()
-            
-            # 通过WebSocket广播识别成功消息
-            await manager.broadcast({
-                "type": "recognition_status",
-                "success": True,
-                "message": "指纹识别成功",
-                "member": {
-                    "id": member.id,
-                    "name": member.name,
-                    "phone": member.phone
-                },
-                "confidence": 85,
-                "timestamp": datetime.now().isoformat()
-            })
-            
-            return schemas.FingerprintRecognitionResponse(
-                success=True,
-                message="指纹识别成功",
-                member=schemas.RecognizedMember(
-                    id=member.id,
-                    name=member.name,
-                    phone=member.phone,
-                    confidence=85
-                ),
-                timestamp=datetime.now()
-            )
-        else:
-            # 创建识别失败记录
-            db_recognition_log = models.RecognitionLog(
-                member_id=None,
-                device_id=request.device_id,
-                status="failed",
-                confidence=0
-            )
-            db.add(db_recognition_log)
-            db.commit()
-            
-            # 通过WebSocket广播识别失败消息
-            await manager.broadcast({
-                "type": "recognition_status",
-                "success": False,
-                "message": "未找到匹配的指纹",
-                "timestamp": datetime.now().isoformat()
-            })
-            
-            return schemas.FingerprintRecognitionResponse(
-                success=False,
-                message="未找到匹配的指纹",
-                timestamp=datetime.now()
-            )
-    
-    except Exception as e:
-        # 创建识别失败记录
-        db_recognition_log = models.RecognitionLog(
-            member_id=None,
-            device_id=request.device_id,
-            status="failed",
-            confidence=0
-        )
-        db.add(db_recognition_log)
-        db.commit()
-        
-        # 通过WebSocket广播识别失败消息
-        await manager.broadcast({
-            "type": "recognition_status",
-            "success": False,
-            "message": f"指纹识别失败: {str(e)}",
-            "timestamp": datetime.now().isoformat()
-        })
-        
-        return schemas.FingerprintRecognitionResponse(
-            success=False,
-            message=f"指纹识别失败: {str(e)}",
-            timestamp=datetime.now()
+        return await recognize_probe(db, request)
+    except LookupError as e:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=str(e)
         )
 
+@router.get("/matcher/stats")
+def get_matcher_stats():
+    """获取指纹模板库规模、内存占用和比对耗时"""
+    stats = template_gallery.stats()
+    stats["candidate_index"] = candidate_index.stats()
+    return stats
+
 @router.get("/templates/{member_id}", response_model=List[schemas.FingerprintTemplateResponse])
 def get_member_fingerprints(member_id: int, db: Session = Depends(get_db)):
     """获取会员的所有指纹模板"""
@@ -293,6 +114,8 @@ def delete_fingerprint(template_id: int, db: Session = Depends(get_db)):
     # 删除指纹模板
     db.delete(template)
     db.commit()
+    template_gallery.remove(template_id)
+    publish_change("template", template_id)
     
     return schemas.FingerprintDeleteResponse(
         success=True,
@@ -17,6 +17,7 @@ class FingerprintEnrollResponse(BaseModel):
 class FingerprintRecognitionRequest(BaseModel):
     """指纹识别请求模型"""
     device_id: int = Field(..., description="设备ID")
+    template_data: Optional[str] = Field(None, description="待识别的指纹模板，Base64编码；为空时由中间件在设备上采集")
 
 class RecognizedMember(BaseModel):
     """识别到的会员信息"""
@@ -24,6 +25,7 @@ class RecognizedMember(BaseModel):
     name: str
     phone: str
     confidence: int
+    template_id: Optional[int] = None
 
 class FingerprintRecognitionResponse(BaseModel):
     """指纹识别响应模型"""
@@ -1,4 +1,5 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Response, status
+from sqlalchemy import func, select
 from sqlalchemy.orm import Session
 from typing import List, Optional
 from datetime import datetime
@@ -6,19 +7,48 @@ from datetime import datetime
 from app.database.database import get_db
 from app.models import models
 from app.api.member import schemas
+from app.api.pagination import after_id, paginate, set_next_cursor
+from app.services.access_index import permission_index
+from app.services.fingerprint_matcher import template_gallery
+from app.services.candidate_index import candidate_index
+from app.services.card_index import card_index
+from app.services.index_sync import publish_change
 
 router = APIRouter()
 
+def _member_summary_columns():
+    """会员的指纹数量和最后成功识别时间，作为关联子查询随会员一起查出"""
+    fingerprint_count = select(
+        func.count(models.FingerprintTemplate.id)
+    ).where(
+        models.FingerprintTemplate.member_id == models.Member.id
+    ).correlate(models.Member).scalar_subquery()
+    
+    last_recognition = select(
+        func.max(models.RecognitionLog.recognized_at)
+    ).where(
+        models.RecognitionLog.member_id == models.Member.id,
+        models.RecognitionLog.status == "success"
+    ).correlate(models.Member).scalar_subquery()
+    
+    return fingerprint_count.label("fingerprint_count"), last_recognition.label("last_recognition")
+
 @router.get("/", response_model=List[schemas.MemberResponse])
 def get_all_members(
+    response: Response,
     skip: int = 0, 
     limit: int = 100, 
+    cursor: Optional[str] = None,
     status: Optional[str] = None, 
     search: Optional[str] = None,
     db: Session = Depends(get_db)
 ):
-    """获取所有会员列表，支持分页、状态过滤和搜索"""
-    query = db.query(models.Member)
+    """获取所有会员列表，支持分页、状态过滤和搜索
+
+    按ID升序排列，传入上一页响应头 X-Next-Cursor 中的游标获取下一页。
+    """
+    # 指纹数量和最后识别时间与会员在同一条语句中查出，每页只执行一次查询
+    query = db.query(models.Member, *_member_summary_columns())
     
     # 根据状态过滤
     if status:
@@ -33,22 +63,12 @@ def get_all_members(
             (models.Member.email.like(search_term))
         )
     
-    members = query.offset(skip).limit(limit).all()
+    query = after_id(query, models.Member.id, cursor)
+    rows = paginate(query, skip, limit, cursor).all()
+    set_next_cursor(response, rows, limit, lambda row: (row[0].id,))
     
-    # 获取每个会员的指纹数量和最后识别时间
     result = []
-    for member in members:
-        # 指纹数量
-        fingerprint_count = db.query(models.FingerprintTemplate).filter(
-            models.FingerprintTemplate.member_id == member.id
-        ).count()
-        
-        # 最后识别时间
-        last_recognition = db.query(models.RecognitionLog).filter(
-            models.RecognitionLog.member_id == member.id,
-            models.RecognitionLog.status == "success"
-        ).order_by(models.RecognitionLog.recognized_at.desc()).first()
-        
+    for member, fingerprint_count, last_recognition in rows:
         member_data = schemas.MemberResponse(
             id=member.id,
             name=member.name,
@@ -58,7 +78,7 @@ def get_all_members(
             created_at=member.created_at,
             updated_at=member.updated_at,
             fingerprint_count=fingerprint_count,
-            last_recognition=last_recognition.recognized_at if last_recognition else None
+            last_recognition=last_recognition
         )
         result.append(member_data)
     
@@ -80,11 +100,15 @@ def create_member(member: schemas.MemberCreate, db: Session = Depends(get_db)):
         name=member.name,
         phone=member.phone,
         email=member.email,
+        branch_id=member.branch_id,
         status=member.status
     )
     db.add(db_member)
     db.commit()
     db.refresh(db_member)
+    permission_index.upsert_member(db_member)
+    candidate_index.upsert_member(db_member)
+    publish_change("member", db_member.id)
     
     return schemas.MemberResponse(
         id=db_member.id,
@@ -180,11 +204,15 @@ def update_member(member_id: int, member: schemas.MemberUpdate, db: Session = De
     db_member.name = member.name
     db_member.phone = member.phone
     db_member.email = member.email
+    db_member.branch_id = member.branch_id
     db_member.status = member.status
     db_member.updated_at = datetime.now()
     
     db.commit()
     db.refresh(db_member)
+    permission_index.upsert_member(db_member)
+    candidate_index.upsert_member(db_member)
+    publish_change("member", db_member.id)
     
     # 获取指纹数量和最后识别时间
     fingerprint_count = db.query(models.FingerprintTemplate).filter(
@@ -218,7 +246,15 @@ def delete_member(member_id: int, db: Session = Depends(get_db)):
             detail="会员不存在"
         )
     
+    # 会员的指纹模板随会员一起删除
+    template_ids = [fp.id for fp in db_member.fingerprints]
+    
     db.delete(db_member)
     db.commit()
+    permission_index.remove_member(member_id)
+    candidate_index.remove_member(member_id)
+    card_index.remove_member(member_id)
+    template_gallery.remove(*template_ids)
+    publish_change("member", member_id)
     
     return None
@@ -0,0 +1,66 @@
+from fastapi import HTTPException, Response, status
+from sqlalchemy import and_, or_
+from datetime import date, datetime
+from typing import Any, Callable, List, Optional
+import base64
+import json
+
+# 下一页游标通过响应头返回，列表接口的响应体仍是数组
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def encode_cursor(*values: Any) -> str:
+    """把排序键编码为不透明的游标"""
+    encoded = [value.isoformat() if isinstance(value, (date, datetime)) else value for value in values]
+    return base64.urlsafe_b64encode(json.dumps(encoded).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, *types: type) -> List[Any]:
+    """解析游标，types 为各排序键的类型，游标无效时返回400"""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        if not isinstance(values, list) or len(values) != len(types):
+            raise ValueError(cursor)
+        return [
+            value_type.fromisoformat(value) if value_type in (date, datetime) else value_type(value)
+            for value, value_type in zip(values, types)
+        ]
+    except (ValueError, TypeError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="无效的分页游标"
+        )
+
+
+def after_id(query, id_column, cursor: Optional[str]):
+    """按ID升序分页：取游标之后的一页"""
+    query = query.order_by(id_column)
+    if cursor:
+        (last_id,) = decode_cursor(cursor, int)
+        query = query.filter(id_column > last_id)
+    return query
+
+
+def before_time(query, time_column, id_column, time_type: type, cursor: Optional[str]):
+    """按 (时间, ID) 倒序分页：取游标之前的一页，ID 区分同一时间的多条记录"""
+    query = query.order_by(time_column.desc(), id_column.desc())
+    if cursor:
+        last_time, last_id = decode_cursor(cursor, time_type, int)
+        query = query.filter(or_(
+            time_column < last_time,
+            and_(time_column == last_time, id_column < last_id)
+        ))
+    return query
+
+
+def paginate(query, skip: int, limit: int, cursor: Optional[str]):
+    """取一页：传入游标时按游标定位，忽略 skip，否则按 skip 偏移"""
+    if not cursor:
+        query = query.offset(skip)
+    return query.limit(limit)
+
+
+def set_next_cursor(response: Response, rows: list, limit: int, key: Callable[[Any], tuple]):
+    """本页已满时在响应头中返回下一页游标，key 取出一行记录的排序键"""
+    if rows and len(rows) >= limit:
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(*key(rows[-1]))
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Boolean, LargeBinary, Text, Date, Time
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Boolean, LargeBinary, Text, Date, Time, Index, UniqueConstraint
 from sqlalchemy.orm import relationship
 from datetime import datetime, date
 from app.database.database import Base
@@ -14,6 +14,7 @@ class Branch(Base):
     manager = Column(String(100), nullable=True)
     phone = Column(String(20), nullable=True)
     status = Column(String(20), default="active")  # active, inactive
+    auto_checkout_hours = Column(Integer, nullable=True)  # 签到超过该小时数未签退时自动关闭，为空时使用全局设置
     created_at = Column(DateTime, default=datetime.now)
     updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
 
@@ -45,6 +46,7 @@ class Member(Base):
     access_controls = relationship("AccessControl", back_populates="member")
     attendance_records = relationship("AttendanceRecord", back_populates="member")
     access_permissions = relationship("AccessPermission", back_populates="member")
+    cards = relationship("MemberCard", back_populates="member", cascade="all, delete-orphan")
 
 class Device(Base):
     """设备表"""
@@ -87,6 +89,12 @@ class FingerprintTemplate(Base):
 class RecognitionLog(Base):
     """识别记录表"""
     __tablename__ = "recognition_logs"
+    __table_args__ = (
+        # 仪表板按时间范围统计成功率，(时间, 状态) 覆盖索引避免回表
+        Index("idx_recognition_logs_recognized_at_status", "recognized_at", "status"),
+        # 会员列表按会员查最后一次成功识别时间
+        Index("idx_recognition_logs_member_status_time", "member_id", "status", "recognized_at"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     member_id = Column(Integer, ForeignKey("members.id"), nullable=True)  # 可能识别失败，没有对应会员
@@ -118,6 +126,10 @@ class EnrollmentLog(Base):
 class AccessControl(Base):
     """访问控制记录表"""
     __tablename__ = "access_controls"
+    __table_args__ = (
+        # 访问日志按 (时间, ID) 倒序游标分页
+        Index("idx_access_controls_access_time_id", "access_time", "id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     member_id = Column(Integer, ForeignKey("members.id"), nullable=True)
@@ -135,6 +147,14 @@ class AccessControl(Base):
 class AttendanceRecord(Base):
     """考勤记录表"""
     __tablename__ = "attendance_records"
+    __table_args__ = (
+        # 考勤记录按 (日期, ID) 倒序游标分页
+        Index("idx_attendance_records_date_id", "date", "id"),
+        # 每个会员每天只有一条考勤记录，签到签退依赖该唯一索引保证原子性
+        Index("uq_attendance_records_member_date", "member_id", "date", unique=True),
+        # 自动签退按 (状态, 签到时间) 范围扫描未签退的记录
+        Index("idx_attendance_records_status_check_in", "status", "check_in_time"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     member_id = Column(Integer, ForeignKey("members.id"))
@@ -169,6 +189,66 @@ class AccessPermission(Base):
     # 关系
     member = relationship("Member", back_populates="access_permissions")
 
+class MemberCard(Base):
+    """会员卡表"""
+    __tablename__ = "member_cards"
+
+    id = Column(Integer, primary_key=True, index=True)
+    member_id = Column(Integer, ForeignKey("members.id"), nullable=False)
+    card_number = Column(String(50), nullable=False, unique=True, index=True)  # 卡号
+    status = Column(String(20), default="active")  # active, lost, inactive
+    created_at = Column(DateTime, default=datetime.now)
+    updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
+
+    # 关系
+    member = relationship("Member", back_populates="cards")
+
+class LogRollup(Base):
+    """识别/访问日志时间序列汇总表"""
+    __tablename__ = "log_rollups"
+    __table_args__ = (
+        UniqueConstraint(
+            "source", "granularity", "bucket_start", "device_id", "branch_id", "status",
+            name="uq_log_rollups_bucket"
+        ),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    source = Column(String(20), nullable=False)  # recognition, access
+    granularity = Column(String(10), nullable=False)  # minute, hour, day
+    bucket_start = Column(DateTime, nullable=False)  # 时间桶起点
+    device_id = Column(Integer, nullable=False, default=0)
+    branch_id = Column(Integer, nullable=False, default=0)  # 设备未分配分支时为0
+    status = Column(String(20), nullable=False)  # success, failed / allowed, denied
+    count = Column(Integer, nullable=False, default=0)
+
+class ProcessingCheckpoint(Base):
+    """后台处理任务的进度水位线"""
+    __tablename__ = "processing_checkpoints"
+
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String(50), nullable=False, unique=True)  # 任务名称
+    last_id = Column(Integer, nullable=False, default=0)  # 已处理的最大源记录ID
+    updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
+
+class AttendanceDailySummary(Base):
+    """考勤按天、按分支汇总表，签到签退时增量更新"""
+    __tablename__ = "attendance_daily_summaries"
+    __table_args__ = (
+        UniqueConstraint("date", "branch_id", name="uq_attendance_daily_summaries_date_branch"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    date = Column(Date, nullable=False)
+    branch_id = Column(Integer, nullable=False, default=0)  # 设备未分配分支时为0
+    total_records = Column(Integer, nullable=False, default=0)  # 考勤记录数
+    checked_in = Column(Integer, nullable=False, default=0)  # 已签到人数
+    checked_out = Column(Integer, nullable=False, default=0)  # 已签退人数
+    completed = Column(Integer, nullable=False, default=0)  # 停留时间大于0的记录数
+    total_duration_minutes = Column(Integer, nullable=False, default=0)  # 停留时间合计（分钟）
+    auto_closed = Column(Integer, nullable=False, default=0)  # 超时未签退被自动关闭的记录数
+    updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
+
 class User(Base):
     """系统用户表"""
     __tablename__ = "users"
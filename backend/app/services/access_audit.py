@@ -0,0 +1,278 @@
+from collections import deque
+from datetime import datetime
+from sqlalchemy.exc import DBAPIError, OperationalError
+from typing import Deque, Dict, List, Optional
+import glob
+import json
+import os
+import threading
+import time
+import uuid
+
+from app.database.database import engine
+from app.models import models
+
+# 单次批量写入的最大行数
+AUDIT_BATCH_SIZE = int(os.getenv("ACCESS_AUDIT_BATCH_SIZE", "200"))
+# 攒批的最长等待时间（秒）
+AUDIT_FLUSH_INTERVAL = float(os.getenv("ACCESS_AUDIT_FLUSH_INTERVAL", "0.2"))
+# 写入失败后的重试间隔（秒）
+AUDIT_RETRY_INTERVAL = 1.0
+# 队列中最多积压的行数，数据库长时间不可用时超出的新日志被丢弃并计数
+AUDIT_MAX_QUEUE = int(os.getenv("ACCESS_AUDIT_MAX_QUEUE", "100000"))
+# 停止时未能写入的日志暂存到该目录，下次启动时重新入队；逐行重试仍被拒绝的行也记录在这里
+AUDIT_SPOOL_DIR = os.getenv(
+    "ACCESS_AUDIT_SPOOL_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "data")
+)
+# 每个进程停止时写出自己的暂存文件：access_audit.spool.<pid>.<随机串>.jsonl
+SPOOL_PREFIX = "access_audit.spool"
+DEAD_LETTER_FILE = "access_audit.dead.jsonl"
+
+
+class AccessAuditWriter:
+    """访问控制日志的后写队列
+
+    门禁判定只把日志行放入内存队列，由后台线程按数量或时间窗口攒批，
+    以一条多行 INSERT 语句写入 access_controls 表，使判定响应不再等待事务提交。
+
+    整批写入被拒绝（例如某行的设备已删除）时逐行重试，仍失败的行记入死信文件，
+    不会阻塞后续日志；连接类错误则整批放回队首稍后重试。队列有上限，超出时丢弃新日志
+    并计数；停止时仍未写入的日志暂存到文件，下次启动时重新入队。
+    """
+
+    def __init__(
+        self,
+        batch_size: int = AUDIT_BATCH_SIZE,
+        flush_interval: float = AUDIT_FLUSH_INTERVAL,
+        max_queue: int = AUDIT_MAX_QUEUE,
+        spool_dir: str = AUDIT_SPOOL_DIR
+    ):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_queue = max_queue
+        self.spool_dir = spool_dir
+        self._queue: Deque[Dict] = deque()
+        self._cond = threading.Condition()
+        # 后台线程、同步写入和停止时的写入可能同时调用 flush
+        self._flush_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = False
+        # 统计信息
+        self.written_rows = 0
+        self.flush_count = 0
+        self.failed_flushes = 0
+        self.dropped_rows = 0
+        self.dead_letter_rows = 0
+        self.spooled_rows = 0
+        self.last_flush_at: Optional[datetime] = None
+
+    def enqueue(self, row: Dict):
+        """加入一条日志行"""
+        self.enqueue_many([row])
+
+    def enqueue_many(self, rows: List[Dict]):
+        """加入多条日志行，同一批次的行会在同一条语句中写入"""
+        if not rows:
+            return
+        for row in rows:
+            # 访问时间以判定时刻为准，而不是写入时刻
+            row.setdefault("access_time", datetime.now())
+        with self._cond:
+            room = self.max_queue - len(self._queue)
+            if room < len(rows):
+                # 积压已满：保留较早的日志，丢弃本次超出的部分
+                dropped = len(rows) - max(room, 0)
+                if not self.dropped_rows:
+                    print(f"访问日志队列已满（{self.max_queue} 行），开始丢弃新日志")
+                self.dropped_rows += dropped
+                rows = rows[:max(room, 0)]
+            self._queue.extend(rows)
+            if len(self._queue) >= self.batch_size:
+                self._cond.notify()
+        if self._thread is None:
+            # 后台线程未启动（例如脚本中直接调用）时同步写入
+            self.flush()
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._queue)
+
+    def start(self):
+        """启动后台写入线程"""
+        if self._thread is not None:
+            return
+        self._stopping = False
+        self._restore_spool()
+        self._thread = threading.Thread(target=self._run, name="access-audit-writer", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """停止后台线程，并写入队列中剩余的全部日志"""
+        thread = self._thread
+        if thread is None:
+            return
+        with self._cond:
+            self._stopping = True
+            self._cond.notify()
+        thread.join()
+        self._thread = None
+        if not self.flush():
+            self._write_spool()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if not self._stopping and len(self._queue) < self.batch_size:
+                    self._cond.wait(self.flush_interval)
+                if self._stopping:
+                    return
+            if not self.flush():
+                time.sleep(AUDIT_RETRY_INTERVAL)
+
+    def _take_batch(self) -> List[Dict]:
+        with self._cond:
+            count = min(self.batch_size, len(self._queue))
+            return [self._queue.popleft() for _ in range(count)]
+
+    def flush(self) -> bool:
+        """写入当前队列中的日志，数据库不可用时把未写入的行放回队首并返回False"""
+        with self._flush_lock:
+            while True:
+                batch = self._take_batch()
+                if not batch:
+                    return True
+                try:
+                    self._insert(batch)
+                except Exception as e:
+                    if self._is_unavailable(e):
+                        print(f"写入访问控制日志失败: {e}")
+                        self.failed_flushes += 1
+                        self._requeue(batch)
+                        return False
+                    # 批次中有被拒绝的行，逐行写入以隔离坏行
+                    remaining = self._insert_rows(batch)
+                    if remaining:
+                        self.failed_flushes += 1
+                        self._requeue(remaining)
+                        return False
+                else:
+                    self.written_rows += len(batch)
+                self.flush_count += 1
+                self.last_flush_at = datetime.now()
+
+    @staticmethod
+    def _insert(rows: List[Dict]):
+        with engine.begin() as conn:
+            conn.execute(models.AccessControl.__table__.insert(), rows)
+
+    @staticmethod
+    def _is_unavailable(error: Exception) -> bool:
+        """连接断开、超时等与数据无关的错误，整批稍后重试"""
+        return isinstance(error, OperationalError) or (
+            isinstance(error, DBAPIError) and error.connection_invalidated
+        )
+
+    def _insert_rows(self, rows: List[Dict]) -> List[Dict]:
+        """逐行写入，被拒绝的行记入死信文件；数据库不可用时返回尚未处理的行"""
+        for position, row in enumerate(rows):
+            try:
+                self._insert([row])
+            except Exception as e:
+                if self._is_unavailable(e):
+                    print(f"写入访问控制日志失败: {e}")
+                    return rows[position:]
+                print(f"访问控制日志被拒绝，已记入死信文件: {e}")
+                self._append_file(DEAD_LETTER_FILE, [row])
+                self.dead_letter_rows += 1
+            else:
+                self.written_rows += 1
+        return []
+
+    def _requeue(self, rows: List[Dict]):
+        with self._cond:
+            self._queue.extendleft(reversed(rows))
+
+    def _append_file(self, name: str, rows: List[Dict]):
+        os.makedirs(self.spool_dir, exist_ok=True)
+        with open(os.path.join(self.spool_dir, name), "a", encoding="utf-8") as f:
+            for row in rows:
+                f.write(json.dumps(row, ensure_ascii=False, default=datetime.isoformat) + "\n")
+
+    def _write_spool(self):
+        """停止时把仍未写入的日志暂存到文件"""
+        rows = self._take_all()
+        if not rows:
+            return
+        os.makedirs(self.spool_dir, exist_ok=True)
+        path = os.path.join(self.spool_dir, f"{SPOOL_PREFIX}.{os.getpid()}.{uuid.uuid4().hex}.jsonl")
+        try:
+            # 写完后再改名，其他进程启动时不会读到写了一半的文件
+            with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+                for row in rows:
+                    f.write(json.dumps(row, ensure_ascii=False, default=datetime.isoformat) + "\n")
+            os.replace(f"{path}.tmp", path)
+        except OSError as e:
+            print(f"暂存访问控制日志失败，丢失 {len(rows)} 行: {e}")
+            self.dropped_rows += len(rows)
+            return
+        self.spooled_rows += len(rows)
+        print(f"数据库不可用，{len(rows)} 行访问控制日志已暂存，下次启动时写入")
+
+    def _take_all(self) -> List[Dict]:
+        with self._cond:
+            rows = list(self._queue)
+            self._queue.clear()
+            return rows
+
+    def _restore_spool(self):
+        """启动时把暂存的日志重新入队
+
+        多个 worker 同时启动时，每个暂存文件先原子地改名为本进程专用的名称，
+        改名成功的进程才读取，同一行日志不会被重复写入。
+        """
+        for path in sorted(glob.glob(os.path.join(self.spool_dir, f"{SPOOL_PREFIX}*.jsonl"))):
+            claimed = f"{path}.{os.getpid()}.claimed"
+            try:
+                os.rename(path, claimed)
+            except FileNotFoundError:
+                # 已被其他进程认领
+                continue
+            except OSError as e:
+                print(f"认领暂存的访问控制日志失败: {e}")
+                continue
+            try:
+                with open(claimed, encoding="utf-8") as f:
+                    rows = [json.loads(line) for line in f if line.strip()]
+            except (OSError, ValueError) as e:
+                # 保留文件供人工处理
+                print(f"读取暂存的访问控制日志 {claimed} 失败: {e}")
+                continue
+            for row in rows:
+                if row.get("access_time"):
+                    row["access_time"] = datetime.fromisoformat(row["access_time"])
+            with self._cond:
+                self._queue.extendleft(reversed(rows))
+            try:
+                os.remove(claimed)
+            except OSError as e:
+                print(f"删除已恢复的暂存文件失败: {e}")
+
+    def stats(self) -> dict:
+        return {
+            "queue_depth": self.queue_depth,
+            "written_rows": self.written_rows,
+            "flush_count": self.flush_count,
+            "failed_flushes": self.failed_flushes,
+            "dropped_rows": self.dropped_rows,
+            "dead_letter_rows": self.dead_letter_rows,
+            "spooled_rows": self.spooled_rows,
+            "max_queue": self.max_queue,
+            "last_flush_at": self.last_flush_at,
+            "batch_size": self.batch_size,
+            "flush_interval": self.flush_interval
+        }
+
+
+# 全局访问日志写入器
+access_audit_writer = AccessAuditWriter()
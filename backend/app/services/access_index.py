@@ -0,0 +1,228 @@
+from sqlalchemy.orm import Session
+from dataclasses import dataclass, field
+from datetime import datetime, date, time
+from typing import Dict, List, Optional, Tuple
+import threading
+
+from app.models import models
+
+# 一天中的秒数上界，未设置时间范围时使用
+_DAY_SECONDS = 24 * 60 * 60
+
+
+def _compile_days(days_of_week: Optional[str]) -> int:
+    """将 "1234567" 形式的星期字符串编译为位掩码，第0位表示周一"""
+    mask = 0
+    for ch in days_of_week or "":
+        if "1" <= ch <= "7":
+            mask |= 1 << (int(ch) - 1)
+    return mask
+
+
+def _seconds(value: time) -> int:
+    return value.hour * 3600 + value.minute * 60 + value.second
+
+
+@dataclass(frozen=True)
+class CompiledPermission:
+    """预编译的访问权限规则"""
+    id: int
+    device_id: Optional[int]
+    days_mask: int
+    start_date: Optional[date]
+    end_date: Optional[date]
+    start_second: int
+    end_second: int
+
+    @classmethod
+    def from_model(cls, permission: models.AccessPermission) -> "CompiledPermission":
+        # 与原逻辑保持一致：只有同时设置开始和结束时间时才限制时间段
+        if permission.start_time and permission.end_time:
+            start_second = _seconds(permission.start_time)
+            end_second = _seconds(permission.end_time)
+        else:
+            start_second, end_second = 0, _DAY_SECONDS
+        return cls(
+            id=permission.id,
+            device_id=permission.device_id,
+            days_mask=_compile_days(permission.days_of_week),
+            start_date=permission.start_date,
+            end_date=permission.end_date,
+            start_second=start_second,
+            end_second=end_second,
+        )
+
+    def matches(self, device_id: int, current_date: date, weekday_bit: int, second: int) -> bool:
+        if self.device_id and self.device_id != device_id:
+            return False
+        if self.start_date and current_date < self.start_date:
+            return False
+        if self.end_date and current_date > self.end_date:
+            return False
+        if not self.days_mask & weekday_bit:
+            return False
+        return self.start_second <= second <= self.end_second
+
+
+@dataclass
+class MemberEntry:
+    """索引中的会员条目"""
+    id: int
+    name: str
+    member_number: Optional[str]
+    membership_type: Optional[str]
+    status: str
+    branch_id: Optional[int] = None
+    permissions: Dict[int, CompiledPermission] = field(default_factory=dict)
+
+    def info(self) -> dict:
+        return {
+            "id": self.id,
+            "name": self.name,
+            "member_number": self.member_number,
+            "membership_type": self.membership_type
+        }
+
+
+class PermissionIndex:
+    """进程内的会员访问权限索引
+
+    启动时从数据库加载全部会员和有效权限，之后由会员和权限的增删改接口
+    同步更新，使门禁判定不再需要读取数据库。
+    """
+
+    def __init__(self):
+        self._members: Dict[int, MemberEntry] = {}
+        # 权限ID -> 会员ID，用于权限更新时找到原所属会员
+        self._permission_owner: Dict[int, int] = {}
+        self._lock = threading.Lock()
+        self.loaded = False
+
+    def load(self, db: Session):
+        """从数据库全量加载索引"""
+        members: Dict[int, MemberEntry] = {}
+        for member in db.query(models.Member).all():
+            members[member.id] = self._entry_from_model(member)
+
+        owners: Dict[int, int] = {}
+        permissions = db.query(models.AccessPermission).filter(
+            models.AccessPermission.status == "active"
+        ).all()
+        for permission in permissions:
+            entry = members.get(permission.member_id)
+            if entry is None:
+                continue
+            entry.permissions[permission.id] = CompiledPermission.from_model(permission)
+            owners[permission.id] = permission.member_id
+
+        with self._lock:
+            self._members = members
+            self._permission_owner = owners
+            self.loaded = True
+
+    def ensure_loaded(self, db: Session):
+        """索引尚未加载时（例如启动加载失败）进行一次加载"""
+        if not self.loaded:
+            self.load(db)
+
+    @staticmethod
+    def _entry_from_model(member: models.Member) -> MemberEntry:
+        return MemberEntry(
+            id=member.id,
+            name=member.name,
+            member_number=member.member_number,
+            membership_type=member.membership_type,
+            status=member.status,
+            branch_id=member.branch_id,
+        )
+
+    def upsert_member(self, member: models.Member):
+        """会员创建或更新后同步索引，保留已编译的权限"""
+        entry = self._entry_from_model(member)
+        with self._lock:
+            existing = self._members.get(member.id)
+            if existing is not None:
+                entry.permissions = existing.permissions
+            self._members[member.id] = entry
+
+    def remove_member(self, member_id: int):
+        """会员删除后同步索引"""
+        with self._lock:
+            entry = self._members.pop(member_id, None)
+            if entry is not None:
+                for permission_id in entry.permissions:
+                    self._permission_owner.pop(permission_id, None)
+
+    def upsert_permission(self, permission: models.AccessPermission):
+        """权限创建或更新后同步索引，非active状态的权限从索引中移除"""
+        with self._lock:
+            self._remove_permission_locked(permission.id)
+            if permission.status != "active":
+                return
+            entry = self._members.get(permission.member_id)
+            if entry is None:
+                return
+            entry.permissions[permission.id] = CompiledPermission.from_model(permission)
+            self._permission_owner[permission.id] = permission.member_id
+
+    def remove_permission(self, permission_id: int):
+        """权限删除后同步索引"""
+        with self._lock:
+            self._remove_permission_locked(permission_id)
+
+    def _remove_permission_locked(self, permission_id: int):
+        owner = self._permission_owner.pop(permission_id, None)
+        if owner is not None and owner in self._members:
+            self._members[owner].permissions.pop(permission_id, None)
+
+    def get_member(self, member_id: int) -> Optional[MemberEntry]:
+        return self._members.get(member_id)
+
+    def check(
+        self,
+        member_id: int,
+        device_id: int,
+        now: Optional[datetime] = None
+    ) -> Tuple[bool, Optional[str], Optional[MemberEntry]]:
+        """判定会员能否通过指定设备，返回 (是否允许, 拒绝原因, 会员条目)"""
+        if now is None:
+            now = datetime.now()
+
+        entry = self._members.get(member_id)
+        if entry is None:
+            return False, "会员不存在", None
+
+        if entry.status != "active":
+            reason = "会员状态异常"
+            if entry.status == "expired":
+                reason = "会员已过期"
+            elif entry.status == "inactive":
+                reason = "会员已停用"
+            return False, reason, entry
+
+        # 复制一份引用，避免与写操作并发时字典大小变化
+        permissions: List[CompiledPermission] = list(entry.permissions.values())
+
+        # 如果没有权限规则，默认允许
+        if not permissions:
+            return True, None, entry
+
+        current_date = now.date()
+        weekday_bit = 1 << now.weekday()
+        second = now.hour * 3600 + now.minute * 60 + now.second
+        for permission in permissions:
+            if permission.matches(device_id, current_date, weekday_bit, second):
+                return True, None, entry
+
+        return False, "无访问权限", entry
+
+    def stats(self) -> dict:
+        return {
+            "loaded": self.loaded,
+            "members": len(self._members),
+            "permissions": len(self._permission_owner)
+        }
+
+
+# 全局权限索引实例
+permission_index = PermissionIndex()
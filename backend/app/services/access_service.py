@@ -0,0 +1,84 @@
+from starlette.concurrency import run_in_threadpool
+from sqlalchemy.orm import Session
+from datetime import datetime
+from typing import Optional
+
+from app.database.database import SessionLocal
+from app.api.access import schemas
+from app.services.access_index import permission_index
+from app.services.access_audit import access_audit_writer
+from app.services.stats_aggregator import live_stats
+
+
+def replay_time(event_time: Optional[datetime], now: datetime) -> datetime:
+    """回放事件的判定时间：使用设备上的刷卡时间（转为本地时间），不晚于当前时间"""
+    if event_time is None:
+        return now
+    if event_time.tzinfo is not None:
+        event_time = event_time.astimezone().replace(tzinfo=None)
+    return min(event_time, now)
+
+
+def decide_access(request: schemas.AccessControlRequest, now: datetime):
+    """根据权限索引做出判定，返回判定结果和对应的访问日志行"""
+    allowed, reason, entry = permission_index.check(request.member_id, request.device_id, now)
+
+    access_log = {
+        "member_id": entry.id if entry else None,
+        "device_id": request.device_id,
+        "access_type": request.access_type,
+        "access_time": now,
+        "status": "allowed" if allowed else "denied",
+        "reason": reason,
+        "recognition_method": request.recognition_method
+    }
+
+    if not allowed:
+        result = schemas.AccessControlResult(
+            allowed=False,
+            reason=reason
+        )
+    else:
+        result = schemas.AccessControlResult(
+            allowed=True,
+            member_info=entry.info()
+        )
+
+    return result, access_log
+
+
+def check_access(db: Session, request: schemas.AccessControlRequest) -> schemas.AccessControlResult:
+    """检查访问控制权限并记录访问日志"""
+    # 通过进程内权限索引判定，无需查询会员和权限表
+    permission_index.ensure_loaded(db)
+    result, access_log = decide_access(request, datetime.now())
+
+    _record_access(access_log)
+    return result
+
+
+def _record_access(access_log: dict):
+    # 记录访问控制日志，由后台写入器批量提交
+    access_audit_writer.enqueue(access_log)
+    live_stats.record_access([access_log])
+
+
+def _check_access_with_session(request: schemas.AccessControlRequest) -> schemas.AccessControlResult:
+    db = SessionLocal()
+    try:
+        return check_access(db, request)
+    finally:
+        db.close()
+
+
+async def check_access_async(request: schemas.AccessControlRequest) -> schemas.AccessControlResult:
+    """在事件循环中直接判定门禁
+
+    权限索引已加载时只读内存，不进入设备任务队列、不等待设备锁，也不访问数据库；
+    索引尚未加载时在线程池中加载后再判定。
+    """
+    if not permission_index.loaded:
+        return await run_in_threadpool(_check_access_with_session, request)
+    result, access_log = decide_access(request, datetime.now())
+    _record_access(access_log)
+    return result
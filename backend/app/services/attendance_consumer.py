@@ -0,0 +1,181 @@
+from datetime import datetime
+from sqlalchemy import func, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from typing import Optional
+import os
+import threading
+
+from app.database.database import SessionLocal
+from app.models import models
+from app.services.attendance_service import SummaryDeltas, record_check_in, record_check_out
+
+# 消费任务的执行间隔（秒），也是门禁通行进入考勤前的最短延迟
+CONSUMER_INTERVAL = float(os.getenv("ATTENDANCE_CONSUMER_INTERVAL", "2"))
+# 单批读取的访问日志行数
+CONSUMER_BATCH_SIZE = int(os.getenv("ATTENDANCE_CONSUMER_BATCH_SIZE", "500"))
+
+CHECKPOINT_NAME = "attendance:access"
+
+
+class AttendanceConsumer:
+    """从访问控制日志派生考勤记录的后台任务
+
+    按 processing_checkpoints 中的水位线读取新写入的访问日志，把允许通行的进门事件
+    记为签到、出门事件记为签退。一批事件的考勤修改、合并后的汇总增量和水位线推进在
+    同一事务中提交，进程崩溃后从水位线继续，每条事件只被处理一次；门禁刷卡因此只需
+    写一条访问日志，中间件不必再单独调用签到签退接口。
+
+    与日志汇总任务相同，每轮只处理到上一轮观察到的最大ID，避免水位线越过尚未提交的行。
+    首次运行（升级后尚无水位线）时从当前最大的访问日志ID开始，不回放历史访问日志；
+    历史考勤已由中间件写入，需要修正汇总时使用 database/rebuild_attendance_summary.py。
+    """
+
+    def __init__(self, interval: float = CONSUMER_INTERVAL):
+        self.interval = interval
+        self._horizon: Optional[int] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        # 统计信息
+        self.processed_events = 0
+        self.checked_in = 0
+        self.checked_out = 0
+        self.ignored_events = 0
+        self.last_id: Optional[int] = None
+        self.last_event_at: Optional[datetime] = None
+        self.last_run_at: Optional[datetime] = None
+        self.failed_runs = 0
+
+    def start(self):
+        """启动后台消费线程"""
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="attendance-consumer", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        thread = self._thread
+        if thread is None:
+            return
+        self._stop.set()
+        thread.join()
+        self._thread = None
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"考勤消费失败: {e}")
+                self.failed_runs += 1
+            self._stop.wait(self.interval)
+
+    def run_once(self):
+        """处理水位线之后、上一轮观察到的最大ID之前的全部访问日志"""
+        db = SessionLocal()
+        try:
+            current = db.scalar(select(func.max(models.AccessControl.id))) or 0
+            db.rollback()
+            if self._horizon is not None:
+                while not self._stop.is_set() and self._process_batch(db, self._horizon) == CONSUMER_BATCH_SIZE:
+                    pass
+            self._horizon = current
+        finally:
+            db.close()
+        self.last_run_at = datetime.now()
+
+    @staticmethod
+    def _lock_checkpoint(db: Session) -> int:
+        """锁住水位线行并返回已处理的最大访问日志ID，多个服务进程同时运行时只有一个在推进"""
+        checkpoint = models.ProcessingCheckpoint
+        query = select(checkpoint.last_id).where(checkpoint.name == CHECKPOINT_NAME).with_for_update()
+        last_id = db.scalar(query)
+        if last_id is None:
+            # 新建的水位线从当前最大ID开始，升级时不把全部历史访问日志重放为考勤
+            start_id = db.scalar(select(func.max(models.AccessControl.id))) or 0
+            try:
+                with db.begin_nested():
+                    db.execute(checkpoint.__table__.insert().values(
+                        name=CHECKPOINT_NAME, last_id=start_id, updated_at=datetime.now()
+                    ))
+            except IntegrityError:
+                # 其他进程已创建
+                pass
+            last_id = db.scalar(query)
+        return last_id
+
+    def _process_batch(self, db: Session, horizon: int) -> int:
+        """处理一批访问日志，返回读取的事件数（小于批大小表示已追平）"""
+        log = models.AccessControl
+        try:
+            last_id = self._lock_checkpoint(db)
+            rows = db.execute(
+                select(
+                    log.id, log.member_id, log.device_id, log.access_type, log.access_time, models.Device.branch_id
+                ).outerjoin(
+                    models.Device, log.device_id == models.Device.id
+                ).where(
+                    log.id > last_id,
+                    log.id <= horizon,
+                    log.status == "allowed",
+                    log.member_id.is_not(None)
+                ).order_by(log.id).limit(CONSUMER_BATCH_SIZE)
+            ).all()
+
+            deltas = SummaryDeltas()
+            checked_in = checked_out = 0
+            for _, member_id, device_id, access_type, access_time, branch_id in rows:
+                event_time = access_time or datetime.now()
+                if access_type == "entry":
+                    checked_in += record_check_in(db, member_id, device_id, branch_id, event_time, deltas).success
+                elif access_type == "exit":
+                    checked_out += record_check_out(db, member_id, event_time, deltas).success
+            deltas.apply(db)
+
+            # 未取满一批时，水位线之后到 horizon 之间的其余日志都是拒绝或无会员的事件
+            new_last_id = rows[-1].id if len(rows) == CONSUMER_BATCH_SIZE else horizon
+            if new_last_id > last_id:
+                db.execute(
+                    update(models.ProcessingCheckpoint).where(
+                        models.ProcessingCheckpoint.name == CHECKPOINT_NAME
+                    ).values(last_id=new_last_id, updated_at=datetime.now())
+                )
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+
+        self.processed_events += len(rows)
+        self.checked_in += checked_in
+        self.checked_out += checked_out
+        self.ignored_events += len(rows) - checked_in - checked_out
+        self.last_id = max(last_id, new_last_id)
+        if rows:
+            self.last_event_at = rows[-1].access_time
+        return len(rows)
+
+    def lag(self) -> Optional[float]:
+        """已处理的最新事件距今的秒数"""
+        if self.last_event_at is None:
+            return None
+        return (datetime.now() - self.last_event_at).total_seconds()
+
+    def stats(self) -> dict:
+        return {
+            "running": self._thread is not None,
+            "interval": self.interval,
+            "horizon": self._horizon,
+            "processed_events": self.processed_events,
+            "checked_in": self.checked_in,
+            "checked_out": self.checked_out,
+            "ignored_events": self.ignored_events,
+            "last_id": self.last_id,
+            "lag": self.lag(),
+            "last_run_at": self.last_run_at,
+            "failed_runs": self.failed_runs
+        }
+
+
+# 全局考勤消费任务
+attendance_consumer = AttendanceConsumer()
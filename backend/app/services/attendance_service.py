@@ -0,0 +1,260 @@
+from collections import Counter, defaultdict
+from datetime import date, datetime
+from sqlalchemy import and_, case, delete, func, insert, literal_column, select, update
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from typing import Dict, Optional, Tuple
+
+from app.models import models
+from app.api.attendance import schemas
+
+# 汇总表中可累加的计数列
+SUMMARY_COUNTERS = ("total_records", "checked_in", "checked_out", "completed", "total_duration_minutes", "auto_closed")
+# 每个会员每天一条考勤记录的唯一索引
+MEMBER_DATE_INDEX = "uq_attendance_records_member_date"
+# MySQL 错误码：唯一键重复
+ER_DUP_ENTRY = 1062
+
+
+def apply_summary_delta(db: Session, summary_date: date, branch_id: int, **deltas: int):
+    """在当前事务中累加某天某分支的考勤汇总
+
+    使用 INSERT ... ON DUPLICATE KEY UPDATE 原子累加，与考勤记录的修改一起提交，
+    并发签到签退不会丢失计数。
+    """
+    values = {counter: deltas.get(counter, 0) for counter in SUMMARY_COUNTERS}
+    if not any(values.values()):
+        return
+    table = models.AttendanceDailySummary.__table__
+    statement = mysql_insert(table).values(
+        date=summary_date,
+        branch_id=branch_id or 0,
+        updated_at=datetime.now(),
+        **values
+    )
+    statement = statement.on_duplicate_key_update(
+        updated_at=statement.inserted.updated_at,
+        **{
+            counter: table.c[counter] + statement.inserted[counter]
+            for counter, delta in values.items() if delta
+        }
+    )
+    db.execute(statement)
+
+
+def rebuild_daily_summaries(db: Session, start_date: Optional[date] = None, end_date: Optional[date] = None) -> int:
+    """按考勤记录重新计算日期范围内的汇总，返回写入的行数（由调用方提交）"""
+    record = models.AttendanceRecord
+    summary = models.AttendanceDailySummary
+
+    conditions = []
+    if start_date:
+        conditions.append(record.date >= start_date)
+    if end_date:
+        conditions.append(record.date <= end_date)
+
+    branch_id = func.coalesce(models.Device.branch_id, 0)
+    aggregate = select(
+        record.date,
+        branch_id,
+        func.count(record.id),
+        func.count(record.check_in_time),
+        func.count(record.check_out_time),
+        func.sum(case((record.duration_minutes > 0, 1), else_=0)),
+        func.coalesce(func.sum(record.duration_minutes), 0),
+        func.sum(case((and_(record.status == "abnormal", record.check_out_time.is_(None)), 1), else_=0)),
+        func.now()
+    ).outerjoin(
+        models.Device, record.device_id == models.Device.id
+    ).where(
+        record.date.is_not(None),
+        *conditions
+    ).group_by(
+        record.date, branch_id
+    )
+
+    clear = delete(summary)
+    if start_date:
+        clear = clear.where(summary.date >= start_date)
+    if end_date:
+        clear = clear.where(summary.date <= end_date)
+    db.execute(clear)
+
+    result = db.execute(insert(summary).from_select(
+        ["date", "branch_id", *SUMMARY_COUNTERS, "updated_at"],
+        aggregate
+    ))
+    return result.rowcount
+
+
+def get_daily_summary(db: Session, target_date: date, branch_id: Optional[int] = None) -> dict:
+    """从汇总表读取某天的考勤汇总，不指定分支时合计所有分支"""
+    summary = models.AttendanceDailySummary
+    query = select(
+        *(func.coalesce(func.sum(summary.__table__.c[counter]), 0) for counter in SUMMARY_COUNTERS)
+    ).where(summary.date == target_date)
+    if branch_id is not None:
+        query = query.where(summary.branch_id == branch_id)
+    total_records, checked_in, checked_out, completed, total_minutes, auto_closed = (
+        int(value) for value in db.execute(query).one()
+    )
+
+    # 计算平均停留时间
+    average_duration = total_minutes / completed if completed else 0
+
+    return {
+        "date": target_date,
+        "total_records": total_records,
+        "checked_in": checked_in,
+        "checked_out": checked_out,
+        "still_in": checked_in - checked_out - auto_closed,
+        "auto_closed": auto_closed,
+        "average_duration_minutes": round(average_duration, 2),
+        "average_duration_hours": round(average_duration / 60, 2)
+    }
+
+
+class SummaryDeltas:
+    """一个事务内累积的汇总增量，按 (日期, 分支) 合并后在提交前一次写入"""
+
+    def __init__(self):
+        self._deltas: Dict[Tuple[date, int], Counter] = defaultdict(Counter)
+
+    def add(self, summary_date: date, branch_id: Optional[int], **deltas: int):
+        self._deltas[(summary_date, branch_id or 0)].update(deltas)
+
+    def apply(self, db: Session):
+        # 按固定顺序加锁汇总行，并发的批次之间不会互相死锁
+        for (summary_date, branch_id), deltas in sorted(self._deltas.items()):
+            apply_summary_delta(db, summary_date, branch_id, **deltas)
+        self._deltas.clear()
+
+
+def _is_member_date_conflict(error: IntegrityError) -> bool:
+    """插入考勤记录的错误是否为当日记录已存在"""
+    args = getattr(error.orig, "args", ())
+    return args[:1] == (ER_DUP_ENTRY,) and MEMBER_DATE_INDEX in str(args[1:])
+
+
+def record_check_in(
+    db: Session, member_id: int, device_id: int, branch_id: Optional[int], now: datetime, deltas: SummaryDeltas
+) -> schemas.CheckInOutResult:
+    """在当前事务中签到，汇总增量记入 deltas，由调用方写入汇总并提交
+
+    (member_id, date) 上有唯一索引，在保存点中插入当日记录：同一会员同时到达的多次刷卡
+    只有一次插入成功，其余在该唯一索引上冲突，返回“今日已签到”，不会产生重复记录。
+    外键、字段截断等其他错误照常抛出。
+    """
+    record = models.AttendanceRecord
+    today = now.date()
+    try:
+        with db.begin_nested():
+            record_id = db.execute(
+                insert(record).values(
+                    member_id=member_id,
+                    device_id=device_id,
+                    date=today,
+                    check_in_time=now,
+                    status="incomplete"
+                )
+            ).inserted_primary_key[0]
+    except IntegrityError as e:
+        if not _is_member_date_conflict(e):
+            raise
+        # 当日记录已存在，只有尚未签到时才补记签到时间
+        result = db.execute(
+            update(record).where(
+                record.member_id == member_id,
+                record.date == today,
+                record.check_in_time.is_(None)
+            ).values(check_in_time=now, device_id=device_id)
+        )
+        if result.rowcount != 1:
+            return schemas.CheckInOutResult(success=False, message="今日已签到")
+        record_id = db.scalar(select(record.id).where(record.member_id == member_id, record.date == today))
+        deltas.add(today, branch_id, checked_in=1)
+    else:
+        deltas.add(today, branch_id, total_records=1, checked_in=1)
+
+    return schemas.CheckInOutResult(
+        success=True,
+        message="签到成功",
+        record_id=record_id,
+        check_time=now
+    )
+
+
+def record_check_out(db: Session, member_id: int, now: datetime, deltas: SummaryDeltas) -> schemas.CheckInOutResult:
+    """在当前事务中签退，汇总增量记入 deltas，由调用方写入汇总并提交
+
+    用一条带条件的 UPDATE 完成签退并在数据库中计算停留时间，只有已签到且未签退的记录
+    会被更新；并发的重复签退中只有一次影响到记录。已被自动签退关闭的记录不再接受签退。
+    """
+    record = models.AttendanceRecord
+    today = now.date()
+    result = db.execute(
+        update(record).where(
+            record.member_id == member_id,
+            record.date == today,
+            record.check_in_time.is_not(None),
+            record.check_out_time.is_(None),
+            record.status == "incomplete"
+        ).values(
+            check_out_time=now,
+            duration_minutes=func.timestampdiff(literal_column("MINUTE"), record.check_in_time, now),
+            status="complete"
+        )
+    )
+    # 汇总计入签到设备所属的分支
+    row = db.execute(
+        select(record.id, record.check_in_time, record.status, record.duration_minutes, models.Device.branch_id).outerjoin(
+            models.Device, record.device_id == models.Device.id
+        ).where(
+            record.member_id == member_id,
+            record.date == today
+        )
+    ).first()
+    if result.rowcount != 1:
+        if row is None or row.check_in_time is None:
+            return schemas.CheckInOutResult(success=False, message="请先签到")
+        if row.status == "abnormal":
+            return schemas.CheckInOutResult(success=False, message="签到已超时，已自动签退")
+        return schemas.CheckInOutResult(success=False, message="今日已签退")
+
+    duration = row.duration_minutes or 0
+    deltas.add(
+        today, row.branch_id,
+        checked_out=1,
+        completed=1 if duration > 0 else 0,
+        total_duration_minutes=duration
+    )
+
+    return schemas.CheckInOutResult(
+        success=True,
+        message="签退成功",
+        record_id=row.id,
+        check_time=now
+    )
+
+
+def _commit_result(db: Session, result: schemas.CheckInOutResult, deltas: SummaryDeltas) -> schemas.CheckInOutResult:
+    if not result.success:
+        db.rollback()
+        return result
+    # 考勤记录与当日汇总在同一事务中提交，汇总行的锁只持有到提交
+    deltas.apply(db)
+    db.commit()
+    return result
+
+
+def check_in(db: Session, member_id: int, device_id: int, branch_id: Optional[int], now: datetime) -> schemas.CheckInOutResult:
+    """签到并提交"""
+    deltas = SummaryDeltas()
+    return _commit_result(db, record_check_in(db, member_id, device_id, branch_id, now, deltas), deltas)
+
+
+def check_out(db: Session, member_id: int, now: datetime) -> schemas.CheckInOutResult:
+    """签退并提交"""
+    deltas = SummaryDeltas()
+    return _commit_result(db, record_check_out(db, member_id, now, deltas), deltas)
@@ -0,0 +1,175 @@
+from datetime import datetime, timedelta
+from sqlalchemy import and_, or_, select, update
+from sqlalchemy.orm import Session
+from typing import Dict, Optional, Tuple
+import os
+import threading
+
+from app.database.database import SessionLocal
+from app.models import models
+from app.services.attendance_service import SummaryDeltas
+
+# 自动签退的执行间隔（秒）
+SWEEP_INTERVAL = float(os.getenv("ATTENDANCE_SWEEP_INTERVAL", "600"))
+# 分支未设置时，签到超过多少小时未签退的记录被自动关闭
+AUTO_CHECKOUT_HOURS = int(os.getenv("ATTENDANCE_AUTO_CHECKOUT_HOURS", "12"))
+# 每个事务最多关闭的记录数
+SWEEP_CHUNK_SIZE = int(os.getenv("ATTENDANCE_SWEEP_CHUNK_SIZE", "200"))
+# 两批之间的停顿（秒），营业时间内把写入分散开
+SWEEP_CHUNK_PAUSE = float(os.getenv("ATTENDANCE_SWEEP_CHUNK_PAUSE", "0.05"))
+
+
+class AttendanceSweeper:
+    """超时未签退考勤的自动关闭任务
+
+    定期找出签到时间早于所属分支截止时长（branches.auto_checkout_hours，未设置时使用
+    全局设置）仍未签退的考勤记录，标记为 abnormal 并计入当日汇总的 auto_closed，
+    使汇总中的在场人数不再包含离场未刷卡的会员。
+
+    候选记录按 (status, check_in_time) 索引范围扫描，不加锁读取；每批只按主键锁住
+    仍未签退的记录并跳过正在签退的行，在一个短事务中更新和累加汇总，不会长时间锁表。
+    """
+
+    def __init__(self, interval: float = SWEEP_INTERVAL):
+        self.interval = interval
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        # 统计信息
+        self.closed_records = 0
+        self.last_closed = 0
+        self.last_run_at: Optional[datetime] = None
+        self.failed_runs = 0
+
+    def start(self):
+        """启动后台自动签退线程"""
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="attendance-sweeper", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        thread = self._thread
+        if thread is None:
+            return
+        self._stop.set()
+        thread.join()
+        self._thread = None
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"自动签退失败: {e}")
+                self.failed_runs += 1
+            self._stop.wait(self.interval)
+
+    def run_once(self, now: Optional[datetime] = None) -> int:
+        """关闭所有已超时的未签退记录，返回关闭的记录数"""
+        now = now or datetime.now()
+        db = SessionLocal()
+        closed = 0
+        try:
+            default_cutoff = now - timedelta(hours=AUTO_CHECKOUT_HOURS)
+            cutoffs = {
+                branch_id: now - timedelta(hours=hours)
+                for branch_id, hours in db.execute(
+                    select(models.Branch.id, models.Branch.auto_checkout_hours).where(
+                        models.Branch.auto_checkout_hours.is_not(None)
+                    )
+                )
+            }
+            # 扫描范围取最晚的截止时间，覆盖所有分支的超时记录
+            scan_cutoff = max([default_cutoff, *cutoffs.values()])
+            db.rollback()
+
+            position = None
+            while not self._stop.is_set():
+                candidates = self._scan(db, scan_cutoff, position)
+                db.rollback()
+                if not candidates:
+                    break
+                position = (candidates[-1].check_in_time, candidates[-1].id)
+                stale = {
+                    row.id: row.branch_id for row in candidates
+                    if row.check_in_time < cutoffs.get(row.branch_id, default_cutoff)
+                }
+                if stale:
+                    closed += self._close(db, stale)
+                if len(candidates) < SWEEP_CHUNK_SIZE:
+                    break
+                self._stop.wait(SWEEP_CHUNK_PAUSE)
+        finally:
+            db.close()
+
+        self.closed_records += closed
+        self.last_closed = closed
+        self.last_run_at = datetime.now()
+        return closed
+
+    @staticmethod
+    def _scan(db: Session, cutoff: datetime, position: Optional[Tuple[datetime, int]]):
+        """按 (签到时间, ID) 顺序读取下一批候选记录，不加锁"""
+        record = models.AttendanceRecord
+        query = select(record.id, record.check_in_time, models.Device.branch_id).outerjoin(
+            models.Device, record.device_id == models.Device.id
+        ).where(
+            record.status == "incomplete",
+            record.check_in_time < cutoff
+        )
+        if position:
+            last_time, last_id = position
+            query = query.where(or_(
+                record.check_in_time > last_time,
+                and_(record.check_in_time == last_time, record.id > last_id)
+            ))
+        return db.execute(
+            query.order_by(record.check_in_time, record.id).limit(SWEEP_CHUNK_SIZE)
+        ).all()
+
+    @staticmethod
+    def _close(db: Session, stale: Dict[int, Optional[int]]) -> int:
+        """在一个事务中关闭一批记录（记录ID -> 所属分支）并累加汇总，返回实际关闭的记录数"""
+        record = models.AttendanceRecord
+        try:
+            # 只按主键锁住仍未签退的记录，正在签退的行被跳过，由签退正常完成
+            rows = db.execute(
+                select(record.id, record.date).where(
+                    record.id.in_(list(stale)),
+                    record.status == "incomplete",
+                    record.check_out_time.is_(None)
+                ).with_for_update(skip_locked=True)
+            ).all()
+            if not rows:
+                db.rollback()
+                return 0
+
+            db.execute(
+                update(record).where(record.id.in_([row.id for row in rows])).values(status="abnormal")
+            )
+            deltas = SummaryDeltas()
+            for row in rows:
+                deltas.add(row.date, stale[row.id], auto_closed=1)
+            deltas.apply(db)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        return len(rows)
+
+    def stats(self) -> Dict:
+        return {
+            "running": self._thread is not None,
+            "interval": self.interval,
+            "auto_checkout_hours": AUTO_CHECKOUT_HOURS,
+            "chunk_size": SWEEP_CHUNK_SIZE,
+            "closed_records": self.closed_records,
+            "last_closed": self.last_closed,
+            "last_run_at": self.last_run_at,
+            "failed_runs": self.failed_runs
+        }
+
+
+# 全局自动签退任务
+attendance_sweeper = AttendanceSweeper()
@@ -0,0 +1,168 @@
+from sqlalchemy.orm import Session
+from typing import Dict, Optional, Set, Tuple
+import threading
+
+import numpy as np
+
+from app.models import models
+
+
+class DeviceCandidateIndex:
+    """设备候选会员索引
+
+    预先计算每台设备可能识别到的会员集合：与设备同一分支的会员，
+    加上拥有该设备专属访问权限的会员。识别时先在该集合内比对，
+    使单个分支的识别开销不随全部分支的会员总数增长。
+    """
+
+    def __init__(self):
+        self._member_branch: Dict[int, Optional[int]] = {}
+        self._device_branch: Dict[int, Optional[int]] = {}
+        self._branch_members: Dict[int, Set[int]] = {}
+        self._device_members: Dict[int, Set[int]] = {}
+        # 权限ID -> (会员ID, 设备ID)，只记录指定了设备的有效权限
+        self._permission_device: Dict[int, Tuple[int, int]] = {}
+        # 设备ID -> (版本号, 候选会员ID数组)
+        self._cache: Dict[int, Tuple[int, np.ndarray]] = {}
+        self._lock = threading.Lock()
+        self.version = 0
+        self.loaded = False
+
+    def load(self, db: Session):
+        """从数据库全量加载索引
+
+        在锁外查询并构建新的映射，再在锁内替换，识别时的 candidates() 不会等待查询；
+        内容与当前索引相同时不增加版本号，保留已计算的候选集合。
+        """
+        member_branch = {member_id: branch_id for member_id, branch_id in db.query(models.Member.id, models.Member.branch_id)}
+        device_branch = {device_id: branch_id for device_id, branch_id in db.query(models.Device.id, models.Device.branch_id)}
+        permissions = db.query(
+            models.AccessPermission.id,
+            models.AccessPermission.member_id,
+            models.AccessPermission.device_id
+        ).filter(
+            models.AccessPermission.status == "active",
+            models.AccessPermission.device_id.isnot(None)
+        )
+        permission_device = {permission_id: (member_id, device_id) for permission_id, member_id, device_id in permissions}
+
+        branch_members: Dict[int, Set[int]] = {}
+        for member_id, branch_id in member_branch.items():
+            if branch_id is not None:
+                branch_members.setdefault(branch_id, set()).add(member_id)
+        device_members: Dict[int, Set[int]] = {}
+        for member_id, device_id in permission_device.values():
+            device_members.setdefault(device_id, set()).add(member_id)
+
+        with self._lock:
+            changed = (
+                member_branch != self._member_branch
+                or device_branch != self._device_branch
+                or permission_device != self._permission_device
+            )
+            if changed:
+                self._member_branch = member_branch
+                self._device_branch = device_branch
+                self._branch_members = branch_members
+                self._device_members = device_members
+                self._permission_device = permission_device
+                self._changed_locked()
+            self.loaded = True
+
+    def ensure_loaded(self, db: Session):
+        if not self.loaded:
+            self.load(db)
+
+    def _changed_locked(self):
+        self.version += 1
+        self._cache = {}
+
+    def _set_member_locked(self, member_id: int, branch_id: Optional[int]):
+        previous = self._member_branch.get(member_id)
+        if previous is not None:
+            self._branch_members.get(previous, set()).discard(member_id)
+        self._member_branch[member_id] = branch_id
+        if branch_id is not None:
+            self._branch_members.setdefault(branch_id, set()).add(member_id)
+
+    def _set_permission_locked(self, permission_id: int, member_id: int, device_id: int):
+        self._permission_device[permission_id] = (member_id, device_id)
+        self._device_members.setdefault(device_id, set()).add(member_id)
+
+    def _remove_permission_locked(self, permission_id: int):
+        existing = self._permission_device.pop(permission_id, None)
+        if existing is None:
+            return
+        member_id, device_id = existing
+        # 同一会员可能有多条指向该设备的权限
+        if not any(value == existing for value in self._permission_device.values()):
+            self._device_members.get(device_id, set()).discard(member_id)
+
+    def upsert_member(self, member: models.Member):
+        with self._lock:
+            if self._member_branch.get(member.id, -1) == member.branch_id:
+                return
+            self._set_member_locked(member.id, member.branch_id)
+            self._changed_locked()
+
+    def remove_member(self, member_id: int):
+        with self._lock:
+            branch_id = self._member_branch.pop(member_id, None)
+            if branch_id is not None:
+                self._branch_members.get(branch_id, set()).discard(member_id)
+            for members in self._device_members.values():
+                members.discard(member_id)
+            self._changed_locked()
+
+    def upsert_device(self, device: models.Device):
+        with self._lock:
+            if device.id in self._device_branch and self._device_branch[device.id] == device.branch_id:
+                return
+            self._device_branch[device.id] = device.branch_id
+            self._changed_locked()
+
+    def remove_device(self, device_id: int):
+        with self._lock:
+            self._device_branch.pop(device_id, None)
+            self._device_members.pop(device_id, None)
+            self._changed_locked()
+
+    def upsert_permission(self, permission: models.AccessPermission):
+        with self._lock:
+            self._remove_permission_locked(permission.id)
+            if permission.status == "active" and permission.device_id:
+                self._set_permission_locked(permission.id, permission.member_id, permission.device_id)
+            self._changed_locked()
+
+    def remove_permission(self, permission_id: int):
+        with self._lock:
+            self._remove_permission_locked(permission_id)
+            self._changed_locked()
+
+    def candidates(self, device_id: int) -> Tuple[int, np.ndarray]:
+        """返回 (索引版本号, 设备候选会员ID升序数组)"""
+        cached = self._cache.get(device_id)
+        if cached is not None:
+            return cached
+        with self._lock:
+            members = set(self._device_members.get(device_id, ()))
+            branch_id = self._device_branch.get(device_id)
+            if branch_id is not None:
+                members |= self._branch_members.get(branch_id, set())
+            result = (self.version, np.array(sorted(members), dtype=np.int64))
+            self._cache[device_id] = result
+        return result
+
+    def stats(self) -> dict:
+        return {
+            "loaded": self.loaded,
+            "version": self.version,
+            "members": len(self._member_branch),
+            "devices": len(self._device_branch),
+            "branches": len(self._branch_members),
+            "device_permissions": len(self._permission_device)
+        }
+
+
+# 全局设备候选会员索引
+candidate_index = DeviceCandidateIndex()
@@ -0,0 +1,78 @@
+from sqlalchemy.orm import Session
+from typing import Dict, Optional, Tuple
+import threading
+
+from app.models import models
+
+
+class CardIndex:
+    """会员卡号索引
+
+    卡号 -> (卡ID, 会员ID, 卡状态) 的哈希表，刷卡时以常数时间定位会员，
+    之后只需与该会员的指纹模板做1:1比对，不再在整个模板库中检索。
+    """
+
+    def __init__(self):
+        self._cards: Dict[str, Tuple[int, int, str]] = {}
+        # 卡ID -> 卡号，卡号修改后用于移除旧的键
+        self._numbers: Dict[int, str] = {}
+        self._lock = threading.Lock()
+        self.loaded = False
+
+    def load(self, db: Session):
+        """从数据库全量加载索引"""
+        cards: Dict[str, Tuple[int, int, str]] = {}
+        numbers: Dict[int, str] = {}
+        rows = db.query(
+            models.MemberCard.id,
+            models.MemberCard.card_number,
+            models.MemberCard.member_id,
+            models.MemberCard.status
+        )
+        for card_id, card_number, member_id, status in rows:
+            cards[card_number] = (card_id, member_id, status)
+            numbers[card_id] = card_number
+        with self._lock:
+            self._cards = cards
+            self._numbers = numbers
+            self.loaded = True
+
+    def ensure_loaded(self, db: Session):
+        if not self.loaded:
+            self.load(db)
+
+    def upsert_card(self, card: models.MemberCard):
+        with self._lock:
+            previous = self._numbers.get(card.id)
+            if previous is not None and previous != card.card_number:
+                self._cards.pop(previous, None)
+            self._cards[card.card_number] = (card.id, card.member_id, card.status)
+            self._numbers[card.id] = card.card_number
+
+    def remove_card(self, card_id: int):
+        with self._lock:
+            card_number = self._numbers.pop(card_id, None)
+            if card_number is not None:
+                self._cards.pop(card_number, None)
+
+    def remove_member(self, member_id: int):
+        """会员删除后移除其全部卡片"""
+        with self._lock:
+            for card_number, (card_id, card_member_id, _) in list(self._cards.items()):
+                if card_member_id == member_id:
+                    del self._cards[card_number]
+                    self._numbers.pop(card_id, None)
+
+    def lookup(self, card_number: str) -> Optional[Tuple[int, int, str]]:
+        """返回 (卡ID, 会员ID, 卡状态)，卡号不存在时返回None"""
+        return self._cards.get(card_number)
+
+    def stats(self) -> dict:
+        return {
+            "loaded": self.loaded,
+            "cards": len(self._cards)
+        }
+
+
+# 全局会员卡号索引
+card_index = CardIndex()
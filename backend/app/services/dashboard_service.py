@@ -1,78 +1,94 @@
-from sqlalchemy.orm import Session
-from sqlalchemy import func, desc, and_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import func, desc, select
 from datetime import datetime, timedelta
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Optional
 import json
+import os
 
 from app.models import models
+from app.services.log_rollup import GRANULARITY_SECONDS, MINUTE_RETENTION_DAYS, bucket_start
 
-async def get_dashboard_statistics(db: Session) -> Dict[str, Any]:
-    """获取仪表板统计数据"""
+# 时间序列接口单次返回的最大点数，据此选择汇总粒度
+TIMESERIES_MAX_POINTS = int(os.getenv("TIMESERIES_MAX_POINTS", "500"))
+
+async def get_dashboard_statistics(db: AsyncSession) -> Dict[str, Any]:
+    """获取仪表板统计数据
+
+    固定执行4条查询：各类总数、过去24小时的小时汇总、过去7天按设备的小时汇总、
+    最近识别记录；小时和设备分布读取 log_rollups，不再扫描原始识别记录。
+    """
     # 获取当前日期和时间
     now = datetime.now()
     today_start = datetime(now.year, now.month, now.day, 0, 0, 0)
     
-    # 获取总会员数
-    total_members = db.query(func.count(models.Member.id)).scalar()
-    
-    # 获取总设备数
-    total_devices = db.query(func.count(models.Device.id)).scalar()
+    # 按整点对齐的过去24小时窗口（含当前小时），今日零点一定落在窗口内
+    current_hour = now.replace(minute=0, second=0, microsecond=0)
+    window_start = current_hour - timedelta(hours=23)
     
-    # 获取在线设备数
-    online_devices = db.query(func.count(models.Device.id)).filter(
-        models.Device.status == "online"
-    ).scalar()
+    # 会员、设备、指纹总数：一条语句中的多个标量子查询
+    totals = (await db.execute(select(
+        select(func.count(models.Member.id)).scalar_subquery().label("total_members"),
+        select(func.count(models.Device.id)).scalar_subquery().label("total_devices"),
+        select(func.count(models.Device.id)).where(
+            models.Device.status == "online"
+        ).scalar_subquery().label("online_devices"),
+        select(func.count(models.FingerprintTemplate.id)).scalar_subquery().label("total_fingerprints")
+    ))).one()
     
-    # 获取总指纹数
-    total_fingerprints = db.query(func.count(models.FingerprintTemplate.id)).scalar()
-    
-    # 获取今日识别次数
-    today_recognitions = db.query(func.count(models.RecognitionLog.id)).filter(
-        models.RecognitionLog.recognized_at >= today_start
-    ).scalar()
+    # 过去24小时按 (小时, 状态) 读取小时汇总，今日识别次数和成功率也由此汇总
+    bucket_rows = (await db.execute(select(
+        models.LogRollup.bucket_start,
+        models.LogRollup.status,
+        func.sum(models.LogRollup.count).label("count")
+    ).where(
+        models.LogRollup.source == "recognition",
+        models.LogRollup.granularity == "hour",
+        models.LogRollup.bucket_start >= window_start
+    ).group_by(
+        models.LogRollup.bucket_start, models.LogRollup.status
+    ))).all()
     
-    # 获取今日成功识别次数
-    today_success_recognitions = db.query(func.count(models.RecognitionLog.id)).filter(
-        models.RecognitionLog.recognized_at >= today_start,
-        models.RecognitionLog.status == "success"
-    ).scalar()
+    bucket_counts: Dict[datetime, int] = {}
+    today_recognitions = 0
+    today_success_recognitions = 0
+    for hour_start, log_status, count in bucket_rows:
+        count = int(count)
+        bucket_counts[hour_start] = bucket_counts.get(hour_start, 0) + count
+        if hour_start >= today_start:
+            today_recognitions += count
+            if log_status == "success":
+                today_success_recognitions += count
     
-    # 获取按小时分布的识别次数（过去24小时）
     hourly_stats = []
     for i in range(24):
-        hour_start = now - timedelta(hours=24-i)
-        hour_end = now - timedelta(hours=23-i)
-        
-        count = db.query(func.count(models.RecognitionLog.id)).filter(
-            models.RecognitionLog.recognized_at >= hour_start,
-            models.RecognitionLog.recognized_at < hour_end
-        ).scalar()
-        
+        hour_start = window_start + timedelta(hours=i)
         hourly_stats.append({
-            "hour": (hour_start.hour),
-            "count": count
+            "hour": hour_start.hour,
+            "count": bucket_counts.get(hour_start, 0)
         })
     
-    # 获取按设备分布的识别次数（过去7天）
-    seven_days_ago = now - timedelta(days=7)
-    device_stats = db.query(
+    # 获取按设备分布的识别次数（过去7天，按小时汇总）
+    seven_days_ago = current_hour - timedelta(days=7)
+    device_stats = (await db.execute(select(
         models.Device.name,
-        func.count(models.RecognitionLog.id).label("count")
+        func.sum(models.LogRollup.count).label("count")
     ).join(
-        models.RecognitionLog,
-        models.RecognitionLog.device_id == models.Device.id
-    ).filter(
-        models.RecognitionLog.recognized_at >= seven_days_ago
+        models.LogRollup,
+        models.LogRollup.device_id == models.Device.id
+    ).where(
+        models.LogRollup.source == "recognition",
+        models.LogRollup.granularity == "hour",
+        models.LogRollup.bucket_start >= seven_days_ago
     ).group_by(
         models.Device.name
-    ).all()
+    ))).all()
     
     device_recognition_stats = [
-        {"device": name, "count": count} for name, count in device_stats
+        {"device": name, "count": int(count)} for name, count in device_stats
     ]
     
     # 获取最近10条识别记录
-    recent_logs = db.query(
+    recent_logs = (await db.execute(select(
         models.RecognitionLog,
         models.Member.name.label("member_name"),
         models.Device.name.label("device_name")
@@ -84,7 +100,7 @@ async def get_dashboard_statistics(db: Session) -> Dict[str, Any]:
         models.RecognitionLog.device_id == models.Device.id
     ).order_by(
         desc(models.RecognitionLog.recognized_at)
-    ).limit(10).all()
+    ).limit(10))).all()
     
     formatted_logs = []
     for log, member_name, device_name in recent_logs:
@@ -100,10 +116,10 @@ async def get_dashboard_statistics(db: Session) -> Dict[str, Any]:
     # 返回所有统计数据
     return {
         "stats": {
-            "total_members": total_members,
-            "total_devices": total_devices,
-            "online_devices": online_devices,
-            "total_fingerprints": total_fingerprints,
+            "total_members": totals.total_members,
+            "total_devices": totals.total_devices,
+            "online_devices": totals.online_devices,
+            "total_fingerprints": totals.total_fingerprints,
             "today_recognitions": today_recognitions,
             "today_success_rate": (today_success_recognitions / today_recognitions * 100) if today_recognitions > 0 else 0
         },
@@ -111,3 +127,79 @@ async def get_dashboard_statistics(db: Session) -> Dict[str, Any]:
         "device_recognition_stats": device_recognition_stats,
         "recent_logs": formatted_logs
     }
+
+
+def minute_retention_start() -> Optional[datetime]:
+    """分钟粒度汇总保留的最早时间，更早的分钟汇总已被清理；不清理时返回None"""
+    if MINUTE_RETENTION_DAYS <= 0:
+        return None
+    return datetime.now() - timedelta(days=MINUTE_RETENTION_DAYS)
+
+def choose_granularity(start: datetime, end: datetime) -> str:
+    """选择点数不超过上限、且覆盖整个时间范围的最细汇总粒度"""
+    span = (end - start).total_seconds()
+    retention_start = minute_retention_start()
+    for granularity, seconds in GRANULARITY_SECONDS.items():
+        if granularity == "minute" and retention_start and start < retention_start:
+            continue
+        if span / seconds <= TIMESERIES_MAX_POINTS:
+            return granularity
+    return "day"
+
+async def get_timeseries(
+    db: AsyncSession,
+    source: str,
+    start: datetime,
+    end: datetime,
+    granularity: Optional[str] = None,
+    device_id: Optional[int] = None,
+    branch_id: Optional[int] = None,
+    status: Optional[str] = None
+) -> Dict[str, Any]:
+    """从 log_rollups 读取识别/访问次数的时间序列，没有数据的时间桶补0"""
+    granularity = granularity or choose_granularity(start, end)
+    first_bucket = bucket_start(start, granularity)
+    
+    query = select(
+        models.LogRollup.bucket_start,
+        models.LogRollup.status,
+        func.sum(models.LogRollup.count).label("count")
+    ).where(
+        models.LogRollup.source == source,
+        models.LogRollup.granularity == granularity,
+        models.LogRollup.bucket_start >= first_bucket,
+        models.LogRollup.bucket_start < end
+    )
+    if device_id is not None:
+        query = query.where(models.LogRollup.device_id == device_id)
+    if branch_id is not None:
+        query = query.where(models.LogRollup.branch_id == branch_id)
+    if status:
+        query = query.where(models.LogRollup.status == status)
+    rows = (await db.execute(query.group_by(
+        models.LogRollup.bucket_start, models.LogRollup.status
+    ))).all()
+    
+    buckets: Dict[datetime, Dict[str, int]] = {}
+    for bucket, log_status, count in rows:
+        buckets.setdefault(bucket, {})[log_status] = int(count)
+    
+    step = timedelta(seconds=GRANULARITY_SECONDS[granularity])
+    points = []
+    bucket = first_bucket
+    while bucket < end:
+        by_status = buckets.get(bucket, {})
+        points.append({
+            "bucket_start": bucket.isoformat(),
+            "total": sum(by_status.values()),
+            "by_status": by_status
+        })
+        bucket += step
+    
+    return {
+        "source": source,
+        "granularity": granularity,
+        "start": first_bucket.isoformat(),
+        "end": end.isoformat(),
+        "points": points
+    }
@@ -0,0 +1,310 @@
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Set
+import asyncio
+import json
+import os
+import uuid
+
+# 事件总线后端：local（单进程）、redis（多个 worker 经本地 Redis 互通）、memory（测试用的内存代理）
+EVENT_BUS_BACKEND = os.getenv("EVENT_BUS_BACKEND", "local")
+EVENT_BUS_REDIS_URL = os.getenv("EVENT_BUS_REDIS_URL", "redis://localhost:6379/0")
+EVENT_BUS_CHANNEL = os.getenv("EVENT_BUS_CHANNEL", "gym:events")
+# Redis 订阅断开后重连的初始和最大等待时间（秒），每次失败等待时间翻倍
+EVENT_BUS_RECONNECT_DELAY = float(os.getenv("EVENT_BUS_RECONNECT_DELAY", "0.5"))
+EVENT_BUS_RECONNECT_MAX_DELAY = float(os.getenv("EVENT_BUS_RECONNECT_MAX_DELAY", "30"))
+
+# 事件处理函数：接收 {"topics": [...], "message": {...}, "coalesce_key": ...}
+EventHandler = Callable[[Dict[str, Any]], Awaitable[None]]
+# 控制事件处理函数：接收发布时的 payload，在线程池中执行
+ControlHandler = Callable[[Dict[str, Any]], None]
+
+
+class LocalBackend:
+    """进程内后端，只适用于单个 worker"""
+
+    name = "local"
+
+    def __init__(self):
+        self._handler: Optional[EventHandler] = None
+
+    async def start(self, handler: EventHandler):
+        self._handler = handler
+
+    async def publish(self, event: Dict[str, Any]):
+        if self._handler is not None:
+            await self._handler(event)
+
+    async def stop(self):
+        self._handler = None
+
+
+class InMemoryBroker:
+    """内存中的消息代理，在一个进程内模拟多个 worker 共用的 Redis 频道"""
+
+    def __init__(self):
+        self.subscribers: List[EventHandler] = []
+        self.published = 0
+
+    async def publish(self, data: str):
+        self.published += 1
+        for handler in list(self.subscribers):
+            await handler(json.loads(data))
+
+
+class MemoryBrokerBackend:
+    """连接到 InMemoryBroker 的后端，事件与 Redis 后端一样经序列化后投递给所有订阅者"""
+
+    name = "memory"
+
+    def __init__(self, broker: Optional[InMemoryBroker] = None):
+        self.broker = broker or InMemoryBroker()
+        self._handler: Optional[EventHandler] = None
+
+    async def start(self, handler: EventHandler):
+        self._handler = handler
+        self.broker.subscribers.append(handler)
+
+    async def publish(self, event: Dict[str, Any]):
+        await self.broker.publish(json.dumps(event))
+
+    async def stop(self):
+        if self._handler in self.broker.subscribers:
+            self.broker.subscribers.remove(self._handler)
+        self._handler = None
+
+
+class RedisBackend:
+    """基于 Redis 发布/订阅的后端，每个 worker 订阅同一频道后各自推送给自己的连接
+
+    订阅连接断开（Redis 重启、网络中断）时按指数退避重新订阅，断开期间发布到频道的
+    事件会丢失，进程内索引由定期全量重载兜底。
+    """
+
+    name = "redis"
+
+    def __init__(self, url: str = EVENT_BUS_REDIS_URL, channel: str = EVENT_BUS_CHANNEL):
+        self.url = url
+        self.channel = channel
+        self._redis = None
+        self._pubsub = None
+        self._task: Optional[asyncio.Task] = None
+        self.reconnects = 0
+
+    async def start(self, handler: EventHandler):
+        try:
+            import redis.asyncio as redis
+        except ImportError:
+            raise RuntimeError("使用 redis 事件总线需要安装 redis 包: pip install redis")
+        self._redis = redis.from_url(self.url)
+        await self._subscribe()
+        self._task = asyncio.create_task(self._listen(handler))
+
+    async def _subscribe(self):
+        self._pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+        await self._pubsub.subscribe(self.channel)
+
+    async def _listen(self, handler: EventHandler):
+        delay = EVENT_BUS_RECONNECT_DELAY
+        while True:
+            try:
+                if self._pubsub is None:
+                    await self._subscribe()
+                    self.reconnects += 1
+                    print(f"事件总线已重新订阅 {self.channel}")
+                    delay = EVENT_BUS_RECONNECT_DELAY
+                async for item in self._pubsub.listen():
+                    try:
+                        await handler(json.loads(item["data"]))
+                    except Exception as e:
+                        print(f"处理事件失败: {e}")
+                error = "订阅连接已关闭"
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                error = e
+            print(f"事件总线订阅中断: {error}，{delay:.1f} 秒后重连")
+            await self._reset_pubsub()
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, EVENT_BUS_RECONNECT_MAX_DELAY)
+
+    async def _reset_pubsub(self):
+        pubsub, self._pubsub = self._pubsub, None
+        if pubsub is not None:
+            try:
+                await pubsub.close()
+            except Exception:
+                pass
+
+    async def publish(self, event: Dict[str, Any]):
+        await self._redis.publish(self.channel, json.dumps(event))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._pubsub is not None:
+            try:
+                await self._pubsub.unsubscribe(self.channel)
+            except Exception as e:
+                print(f"取消订阅失败: {e}")
+            await self._reset_pubsub()
+        if self._redis is not None:
+            await self._redis.close()
+            self._redis = None
+
+
+def create_backend(name: str = EVENT_BUS_BACKEND):
+    """按名称创建事件总线后端"""
+    if name == "local":
+        return LocalBackend()
+    if name == "redis":
+        return RedisBackend()
+    if name == "memory":
+        return MemoryBrokerBackend()
+    raise ValueError(f"未知的事件总线后端: {name}")
+
+
+class EventBus:
+    """WebSocket 事件总线
+
+    各路由只向总线发布带主题的事件，由总线交给后端分发；每个 worker 从后端收到事件后
+    推送给本进程的连接管理器，多个 worker 通过共享的后端（Redis）都能收到全部事件。
+    可在事件循环内或工作线程中发布。
+
+    控制事件（broadcast）不推送给连接，而是交给各 worker 注册的处理函数，用于通知其他
+    worker 同步进程内的状态；发布者自己不会再收到。
+    """
+
+    def __init__(self, backend=None):
+        self.backend = backend or LocalBackend()
+        # 标识本进程，便于在多个 worker 的统计中区分
+        self.worker_id = uuid.uuid4().hex
+        self._manager = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._tasks: Set[asyncio.Future] = set()
+        self._handlers: Dict[str, ControlHandler] = {}
+        self.started = False
+        # 统计信息
+        self.published = 0
+        self.received = 0
+        self.failed = 0
+
+    async def start(self, manager):
+        """绑定本进程的连接管理器并连接后端，在事件循环中调用"""
+        self._manager = manager
+        self._loop = asyncio.get_running_loop()
+        await self.backend.start(self._deliver)
+        self.started = True
+
+    async def stop(self):
+        self.started = False
+        await self.backend.stop()
+
+    async def _deliver(self, event: Dict[str, Any]):
+        """把后端收到的事件推送给本进程订阅了相关主题的连接"""
+        self.received += 1
+        if "control" in event:
+            await self._handle_control(event)
+            return
+        if self._manager is None:
+            return
+        await self._manager.publish(event["topics"], event["message"], event.get("coalesce_key"))
+
+    async def _handle_control(self, event: Dict[str, Any]):
+        if event.get("origin") == self.worker_id:
+            return
+        handler = self._handlers.get(event["control"])
+        if handler is None:
+            return
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, handler, event["payload"])
+        except Exception as e:
+            print(f"处理控制事件 {event['control']} 失败: {e}")
+            self.failed += 1
+
+    def register(self, name: str, handler: ControlHandler):
+        """注册控制事件的处理函数"""
+        self._handlers[name] = handler
+
+    def broadcast(self, name: str, payload: Dict[str, Any]):
+        """向其他 worker 发送控制事件，不等待完成，可在事件循环内或工作线程中调用"""
+        if not self.started or isinstance(self.backend, LocalBackend):
+            # 单进程时没有其他 worker
+            return
+        self._submit(self._send({"control": name, "payload": payload, "origin": self.worker_id}))
+
+    async def _send(self, event: Dict[str, Any]):
+        self.published += 1
+        try:
+            await self.backend.publish(event)
+        except Exception as e:
+            print(f"发布控制事件失败: {e}")
+            self.failed += 1
+
+    async def publish(
+        self,
+        topics: Iterable[str],
+        message: Dict[str, Any],
+        coalesce_key: Optional[str] = None,
+        local: bool = False
+    ):
+        """发布事件；local 为 True 时只推送给本进程的连接，用于只在本进程有意义的数据"""
+        event = {
+            "topics": list(topics),
+            "message": message,
+            "coalesce_key": coalesce_key
+        }
+        self.published += 1
+        try:
+            if local or not self.started:
+                await self._deliver(event)
+            else:
+                await self.backend.publish(event)
+        except Exception as e:
+            # 推送失败不影响业务请求
+            print(f"发布事件失败: {e}")
+            self.failed += 1
+
+    def publish_nowait(
+        self,
+        topics: Iterable[str],
+        message: Dict[str, Any],
+        coalesce_key: Optional[str] = None,
+        local: bool = False
+    ):
+        """不等待发布完成，可在事件循环内或工作线程中调用"""
+        self._submit(self.publish(topics, message, coalesce_key, local))
+
+    def _submit(self, coroutine):
+        loop = self._loop
+        if loop is None or loop.is_closed():
+            coroutine.close()
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            task = loop.create_task(coroutine)
+        else:
+            task = asyncio.run_coroutine_threadsafe(coroutine, loop)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def stats(self) -> dict:
+        return {
+            "backend": self.backend.name,
+            "worker_id": self.worker_id,
+            "started": self.started,
+            "reconnects": getattr(self.backend, "reconnects", 0),
+            "published": self.published,
+            "received": self.received,
+            "failed": self.failed
+        }
+
+
+# 全局事件总线
+event_bus = EventBus(create_backend())
@@ -0,0 +1,725 @@
+from sqlalchemy.orm import Session
+from dataclasses import dataclass, field, replace
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+import os
+import threading
+import time
+
+import numpy as np
+
+from sqlalchemy import or_
+
+from app.models import models
+from app.services import fingerprint_snapshot
+from app.services.fingerprint_shards import MappedMatrix, MatrixSegment, ShardedScorer, SharedMatrix, merge_top_k, top_k
+
+# 模板特征向量的维度（字节数），超长截断，不足的维度在中心化后补零
+TEMPLATE_DIM = int(os.getenv("FINGERPRINT_TEMPLATE_DIM", "512"))
+# 判定为匹配成功的最低置信度（0-100）
+MATCH_THRESHOLD = int(os.getenv("FINGERPRINT_MATCH_THRESHOLD", "60"))
+# 从数据库加载模板时每批读取的行数
+LOAD_BATCH_SIZE = 2000
+# 追加段与删除标记合计达到该数量时触发合并
+COMPACT_THRESHOLD = int(os.getenv("FINGERPRINT_COMPACT_THRESHOLD", "1000"))
+# 后台合并线程的检查间隔（秒），有未合并的变更时即使未达阈值也会合并
+COMPACT_INTERVAL = float(os.getenv("FINGERPRINT_COMPACT_INTERVAL", "300"))
+# 合并时每次复制的行数，限制临时内存占用
+COMPACT_CHUNK_ROWS = 65536
+
+
+def encode_template(template_data: bytes, dim: int = TEMPLATE_DIM) -> np.ndarray:
+    """将指纹模板字节编码为定长、L2归一化的float32特征向量"""
+    raw = np.frombuffer(template_data[:dim], dtype=np.uint8)
+    vector = np.zeros(dim, dtype=np.float32)
+    # 先中心化再补零，补齐的维度不引入常数偏移
+    vector[:raw.size] = raw.astype(np.float32) - 127.5
+    norm = np.linalg.norm(vector)
+    if norm > 0:
+        vector /= norm
+    return vector
+
+
+def score_to_confidence(score: float) -> int:
+    """将余弦相似度换算为0-100的置信度"""
+    return int(round(max(0.0, min(1.0, float(score))) * 100))
+
+
+@dataclass
+class MatchCandidate:
+    """1:N比对的候选结果"""
+    template_id: int
+    member_id: int
+    score: float
+    # 命中范围：device 表示在设备候选会员中命中，global 表示在全库中命中
+    scope: str = "global"
+
+    @property
+    def confidence(self) -> int:
+        return score_to_confidence(self.score)
+
+
+_EMPTY_IDS = np.zeros(0, dtype=np.int64)
+
+
+@dataclass(frozen=True)
+class GallerySnapshot:
+    """模板库的不可变快照
+
+    由共享内存或快照文件中的基础段、内存中的追加段和基础段的删除标记组成。
+    写操作生成新的快照并整体替换，读者始终在一个一致的快照上比对。
+    """
+    base: MatrixSegment
+    base_size: int
+    base_template_ids: np.ndarray
+    base_member_ids: np.ndarray
+    # 已删除的基础段行号，升序
+    tombstones: np.ndarray = field(default_factory=lambda: _EMPTY_IDS)
+    append_matrix: Optional[np.ndarray] = None
+    append_template_ids: np.ndarray = field(default_factory=lambda: _EMPTY_IDS)
+    append_member_ids: np.ndarray = field(default_factory=lambda: _EMPTY_IDS)
+    generation: int = 0
+    # 基础段按会员ID排序的行号及排序后的会员ID，用于按会员集合定位行
+    base_member_order: np.ndarray = field(default_factory=lambda: _EMPTY_IDS)
+    base_sorted_member_ids: np.ndarray = field(default_factory=lambda: _EMPTY_IDS)
+
+    @property
+    def append_size(self) -> int:
+        return int(self.append_template_ids.size)
+
+    @property
+    def size(self) -> int:
+        return self.base_size - int(self.tombstones.size) + self.append_size
+
+    @property
+    def pending_changes(self) -> int:
+        return int(self.tombstones.size) + self.append_size
+
+    def contains(self, template_id: int) -> bool:
+        # 基础段按模板ID升序排列
+        row = int(np.searchsorted(self.base_template_ids, template_id))
+        if row < self.base_size and self.base_template_ids[row] == template_id:
+            index = int(np.searchsorted(self.tombstones, row))
+            return not (index < self.tombstones.size and self.tombstones[index] == row)
+        return bool(np.any(self.append_template_ids == template_id))
+
+    def with_added(self, template_id: int, member_id: int, vector: np.ndarray) -> "GallerySnapshot":
+        return self.with_appended(
+            np.array([template_id], dtype=np.int64),
+            np.array([member_id], dtype=np.int64),
+            vector[np.newaxis, :]
+        )
+
+    def with_appended(self, template_ids: np.ndarray, member_ids: np.ndarray, vectors: np.ndarray) -> "GallerySnapshot":
+        if self.append_matrix is None:
+            append_matrix = np.array(vectors, dtype=np.float32)
+        else:
+            append_matrix = np.vstack([self.append_matrix, vectors])
+        return replace(
+            self,
+            append_matrix=append_matrix,
+            append_template_ids=np.concatenate([self.append_template_ids, template_ids]),
+            append_member_ids=np.concatenate([self.append_member_ids, member_ids]),
+            generation=self.generation + 1,
+        )
+
+    def with_removed(self, template_ids: np.ndarray) -> "GallerySnapshot":
+        template_ids = np.asarray(template_ids, dtype=np.int64)
+        rows = np.searchsorted(self.base_template_ids, template_ids)
+        hit = rows < self.base_size
+        hit[hit] = self.base_template_ids[rows[hit]] == template_ids[hit]
+        tombstones = np.union1d(self.tombstones, rows[hit]).astype(np.int64)
+
+        keep = ~np.isin(self.append_template_ids, template_ids)
+        append_matrix = self.append_matrix
+        if append_matrix is not None and not keep.all():
+            append_matrix = append_matrix[keep] if keep.any() else None
+        return replace(
+            self,
+            tombstones=tombstones,
+            append_matrix=append_matrix,
+            append_template_ids=self.append_template_ids[keep],
+            append_member_ids=self.append_member_ids[keep],
+            generation=self.generation + 1,
+        )
+
+    def member_base_rows(self, member_ids: np.ndarray) -> np.ndarray:
+        """返回指定会员（升序ID数组）在基础段中的行号，未排除删除标记"""
+        left = np.searchsorted(self.base_sorted_member_ids, member_ids, side="left")
+        right = np.searchsorted(self.base_sorted_member_ids, member_ids, side="right")
+        present = right > left
+        if not present.any():
+            return _EMPTY_IDS
+        return np.concatenate([
+            self.base_member_order[start:end]
+            for start, end in zip(left[present], right[present])
+        ])
+
+    def member_template_ids(self, member_id: int) -> np.ndarray:
+        """返回会员在快照中的全部有效模板ID"""
+        base_rows = self.member_base_rows(np.array([member_id], dtype=np.int64))
+        base_rows = base_rows[~np.isin(base_rows, self.tombstones)]
+        return np.concatenate([
+            self.base_template_ids[base_rows],
+            self.append_template_ids[self.append_member_ids == member_id]
+        ])
+
+
+def _member_order(member_ids: np.ndarray) -> dict:
+    order = np.argsort(member_ids, kind="stable")
+    return {"base_member_order": order, "base_sorted_member_ids": member_ids[order]}
+
+
+def _empty_snapshot(dim: int) -> GallerySnapshot:
+    return GallerySnapshot(
+        base=SharedMatrix(0, dim),
+        base_size=0,
+        base_template_ids=_EMPTY_IDS,
+        base_member_ids=_EMPTY_IDS,
+    )
+
+
+class TemplateGallery:
+    """内存中的指纹模板库
+
+    所有模板编码后存放在共享内存（或启动时映射的快照文件）中一块连续的
+    (N, TEMPLATE_DIM) float32 矩阵里，
+    识别时用矩阵向量乘法对整个模板库打分；模板数较多时由进程池分片并行打分。
+    录入的模板进入追加段、删除的模板记为删除标记，立即对识别生效，
+    再由后台线程合并成新的基础段。
+    """
+
+    def __init__(self, dim: int = TEMPLATE_DIM, scorer: Optional[ShardedScorer] = None):
+        self.dim = dim
+        self.scorer = scorer or ShardedScorer()
+        self._snapshot = _empty_snapshot(dim)
+        # 保护快照引用的读取和替换，持有时间极短
+        self._lock = threading.Lock()
+        # 串行化写操作与合并的开始和结束
+        self._write_lock = threading.Lock()
+        # 合并或加载期间发生的写操作，完成后在新快照上重放
+        self._op_logs: List[List[Tuple]] = []
+        # 进行中的合并所记录的写操作
+        self._pending_ops: Optional[List[Tuple]] = None
+        self._compactor: Optional[threading.Thread] = None
+        self._compact_event = threading.Event()
+        self._stopping = False
+        # 设备ID -> (基础段, 候选索引版本, 基础段行号)
+        self._scope_rows: Dict[int, Tuple[MatrixSegment, int, np.ndarray]] = {}
+        self.loaded = False
+        self.loaded_at: Optional[datetime] = None
+        self.load_seconds = 0.0
+        self.snapshot_generation = 0
+        self.restored_from_snapshot = False
+        self.delta_rows = 0
+        self._snapshot_dirty = False
+        self.compaction_count = 0
+        self.last_compaction_at: Optional[datetime] = None
+        self.last_compaction_seconds = 0.0
+        # 比对耗时统计
+        self.match_count = 0
+        self.last_match_ms = 0.0
+        self.total_match_ms = 0.0
+        self.scoped_hits = 0
+        self.global_fallbacks = 0
+        self.verify_count = 0
+        self.last_verify_ms = 0.0
+
+    def _swap(self, snapshot: GallerySnapshot):
+        with self._lock:
+            previous = self._snapshot
+            self._snapshot = snapshot
+        if previous.base is not snapshot.base:
+            previous.base.retire()
+
+    def _acquire_snapshot(self) -> GallerySnapshot:
+        """取得当前快照并持有其基础段，用完后调用 snapshot.base.release()"""
+        with self._lock:
+            snapshot = self._snapshot
+            snapshot.base.acquire()
+        return snapshot
+
+    def _start_recording(self) -> List[Tuple]:
+        """开始记录写操作，调用方持有 _write_lock"""
+        ops: List[Tuple] = []
+        self._op_logs.append(ops)
+        return ops
+
+    def _stop_recording(self, ops: List[Tuple]):
+        """停止记录写操作，调用方持有 _write_lock"""
+        self._op_logs = [log for log in self._op_logs if log is not ops]
+
+    def _record(self, op: Tuple):
+        for ops in self._op_logs:
+            ops.append(op)
+
+    @staticmethod
+    def _replay(snapshot: GallerySnapshot, ops: List[Tuple]) -> GallerySnapshot:
+        """在新快照上重放记录的写操作"""
+        for op in ops:
+            if op[0] == "add":
+                _, template_id, member_id, vector = op
+                if not snapshot.contains(template_id):
+                    snapshot = snapshot.with_added(template_id, member_id, vector)
+            else:
+                snapshot = snapshot.with_removed(op[1])
+        return snapshot
+
+    def load(self, db: Session):
+        """从数据库全量加载指纹模板，读取期间的录入和删除在加载完成后重放"""
+        started = time.perf_counter()
+        with self._write_lock:
+            ops = self._start_recording()
+        try:
+            total = db.query(models.FingerprintTemplate).count()
+            matrix = SharedMatrix(total, self.dim)
+            template_ids = np.empty(total, dtype=np.int64)
+            member_ids = np.empty(total, dtype=np.int64)
+
+            rows = db.query(
+                models.FingerprintTemplate.id,
+                models.FingerprintTemplate.member_id,
+                models.FingerprintTemplate.template_data
+            ).order_by(models.FingerprintTemplate.id).yield_per(LOAD_BATCH_SIZE)
+
+            count = 0
+            for template_id, member_id, template_data in rows:
+                if count >= total:
+                    break
+                matrix.array[count] = encode_template(template_data, self.dim)
+                template_ids[count] = template_id
+                member_ids[count] = member_id
+                count += 1
+        except Exception:
+            with self._write_lock:
+                self._stop_recording(ops)
+            raise
+
+        with self._write_lock:
+            self._stop_recording(ops)
+            snapshot = self._replay(GallerySnapshot(
+                base=matrix,
+                base_size=count,
+                base_template_ids=template_ids[:count],
+                base_member_ids=member_ids[:count],
+                **_member_order(member_ids[:count]),
+            ), ops)
+            self._swap(replace(snapshot, generation=self._snapshot.generation + 1))
+            self.loaded = True
+            self.loaded_at = datetime.now()
+            self.load_seconds = time.perf_counter() - started
+            self.restored_from_snapshot = False
+            self.delta_rows = 0
+        # 全量加载后由后台线程写出快照
+        self._snapshot_dirty = True
+        self._compact_event.set()
+
+    def restore(self, db: Session):
+        """启动时从磁盘快照恢复，只从数据库补齐水位线之后的变更；没有可用快照时全量加载"""
+        started = time.perf_counter()
+        opened = fingerprint_snapshot.open_latest(self.dim)
+        if opened is None:
+            self.load(db)
+            return
+
+        with self._write_lock:
+            ops = self._start_recording()
+        try:
+            snapshot, delta_rows = self._restore_delta(db, *opened)
+        except Exception:
+            with self._write_lock:
+                self._stop_recording(ops)
+            opened[1].retire()
+            raise
+
+        with self._write_lock:
+            self._stop_recording(ops)
+            snapshot = self._replay(snapshot, ops)
+            self._swap(replace(snapshot, generation=self._snapshot.generation + 1))
+            self.snapshot_generation = opened[0].generation
+            self.restored_from_snapshot = True
+            self.delta_rows = delta_rows
+            self.loaded = True
+            self.loaded_at = datetime.now()
+            self.load_seconds = time.perf_counter() - started
+        self._maybe_schedule_compaction()
+
+    def _restore_delta(
+        self,
+        db: Session,
+        header: fingerprint_snapshot.SnapshotHeader,
+        matrix: MappedMatrix,
+        template_ids: np.ndarray,
+        member_ids: np.ndarray
+    ) -> Tuple[GallerySnapshot, int]:
+        """在快照之上补齐数据库中的变更，返回 (快照, 补齐的行数)"""
+        snapshot = GallerySnapshot(
+            base=matrix,
+            base_size=header.count,
+            base_template_ids=template_ids,
+            base_member_ids=member_ids,
+            **_member_order(member_ids),
+        )
+
+        # 只读取ID列，找出快照之后删除的模板和水位线以内缺失的模板
+        db_ids = np.fromiter(
+            (row[0] for row in db.query(models.FingerprintTemplate.id).filter(
+                models.FingerprintTemplate.id <= header.watermark
+            ).yield_per(50000)),
+            dtype=np.int64
+        )
+        deleted = np.setdiff1d(template_ids, db_ids, assume_unique=True)
+        missing = np.setdiff1d(db_ids, template_ids, assume_unique=True)
+        if deleted.size:
+            snapshot = snapshot.with_removed(deleted)
+
+        # 读取水位线之后新增的模板数据
+        delta_ids, delta_members, delta_vectors = [], [], []
+        conditions = [models.FingerprintTemplate.id > header.watermark]
+        for start in range(0, missing.size, 1000):
+            conditions.append(models.FingerprintTemplate.id.in_(missing[start:start + 1000].tolist()))
+        rows = db.query(
+            models.FingerprintTemplate.id,
+            models.FingerprintTemplate.member_id,
+            models.FingerprintTemplate.template_data
+        ).filter(or_(*conditions)).order_by(models.FingerprintTemplate.id).yield_per(LOAD_BATCH_SIZE)
+        for template_id, member_id, template_data in rows:
+            delta_ids.append(template_id)
+            delta_members.append(member_id)
+            delta_vectors.append(encode_template(template_data, self.dim))
+        if delta_ids:
+            snapshot = snapshot.with_appended(
+                np.array(delta_ids, dtype=np.int64),
+                np.array(delta_members, dtype=np.int64),
+                np.vstack(delta_vectors)
+            )
+        return snapshot, int(deleted.size) + len(delta_ids)
+
+    def ensure_loaded(self, db: Session):
+        if not self.loaded:
+            self.restore(db)
+
+    def write_snapshot(self):
+        """把当前基础段写成新的磁盘快照，并清理旧快照"""
+        snapshot = self._acquire_snapshot()
+        try:
+            if isinstance(snapshot.base, MappedMatrix) and snapshot.base.path:
+                # 基础段本身就是最新的快照文件
+                return
+            generation = max(self.snapshot_generation, fingerprint_snapshot.latest_generation()) + 1
+            path, generation = fingerprint_snapshot.write_snapshot(
+                snapshot.base.array[:snapshot.base_size],
+                snapshot.base_template_ids,
+                snapshot.base_member_ids,
+                generation
+            )
+        finally:
+            snapshot.base.release()
+        self.snapshot_generation = generation
+
+        current = self._snapshot.base
+        for old_path in fingerprint_snapshot.list_snapshots():
+            if old_path == path:
+                continue
+            if isinstance(current, MappedMatrix) and current.path == old_path:
+                # 本进程仍在使用的映射文件在释放时删除
+                current.obsolete = True
+                continue
+            # 其他服务进程仍映射着的文件被跳过，由之后的清理删除
+            fingerprint_snapshot.remove_unused(old_path)
+
+    def add(self, template_id: int, member_id: int, template_data: bytes):
+        """录入模板后调用，模板立即进入追加段参与比对"""
+        vector = encode_template(template_data, self.dim)
+        with self._write_lock:
+            if self._snapshot.contains(template_id):
+                return
+            self._swap(self._snapshot.with_added(template_id, member_id, vector))
+            self._record(("add", template_id, member_id, vector))
+            self._maybe_schedule_compaction()
+
+    def remove(self, *template_ids: int):
+        """删除模板后调用，模板立即不再参与比对"""
+        if not template_ids:
+            return
+        ids = np.array(template_ids, dtype=np.int64)
+        with self._write_lock:
+            self._swap(self._snapshot.with_removed(ids))
+            self._record(("remove", ids))
+            self._maybe_schedule_compaction()
+
+    def member_template_ids(self, member_id: int) -> List[int]:
+        return [int(template_id) for template_id in self._snapshot.member_template_ids(member_id)]
+
+    def _maybe_schedule_compaction(self):
+        if self._snapshot.pending_changes >= COMPACT_THRESHOLD:
+            self._compact_event.set()
+
+    def compact(self):
+        """把追加段和删除标记合并为新的基础段，合并期间读写均不阻塞"""
+        with self._write_lock:
+            if self._pending_ops is not None or self._snapshot.pending_changes == 0:
+                return
+            self._pending_ops = self._start_recording()
+            source = self._acquire_snapshot()
+
+        started = time.perf_counter()
+        try:
+            compacted = self._build_compacted(source)
+        except Exception:
+            with self._write_lock:
+                self._stop_recording(self._pending_ops)
+                self._pending_ops = None
+            raise
+        finally:
+            source.base.release()
+
+        with self._write_lock:
+            ops = self._pending_ops
+            self._stop_recording(ops)
+            self._pending_ops = None
+            if self._snapshot.base is not source.base:
+                # 合并期间已重新全量加载，合并结果已过时
+                compacted.base.retire()
+                return
+            # 在新的基础段上重放合并期间的写操作
+            compacted = self._replay(compacted, ops)
+            self._swap(replace(compacted, generation=self._snapshot.generation + 1))
+            self.compaction_count += 1
+            self.last_compaction_at = datetime.now()
+            self.last_compaction_seconds = time.perf_counter() - started
+            self._snapshot_dirty = True
+
+    def _build_compacted(self, source: GallerySnapshot) -> GallerySnapshot:
+        keep = np.ones(source.base_size, dtype=bool)
+        keep[source.tombstones] = False
+        base_rows = np.nonzero(keep)[0]
+        template_ids = np.concatenate([source.base_template_ids[base_rows], source.append_template_ids])
+        member_ids = np.concatenate([source.base_member_ids[base_rows], source.append_member_ids])
+        order = np.argsort(template_ids, kind="stable")
+
+        size = int(template_ids.size)
+        matrix = SharedMatrix(size, self.dim)
+        for start in range(0, size, COMPACT_CHUNK_ROWS):
+            chunk = order[start:start + COMPACT_CHUNK_ROWS]
+            from_base = chunk < base_rows.size
+            targets = np.arange(start, start + chunk.size)
+            matrix.array[targets[from_base]] = source.base.array[base_rows[chunk[from_base]]]
+            if not from_base.all():
+                matrix.array[targets[~from_base]] = source.append_matrix[chunk[~from_base] - base_rows.size]
+
+        return GallerySnapshot(
+            base=matrix,
+            base_size=size,
+            base_template_ids=template_ids[order],
+            base_member_ids=member_ids[order],
+            **_member_order(member_ids[order]),
+        )
+
+    def start_compactor(self):
+        """启动后台合并线程"""
+        if self._compactor is not None:
+            return
+        self._stopping = False
+        self._compactor = threading.Thread(target=self._run_compactor, name="fingerprint-compactor", daemon=True)
+        self._compactor.start()
+
+    def _run_compactor(self):
+        while True:
+            self._compact_event.wait(COMPACT_INTERVAL)
+            self._compact_event.clear()
+            if self._stopping:
+                return
+            try:
+                self.compact()
+            except Exception as e:
+                print(f"合并指纹模板库失败: {e}")
+            if self._snapshot_dirty:
+                self._snapshot_dirty = False
+                try:
+                    self.write_snapshot()
+                except Exception as e:
+                    print(f"写入指纹模板库快照失败: {e}")
+
+    def match(self, template_data: bytes, top_k_count: int = 1) -> List[MatchCandidate]:
+        """对整个模板库进行1:N比对，按得分从高到低返回前top_k_count个候选"""
+        started = time.perf_counter()
+        probe = encode_template(template_data, self.dim)
+
+        # 持有一个快照，比对期间的写操作和合并不影响本次结果
+        snapshot = self._acquire_snapshot()
+        try:
+            base_indices, base_scores = self.scorer.score(
+                snapshot.base, snapshot.base_size, probe, top_k_count, snapshot.tombstones
+            )
+        finally:
+            snapshot.base.release()
+
+        # 追加段规模很小，直接在当前进程打分；下标整体偏移到基础段之后
+        append_indices, append_scores = _EMPTY_IDS, np.zeros(0, dtype=np.float32)
+        if snapshot.append_matrix is not None:
+            scores = snapshot.append_matrix @ probe
+            append_indices = top_k(scores, top_k_count)
+            append_scores = scores[append_indices]
+            append_indices = append_indices + snapshot.base_size
+
+        indices, scores = merge_top_k(
+            [base_indices, append_indices], [base_scores, append_scores], top_k_count
+        )
+        candidates = []
+        for index, score in zip(indices, scores):
+            if not np.isfinite(score):
+                continue
+            if index < snapshot.base_size:
+                template_id = snapshot.base_template_ids[index]
+                member_id = snapshot.base_member_ids[index]
+            else:
+                template_id = snapshot.append_template_ids[index - snapshot.base_size]
+                member_id = snapshot.append_member_ids[index - snapshot.base_size]
+            candidates.append(MatchCandidate(
+                template_id=int(template_id),
+                member_id=int(member_id),
+                score=float(score)
+            ))
+
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        self.match_count += 1
+        self.last_match_ms = elapsed_ms
+        self.total_match_ms += elapsed_ms
+        return candidates
+
+    def match_scoped(
+        self,
+        template_data: bytes,
+        scope_key: Optional[int],
+        scope_version: int,
+        member_ids: np.ndarray,
+        top_k_count: int = 1
+    ) -> List[MatchCandidate]:
+        """只在指定会员集合的模板中比对，集合在基础段中的行号按 scope_key 缓存"""
+        probe = encode_template(template_data, self.dim)
+        snapshot = self._acquire_snapshot()
+        try:
+            # 基础段行号只在基础段替换或候选集合变化时重新计算
+            cached = self._scope_rows.get(scope_key) if scope_key is not None else None
+            if cached is not None and cached[0] is snapshot.base and cached[1] == scope_version:
+                base_rows = cached[2]
+            else:
+                base_rows = snapshot.member_base_rows(member_ids)
+                if scope_key is not None:
+                    self._scope_rows[scope_key] = (snapshot.base, scope_version, base_rows)
+            if snapshot.tombstones.size and base_rows.size:
+                base_rows = base_rows[~np.isin(base_rows, snapshot.tombstones)]
+            append_rows = np.nonzero(np.isin(snapshot.append_member_ids, member_ids))[0]
+
+            scores = np.zeros(0, dtype=np.float32)
+            if base_rows.size:
+                scores = snapshot.base.array[base_rows] @ probe
+        finally:
+            snapshot.base.release()
+        if append_rows.size:
+            scores = np.concatenate([scores, snapshot.append_matrix[append_rows] @ probe])
+
+        candidates = []
+        for index in top_k(scores, top_k_count):
+            if index < base_rows.size:
+                row = base_rows[index]
+                template_id, member_id = snapshot.base_template_ids[row], snapshot.base_member_ids[row]
+            else:
+                row = append_rows[index - base_rows.size]
+                template_id, member_id = snapshot.append_template_ids[row], snapshot.append_member_ids[row]
+            candidates.append(MatchCandidate(
+                template_id=int(template_id),
+                member_id=int(member_id),
+                score=float(scores[index]),
+                scope="device"
+            ))
+        return candidates
+
+    def identify(
+        self,
+        template_data: bytes,
+        scope: Optional[Tuple[int, int, np.ndarray]] = None
+    ) -> Optional[MatchCandidate]:
+        """返回置信度达到阈值的最佳候选，没有则返回None
+
+        scope 为 (设备ID, 候选索引版本, 候选会员ID数组) 时先在候选会员中比对，
+        未命中再回退到全库比对。
+        """
+        if scope is not None and scope[2].size:
+            started = time.perf_counter()
+            candidates = self.match_scoped(template_data, *scope)
+            if candidates and candidates[0].confidence >= MATCH_THRESHOLD:
+                elapsed_ms = (time.perf_counter() - started) * 1000
+                self.match_count += 1
+                self.last_match_ms = elapsed_ms
+                self.total_match_ms += elapsed_ms
+                self.scoped_hits += 1
+                return candidates[0]
+            self.global_fallbacks += 1
+
+        candidates = self.match(template_data, top_k_count=1)
+        if candidates and candidates[0].confidence >= MATCH_THRESHOLD:
+            return candidates[0]
+        return None
+
+    def verify(self, template_data: bytes, member_id: int) -> Optional[MatchCandidate]:
+        """1:1比对：只与指定会员的模板比对，达到阈值时返回最佳候选"""
+        started = time.perf_counter()
+        candidates = self.match_scoped(template_data, None, 0, np.array([member_id], dtype=np.int64))
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        self.verify_count += 1
+        self.last_verify_ms = elapsed_ms
+        if candidates and candidates[0].confidence >= MATCH_THRESHOLD:
+            return candidates[0]
+        return None
+
+    def stats(self) -> dict:
+        snapshot = self._snapshot
+        append_bytes = snapshot.append_matrix.nbytes if snapshot.append_matrix is not None else 0
+        return {
+            "loaded": self.loaded,
+            "loaded_at": self.loaded_at,
+            "load_seconds": round(self.load_seconds, 3),
+            "gallery_size": snapshot.size,
+            "base_size": snapshot.base_size,
+            "append_size": snapshot.append_size,
+            "tombstones": int(snapshot.tombstones.size),
+            "generation": snapshot.generation,
+            "template_dim": self.dim,
+            "memory_bytes": int(
+                snapshot.base.nbytes + append_bytes
+                + snapshot.base_template_ids.nbytes + snapshot.base_member_ids.nbytes
+            ),
+            "restored_from_snapshot": self.restored_from_snapshot,
+            "snapshot_generation": self.snapshot_generation,
+            "delta_rows": self.delta_rows,
+            "match_workers": self.scorer.workers,
+            "parallel_min_rows": self.scorer.min_rows,
+            "compaction_count": self.compaction_count,
+            "last_compaction_at": self.last_compaction_at,
+            "last_compaction_seconds": round(self.last_compaction_seconds, 3),
+            "scoped_hits": self.scoped_hits,
+            "global_fallbacks": self.global_fallbacks,
+            "verify_count": self.verify_count,
+            "last_verify_ms": round(self.last_verify_ms, 3),
+            "match_count": self.match_count,
+            "last_match_ms": round(self.last_match_ms, 3),
+            "avg_match_ms": round(self.total_match_ms / self.match_count, 3) if self.match_count else 0.0,
+            "match_threshold": MATCH_THRESHOLD
+        }
+
+    def close(self):
+        """停止合并线程、关闭比对进程池并释放共享内存"""
+        if self._compactor is not None:
+            self._stopping = True
+            self._compact_event.set()
+            self._compactor.join()
+            self._compactor = None
+        self.scorer.shutdown()
+        with self._write_lock:
+            self._swap(_empty_snapshot(self.dim))
+
+
+# 全局指纹模板库
+template_gallery = TemplateGallery()
@@ -0,0 +1,342 @@
+from starlette.concurrency import run_in_threadpool
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Awaitable, Callable, Optional
+from datetime import datetime
+import base64
+
+from app.database.database import SessionLocal, AsyncSessionLocal
+from app.models import models
+from app.api.fingerprint import schemas
+from app.websocket.connection_manager import event_topics
+from app.services.fingerprint_matcher import template_gallery
+from app.services.candidate_index import candidate_index
+from app.services.middleware_client import middleware_client, MiddlewareError
+from app.services.stats_aggregator import live_stats
+from app.services.event_bus import event_bus
+from app.services.index_sync import publish_change
+
+# 进度回调：接收一条进度说明
+Progress = Callable[[str], Awaitable[None]]
+
+
+async def _report(progress: Optional[Progress], message: str):
+    if progress is not None:
+        await progress(message)
+
+
+def ensure_indexes_loaded():
+    """启动时加载失败的内存索引在首次识别时补加载（在线程池中执行）"""
+    if template_gallery.loaded and candidate_index.loaded:
+        return
+    db = SessionLocal()
+    try:
+        template_gallery.ensure_loaded(db)
+        candidate_index.ensure_loaded(db)
+    finally:
+        db.close()
+
+
+async def enroll_fingerprint(
+    db: AsyncSession,
+    request: schemas.FingerprintEnrollRequest,
+    progress: Optional[Progress] = None
+) -> schemas.FingerprintEnrollResponse:
+    """在设备上采集并录入指纹，会员或设备不存在时抛出 LookupError"""
+    # 检查会员是否存在
+    member = await db.get(models.Member, request.member_id)
+    if not member:
+        raise LookupError("会员不存在")
+
+    # 检查设备是否存在
+    device = await db.get(models.Device, request.device_id)
+    if not device:
+        raise LookupError("设备不存在")
+
+    # 检查设备是否在线
+    if device.status != "online":
+        return schemas.FingerprintEnrollResponse(
+            success=False,
+            message="设备离线，无法录入指纹"
+        )
+
+    # 录入结果只推送给订阅了该事件、设备或设备所属分支的客户端
+    topics = event_topics("enrollment_status", device.id, device.branch_id)
+
+    # 检查该手指是否已经录入过指纹
+    existing_template = await db.scalar(select(models.FingerprintTemplate.id).where(
+        models.FingerprintTemplate.member_id == request.member_id,
+        models.FingerprintTemplate.finger_index == request.finger_index
+    ).limit(1))
+
+    if existing_template:
+        return schemas.FingerprintEnrollResponse(
+            success=False,
+            message=f"该手指(索引: {request.finger_index})已录入指纹，请先删除"
+        )
+
+    try:
+        # 调用中间件服务采集指纹模板
+        await _report(progress, "请在设备上按压手指")
+        result = await middleware_client.enroll_fingerprint(device.ip_address, request.finger_index)
+        if not result.get("success"):
+            raise MiddlewareError(result.get("message", "设备未返回指纹模板"))
+        template_data = base64.b64decode(result.get("templateData") or "")
+        if not template_data:
+            raise MiddlewareError("设备未返回指纹模板")
+
+        # 创建指纹模板记录
+        db_template = models.FingerprintTemplate(
+            member_id=request.member_id,
+            template_data=template_data,
+            finger_index=request.finger_index,
+            quality=result.get("quality")
+        )
+        db.add(db_template)
+
+        # 创建录入记录
+        db_enrollment_log = models.EnrollmentLog(
+            member_id=request.member_id,
+            device_id=request.device_id,
+            status="success",
+            finger_index=request.finger_index
+        )
+        db.add(db_enrollment_log)
+
+        await db.commit()
+    except Exception as e:
+        await db.rollback()
+        # 创建录入失败记录
+        db_enrollment_log = models.EnrollmentLog(
+            member_id=request.member_id,
+            device_id=request.device_id,
+            status="failed",
+            finger_index=request.finger_index
+        )
+        db.add(db_enrollment_log)
+        await db.commit()
+
+        # 通过事件总线推送录入失败消息
+        await event_bus.publish(topics, {
+            "type": "enrollment_status",
+            "success": False,
+            "message": f"指纹录入失败: {str(e)}",
+            "member_id": request.member_id,
+            "finger_index": request.finger_index
+        })
+
+        return schemas.FingerprintEnrollResponse(
+            success=False,
+            message=f"指纹录入失败: {str(e)}"
+        )
+
+    # 模板已提交，之后的步骤失败不再记为录入失败
+    try:
+        # 新模板进入内存模板库的追加段，立即参与识别
+        template_gallery.add(db_template.id, db_template.member_id, db_template.template_data)
+    except Exception as e:
+        # 模板已在数据库中，重启加载模板库时会补齐
+        print(f"模板 {db_template.id} 加入内存模板库失败: {e}")
+    # 其他 worker 从数据库读取该模板加入各自的模板库
+    publish_change("template", db_template.id)
+
+    # 通过事件总线推送录入成功消息
+    await event_bus.publish(topics, {
+        "type": "enrollment_status",
+        "success": True,
+        "message": "指纹录入成功",
+        "member_id": request.member_id,
+        "finger_index": request.finger_index
+    })
+
+    return schemas.FingerprintEnrollResponse(
+        success=True,
+        message="指纹录入成功",
+        template_id=db_template.id
+    )
+
+
+async def recognize_fingerprint(
+    db: AsyncSession,
+    request: schemas.FingerprintRecognitionRequest,
+    progress: Optional[Progress] = None
+) -> schemas.FingerprintRecognitionResponse:
+    """识别指纹，请求未携带模板时在设备上采集，设备不存在时抛出 LookupError"""
+    # 检查设备是否存在
+    device = await db.get(models.Device, request.device_id)
+    if not device:
+        raise LookupError("设备不存在")
+
+    # 检查设备是否在线
+    if device.status != "online":
+        return schemas.FingerprintRecognitionResponse(
+            success=False,
+            message="设备离线，无法识别指纹",
+            timestamp=datetime.now()
+        )
+    # 回滚后设备对象会过期，提前确定推送的主题
+    topics = event_topics("recognition_status", device.id, device.branch_id)
+
+    # 请求未携带探针模板时，由中间件在设备上采集
+    template_data = request.template_data
+    # 中间件只返回设备端比对结果（用户ID）而没有模板时，按设备端结果处理
+    device_match = None
+    if not template_data:
+        await _report(progress, "请在设备上按压手指")
+        try:
+            result = await middleware_client.recognize_fingerprint(device.ip_address)
+        except MiddlewareError as e:
+            return schemas.FingerprintRecognitionResponse(
+                success=False,
+                message=f"指纹采集失败: {str(e)}",
+                timestamp=datetime.now()
+            )
+        if result.get("success"):
+            template_data = result.get("templateData")
+            if not template_data and result.get("userId") is not None:
+                device_match = (int(result["userId"]), int(result.get("confidence") or 0))
+
+    # 解码探针模板
+    try:
+        probe = base64.b64decode(template_data) if template_data else None
+    except ValueError:
+        probe = None
+    if not probe and device_match is None:
+        return schemas.FingerprintRecognitionResponse(
+            success=False,
+            message="未采集到有效的指纹模板",
+            timestamp=datetime.now()
+        )
+
+    try:
+        member = None
+        confidence = 0
+        template_id = None
+        if probe:
+            # 在内存模板库中进行1:N比对，放到线程池执行避免阻塞事件循环
+            # 先在可使用该设备的会员中比对，未命中再回退到全库
+            await run_in_threadpool(ensure_indexes_loaded)
+            version, member_ids = candidate_index.candidates(device.id)
+            candidate = await run_in_threadpool(
+                template_gallery.identify, probe, (device.id, version, member_ids)
+            )
+            if candidate:
+                member = await db.get(models.Member, candidate.member_id)
+                confidence = candidate.confidence
+                template_id = candidate.template_id
+        else:
+            member_id, confidence = device_match
+            member = await db.get(models.Member, member_id)
+
+        if member:
+            # 创建识别成功记录
+            db_recognition_log = models.RecognitionLog(
+                member_id=member.id,
+                device_id=request.device_id,
+                status="success",
+                confidence=confidence
+            )
+            db.add(db_recognition_log)
+            await db.commit()
+            live_stats.record_recognition(
+                db_recognition_log.id, member.name, device.id, device.name,
+                "success", confidence, db_recognition_log.recognized_at
+            )
+
+            # 通过事件总线推送识别成功消息
+            await event_bus.publish(topics, {
+                "type": "recognition_status",
+                "success": True,
+                "message": "指纹识别成功",
+                "member": {
+                    "id": member.id,
+                    "name": member.name,
+                    "phone": member.phone
+                },
+                "confidence": confidence,
+                "timestamp": datetime.now().isoformat()
+            })
+
+            return schemas.FingerprintRecognitionResponse(
+                success=True,
+                message="指纹识别成功",
+                member=schemas.RecognizedMember(
+                    id=member.id,
+                    name=member.name,
+                    phone=member.phone,
+                    confidence=confidence,
+                    template_id=template_id
+                ),
+                timestamp=datetime.now()
+            )
+        else:
+            # 创建识别失败记录
+            db_recognition_log = models.RecognitionLog(
+                member_id=None,
+                device_id=request.device_id,
+                status="failed",
+                confidence=0
+            )
+            db.add(db_recognition_log)
+            await db.commit()
+            live_stats.record_recognition(
+                db_recognition_log.id, None, device.id, device.name,
+                "failed", 0, db_recognition_log.recognized_at
+            )
+
+            # 通过事件总线推送识别失败消息
+            await event_bus.publish(topics, {
+                "type": "recognition_status",
+                "success": False,
+                "message": "未找到匹配的指纹",
+                "timestamp": datetime.now().isoformat()
+            })
+
+            return schemas.FingerprintRecognitionResponse(
+                success=False,
+                message="未找到匹配的指纹",
+                timestamp=datetime.now()
+            )
+
+    except Exception as e:
+        await db.rollback()
+        # 创建识别失败记录
+        db_recognition_log = models.RecognitionLog(
+            member_id=None,
+            device_id=request.device_id,
+            status="failed",
+            confidence=0
+        )
+        db.add(db_recognition_log)
+        await db.commit()
+        # 回滚后设备对象已过期，设备名称由统计模块按设备ID补齐
+        live_stats.record_recognition(
+            db_recognition_log.id, None, request.device_id, None,
+            "failed", 0, db_recognition_log.recognized_at
+        )
+
+        # 通过事件总线推送识别失败消息
+        await event_bus.publish(topics, {
+            "type": "recognition_status",
+            "success": False,
+            "message": f"指纹识别失败: {str(e)}",
+            "timestamp": datetime.now().isoformat()
+        })
+
+        return schemas.FingerprintRecognitionResponse(
+            success=False,
+            message=f"指纹识别失败: {str(e)}",
+            timestamp=datetime.now()
+        )
+
+
+async def run_enroll_job(job, progress: Progress) -> schemas.FingerprintEnrollResponse:
+    """任务引擎中执行的指纹录入"""
+    async with AsyncSessionLocal() as db:
+        return await enroll_fingerprint(db, job.payload, progress)
+
+
+async def run_recognize_job(job, progress: Progress) -> schemas.FingerprintRecognitionResponse:
+    """任务引擎中执行的指纹识别"""
+    async with AsyncSessionLocal() as db:
+        return await recognize_fingerprint(db, job.payload, progress)
@@ -0,0 +1,320 @@
+"""指纹模板库的分片并行比对
+
+模板矩阵存放在共享内存或内存映射的快照文件中，工作进程按来源附加到同一块
+内存，只读取分配给自己的行区间，因此每个进程都不持有模板的副本。本模块只依赖 numpy，
+以便 spawn 方式启动的工作进程可以快速导入。
+"""
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from multiprocessing.shared_memory import SharedMemory
+from typing import Dict, Optional, Sequence, Tuple
+import os
+import threading
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:
+    # Windows 上被映射的文件无法删除，不需要额外的文件锁
+    fcntl = None
+
+# 比对工作进程数，0表示使用CPU核心数
+MATCH_WORKERS = int(os.getenv("FINGERPRINT_MATCH_WORKERS", "0")) or (os.cpu_count() or 1)
+# 模板数低于该值时在当前进程内比对，进程间通信的开销大于并行收益
+PARALLEL_MIN_ROWS = int(os.getenv("FINGERPRINT_PARALLEL_MIN_ROWS", "50000"))
+
+
+class MatrixSegment:
+    """工作进程可以按来源描述附加的只读 float32 矩阵
+
+    比对期间通过 acquire/release 持有引用，被替换的矩阵调用 retire 后，
+    等最后一个比对结束再释放底层内存，避免工作进程附加到已删除的内存。
+    """
+
+    def __init__(self, rows: int, dim: int):
+        self.shape = (rows, dim)
+        self.array: Optional[np.ndarray] = None
+        self._readers = 0
+        self._retired = False
+        self._lock = threading.Lock()
+
+    @property
+    def source(self) -> Optional[Tuple]:
+        """工作进程附加该矩阵所需的来源描述"""
+        return None
+
+    @property
+    def nbytes(self) -> int:
+        return self.array.nbytes if self.array is not None else 0
+
+    def acquire(self) -> "MatrixSegment":
+        with self._lock:
+            self._readers += 1
+        return self
+
+    def release(self):
+        with self._lock:
+            self._readers -= 1
+            free = self._retired and self._readers == 0
+        if free:
+            self._free()
+
+    def retire(self):
+        """标记为不再使用，没有比对持有时立即释放"""
+        with self._lock:
+            self._retired = True
+            free = self._readers == 0
+        if free:
+            self._free()
+
+    def _free(self):
+        self.array = None
+
+
+class SharedMatrix(MatrixSegment):
+    """存放在共享内存中的 float32 矩阵"""
+
+    def __init__(self, rows: int, dim: int):
+        super().__init__(rows, dim)
+        if rows * dim:
+            self.shm: Optional[SharedMemory] = SharedMemory(create=True, size=rows * dim * 4)
+            self.array = np.ndarray(self.shape, dtype=np.float32, buffer=self.shm.buf)
+        else:
+            self.shm = None
+            self.array = np.zeros(self.shape, dtype=np.float32)
+
+    @property
+    def source(self) -> Optional[Tuple]:
+        return ("shm", self.shm.name) if self.shm is not None else None
+
+    def _free(self):
+        self.array = None
+        if self.shm is None:
+            return
+        try:
+            self.shm.close()
+        except BufferError:
+            # 仍有数组视图存活时由垃圾回收完成关闭
+            pass
+        try:
+            self.shm.unlink()
+        except FileNotFoundError:
+            pass
+
+
+def _hold_file(path: str) -> Optional[int]:
+    """对文件加共享锁并返回文件描述符，持有期间其他进程不会删除该文件；文件已被删除时抛出 FileNotFoundError"""
+    fd = os.open(path, os.O_RDONLY)
+    if fcntl is None:
+        return fd
+    try:
+        fcntl.flock(fd, fcntl.LOCK_SH)
+        # 删除方持有排他锁时删除，取得共享锁后文件可能已不在目录中
+        if os.fstat(fd).st_nlink == 0:
+            raise FileNotFoundError(path)
+    except BaseException:
+        os.close(fd)
+        raise
+    return fd
+
+
+def remove_unused_file(path: str) -> bool:
+    """没有任何进程（包括本进程）持有共享锁时删除文件，返回是否已删除"""
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except FileNotFoundError:
+        return True
+    try:
+        if fcntl is not None:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return False
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except PermissionError:
+            # Windows 上其他进程仍映射着该文件
+            return False
+        return True
+    finally:
+        os.close(fd)
+
+
+class MappedMatrix(MatrixSegment):
+    """内存映射自快照文件的只读 float32 矩阵，各进程共享同一份页缓存
+
+    映射期间对文件持有共享锁，其他服务进程清理旧快照时跳过仍被持有的文件，
+    本进程的比对工作进程按路径重新打开文件时文件一定存在。
+    """
+
+    def __init__(self, path: str, offset: int, rows: int, dim: int):
+        super().__init__(rows, dim)
+        self.path = path
+        self.offset = offset
+        # 有更新的快照文件写出后置位，释放时若已无进程持有则删除本文件
+        self.obsolete = False
+        self._fd: Optional[int] = _hold_file(path)
+        if rows * dim:
+            try:
+                self.array = np.memmap(path, dtype=np.float32, mode="r", offset=offset, shape=self.shape)
+            except BaseException:
+                self._release_file()
+                raise
+        else:
+            self.array = np.zeros(self.shape, dtype=np.float32)
+
+    @property
+    def source(self) -> Optional[Tuple]:
+        return ("file", self.path, self.offset) if self.shape[0] else None
+
+    def _release_file(self):
+        fd, self._fd = self._fd, None
+        if fd is not None:
+            os.close(fd)
+
+    def _free(self):
+        self.array = None
+        self._release_file()
+        if self.obsolete:
+            remove_unused_file(self.path)
+
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """返回得分最高的k个下标，按得分从高到低排列"""
+    k = min(k, scores.size)
+    if k <= 0:
+        return np.zeros(0, dtype=np.int64)
+    top = np.argpartition(scores, -k)[-k:]
+    return top[np.argsort(scores[top])[::-1]]
+
+
+# 工作进程内已附加的矩阵：来源描述 -> (底层对象, 数组)
+_attached: Dict[Tuple, Tuple[object, np.ndarray]] = {}
+
+
+def _attach(source: Tuple, shape: Tuple[int, int]) -> np.ndarray:
+    cached = _attached.get(source)
+    if cached is not None:
+        return cached[1]
+    # 模板库替换基础段后旧的矩阵已不再使用，先解除附加
+    for old_source in list(_attached):
+        handle, _ = _attached.pop(old_source)
+        if isinstance(handle, SharedMemory):
+            try:
+                handle.close()
+            except BufferError:
+                pass
+    if source[0] == "shm":
+        # spawn启动的工作进程与主进程共用资源跟踪器，共享内存由主进程负责删除
+        handle = SharedMemory(name=source[1])
+        array = np.ndarray(shape, dtype=np.float32, buffer=handle.buf)
+    else:
+        array = np.memmap(source[1], dtype=np.float32, mode="r", offset=source[2], shape=shape)
+        handle = array
+    _attached[source] = (handle, array)
+    return array
+
+
+def score_shard(
+    source: Tuple,
+    shape: Tuple[int, int],
+    start: int,
+    end: int,
+    probe: np.ndarray,
+    k: int,
+    excluded: Optional[np.ndarray] = None
+) -> Tuple[np.ndarray, np.ndarray]:
+    """在工作进程中对 [start, end) 行打分，返回该分片的 top-k 全局下标和得分"""
+    matrix = _attach(source, shape)
+    scores = matrix[start:end] @ probe
+    if excluded is not None and excluded.size:
+        scores[excluded - start] = -np.inf
+    top = top_k(scores, k)
+    return top + start, scores[top]
+
+
+class ShardedScorer:
+    """把共享内存中的模板矩阵按行切分，由进程池并行打分并合并 top-k"""
+
+    def __init__(self, workers: int = MATCH_WORKERS, min_rows: int = PARALLEL_MIN_ROWS):
+        self.workers = max(1, workers)
+        self.min_rows = min_rows
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    @property
+    def parallel(self) -> bool:
+        return self.workers > 1
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                # 使用spawn启动，避免在多线程的服务进程中fork
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=get_context("spawn")
+                )
+            return self._pool
+
+    def score(
+        self,
+        matrix: MatrixSegment,
+        rows: int,
+        probe: np.ndarray,
+        k: int,
+        excluded: Optional[np.ndarray] = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """对矩阵前rows行打分，返回全局 top-k 下标和得分"""
+        if rows == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+
+        if not self.parallel or rows < self.min_rows:
+            scores = matrix.array[:rows] @ probe
+            if excluded is not None and excluded.size:
+                scores[excluded] = -np.inf
+            top = top_k(scores, k)
+            return top, scores[top]
+
+        bounds = np.linspace(0, rows, self.workers + 1, dtype=np.int64)
+        pool = self._get_pool()
+        futures = []
+        for start, end in zip(bounds[:-1], bounds[1:]):
+            if start == end:
+                continue
+            shard_excluded = None
+            if excluded is not None and excluded.size:
+                shard_excluded = excluded[(excluded >= start) & (excluded < end)]
+            futures.append(pool.submit(
+                score_shard, matrix.source, matrix.shape, int(start), int(end), probe, k, shard_excluded
+            ))
+
+        indices = []
+        scores = []
+        for future in futures:
+            shard_indices, shard_scores = future.result()
+            indices.append(shard_indices)
+            scores.append(shard_scores)
+        return merge_top_k(indices, scores, k)
+
+    def shutdown(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=True)
+                self._pool = None
+
+
+def merge_top_k(
+    indices: Sequence[np.ndarray],
+    scores: Sequence[np.ndarray],
+    k: int
+) -> Tuple[np.ndarray, np.ndarray]:
+    """合并多个分片的 top-k 结果"""
+    if not indices:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+    all_indices = np.concatenate(indices)
+    all_scores = np.concatenate(scores)
+    top = top_k(all_scores, k)
+    return all_indices[top], all_scores[top]
@@ -0,0 +1,161 @@
+"""指纹模板库的磁盘快照
+
+文件格式（小端）：
+    64字节文件头：魔数、格式版本、特征维度、模板数、水位线（快照中最大的模板ID）、
+                  快照代数、写入时间
+    int64[N]      模板ID，升序
+    int64[N]      会员ID
+    float32[N*D]  特征矩阵
+
+启动时直接内存映射特征矩阵，只需从数据库补齐水位线之后的变更。
+"""
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+import glob
+import os
+import struct
+import time
+import uuid
+
+import numpy as np
+
+from app.services.fingerprint_shards import MappedMatrix, remove_unused_file
+
+SNAPSHOT_DIR = os.getenv(
+    "FINGERPRINT_SNAPSHOT_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "data")
+)
+SNAPSHOT_MAGIC = b"FPGS"
+# 特征编码变化时递增，旧版本快照被忽略并从数据库全量加载
+SNAPSHOT_FORMAT_VERSION = 2
+_HEADER = struct.Struct("<4sIIQqQd")
+_HEADER_SIZE = 64
+
+
+@dataclass
+class SnapshotHeader:
+    """快照文件头"""
+    dim: int
+    count: int
+    watermark: int
+    generation: int
+    created_at: float
+
+    @property
+    def ids_offset(self) -> int:
+        return _HEADER_SIZE
+
+    @property
+    def matrix_offset(self) -> int:
+        return _HEADER_SIZE + 16 * self.count
+
+
+def _snapshot_path(directory: str, generation: int) -> str:
+    return os.path.join(directory, f"gallery.{generation:08d}.snap")
+
+
+def list_snapshots(directory: str = SNAPSHOT_DIR) -> List[str]:
+    """按代数从新到旧列出快照文件"""
+    return sorted(glob.glob(os.path.join(directory, "gallery.*.snap")), reverse=True)
+
+
+def latest_generation(directory: str = SNAPSHOT_DIR) -> int:
+    """返回目录中已有快照的最大代数"""
+    generations = [0]
+    for path in list_snapshots(directory):
+        try:
+            generations.append(int(os.path.basename(path).split(".")[1]))
+        except (IndexError, ValueError):
+            continue
+    return max(generations)
+
+
+def read_header(path: str) -> Optional[SnapshotHeader]:
+    """读取并校验文件头，文件不完整或格式不符时返回None"""
+    try:
+        with open(path, "rb") as f:
+            raw = f.read(_HEADER_SIZE)
+        if len(raw) < _HEADER_SIZE:
+            return None
+        magic, version, dim, count, watermark, generation, created_at = _HEADER.unpack_from(raw)
+        if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_FORMAT_VERSION:
+            return None
+        header = SnapshotHeader(dim, count, watermark, generation, created_at)
+        if os.path.getsize(path) != header.matrix_offset + 4 * count * dim:
+            return None
+        return header
+    except OSError:
+        return None
+
+
+def open_latest(dim: int, directory: str = SNAPSHOT_DIR) -> Optional[Tuple[SnapshotHeader, MappedMatrix, np.ndarray, np.ndarray]]:
+    """打开最新的有效快照，返回 (文件头, 映射的特征矩阵, 模板ID, 会员ID)"""
+    for path in list_snapshots(directory):
+        header = read_header(path)
+        if header is None or header.dim != dim:
+            continue
+        try:
+            # 先持有文件再读取，避免其他进程在读取期间清理该快照
+            matrix = MappedMatrix(path, header.matrix_offset, header.count, dim)
+        except FileNotFoundError:
+            continue
+        template_ids = np.fromfile(path, dtype="<i8", count=header.count, offset=header.ids_offset)
+        member_ids = np.fromfile(
+            path, dtype="<i8", count=header.count, offset=header.ids_offset + 8 * header.count
+        )
+        return header, matrix, template_ids.astype(np.int64), member_ids.astype(np.int64)
+    return None
+
+
+def write_snapshot(
+    matrix: np.ndarray,
+    template_ids: np.ndarray,
+    member_ids: np.ndarray,
+    generation: int,
+    directory: str = SNAPSHOT_DIR
+) -> Tuple[str, int]:
+    """写出快照文件，先写临时文件再以新文件名原子链接，返回 (文件路径, 实际代数)
+
+    其他 worker 可能同时选中同一代数；已存在的快照文件可能正被映射，不能覆盖，
+    此时改用下一个代数。
+    """
+    os.makedirs(directory, exist_ok=True)
+    count, dim = matrix.shape
+    watermark = int(template_ids.max()) if count else 0
+    path = _snapshot_path(directory, generation)
+    tmp_path = f"{path}.{os.getpid()}.{uuid.uuid4().hex}.tmp"
+
+    def header() -> bytes:
+        packed = _HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_FORMAT_VERSION, dim, count, watermark, generation, time.time())
+        return packed.ljust(_HEADER_SIZE, b"\0")
+
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(header())
+            template_ids.astype("<i8").tofile(f)
+            member_ids.astype("<i8").tofile(f)
+            np.ascontiguousarray(matrix, dtype="<f4").tofile(f)
+            f.flush()
+            os.fsync(f.fileno())
+        while True:
+            try:
+                os.link(tmp_path, path)
+                break
+            except FileExistsError:
+                generation += 1
+                path = _snapshot_path(directory, generation)
+                with open(tmp_path, "r+b") as f:
+                    f.write(header())
+                    f.flush()
+                    os.fsync(f.fileno())
+    finally:
+        try:
+            os.remove(tmp_path)
+        except FileNotFoundError:
+            pass
+    return path, generation
+
+
+def remove_unused(path: str) -> bool:
+    """删除没有任何进程映射的快照文件，返回是否已删除"""
+    return remove_unused_file(path)
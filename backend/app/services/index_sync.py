@@ -0,0 +1,141 @@
+"""进程内索引的跨 worker 同步
+
+权限、卡号、设备候选索引和指纹模板库都保存在各 worker 进程内。处理增删改的 worker
+直接更新自己的索引，再经事件总线通知其他 worker，由它们按ID从数据库重新读取对应的行
+并更新索引。另有定期全量重载权限、卡号和设备候选索引兜底，事件丢失（例如 Redis 短暂
+不可用）时过期数据最多保留一个周期；模板库全量加载开销大，不参与定期重载。
+"""
+from datetime import datetime
+from typing import Iterable, Optional
+import os
+import threading
+
+from app.database.database import SessionLocal
+from app.models import models
+from app.services.access_index import permission_index
+from app.services.candidate_index import candidate_index
+from app.services.card_index import card_index
+from app.services.event_bus import event_bus
+from app.services.fingerprint_matcher import template_gallery
+
+# 控制事件名称
+INDEX_SYNC_EVENT = "index_sync"
+# 全量重载的间隔（秒），0 表示不重载
+INDEX_RESYNC_INTERVAL = float(os.getenv("INDEX_RESYNC_INTERVAL", "60"))
+
+
+def publish_change(entity: str, *entity_ids: int):
+    """本进程已更新索引后调用，通知其他 worker 重新读取这些行"""
+    if entity_ids:
+        event_bus.broadcast(INDEX_SYNC_EVENT, {"entity": entity, "ids": list(entity_ids)})
+
+
+def refresh(db, entity: str, entity_ids: Iterable[int]):
+    """按数据库中的当前状态更新本进程的索引，行已删除时从索引中移除"""
+    for entity_id in entity_ids:
+        if entity == "member":
+            member = db.get(models.Member, entity_id)
+            if member is None:
+                permission_index.remove_member(entity_id)
+                candidate_index.remove_member(entity_id)
+                card_index.remove_member(entity_id)
+                # 会员的指纹模板随会员一起删除
+                template_gallery.remove(*template_gallery.member_template_ids(entity_id))
+            else:
+                permission_index.upsert_member(member)
+                candidate_index.upsert_member(member)
+        elif entity == "permission":
+            permission = db.get(models.AccessPermission, entity_id)
+            if permission is None:
+                permission_index.remove_permission(entity_id)
+                candidate_index.remove_permission(entity_id)
+            else:
+                permission_index.upsert_permission(permission)
+                candidate_index.upsert_permission(permission)
+        elif entity == "card":
+            card = db.get(models.MemberCard, entity_id)
+            if card is None:
+                card_index.remove_card(entity_id)
+            else:
+                card_index.upsert_card(card)
+        elif entity == "device":
+            device = db.get(models.Device, entity_id)
+            if device is None:
+                candidate_index.remove_device(entity_id)
+            else:
+                candidate_index.upsert_device(device)
+        elif entity == "template":
+            template = db.get(models.FingerprintTemplate, entity_id)
+            if template is None:
+                template_gallery.remove(entity_id)
+            elif template_gallery.loaded:
+                template_gallery.add(template.id, template.member_id, template.template_data)
+        else:
+            raise ValueError(f"未知的索引实体: {entity}")
+
+
+def _handle_change(payload: dict):
+    db = SessionLocal()
+    try:
+        refresh(db, payload["entity"], payload["ids"])
+    finally:
+        db.close()
+
+
+event_bus.register(INDEX_SYNC_EVENT, _handle_change)
+
+
+class IndexResyncJob:
+    """定期全量重载权限、卡号和设备候选索引"""
+
+    def __init__(self, interval: float = INDEX_RESYNC_INTERVAL):
+        self.interval = interval
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self.last_run_at: Optional[datetime] = None
+        self.failed_runs = 0
+
+    def start(self):
+        if self._thread is not None or self.interval <= 0:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="index-resync", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        thread = self._thread
+        if thread is None:
+            return
+        self._stop.set()
+        thread.join()
+        self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"重载索引失败: {e}")
+                self.failed_runs += 1
+
+    def run_once(self):
+        db = SessionLocal()
+        try:
+            permission_index.load(db)
+            card_index.load(db)
+            candidate_index.load(db)
+        finally:
+            db.close()
+        self.last_run_at = datetime.now()
+
+    def stats(self) -> dict:
+        return {
+            "running": self._thread is not None,
+            "interval": self.interval,
+            "last_run_at": self.last_run_at,
+            "failed_runs": self.failed_runs
+        }
+
+
+# 全局索引重载任务
+index_resync_job = IndexResyncJob()
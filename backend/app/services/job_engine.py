@@ -0,0 +1,272 @@
+from contextlib import asynccontextmanager
+from datetime import datetime
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+from typing import Any, AsyncContextManager, Awaitable, Callable, Dict, Optional
+import asyncio
+import os
+import uuid
+
+from app.database.database import async_engine
+
+# 每台设备等待中的任务上限
+JOB_QUEUE_SIZE = int(os.getenv("JOB_QUEUE_SIZE", "20"))
+# 设备空闲多久后结束其工作任务（秒），有新任务时重新创建
+JOB_WORKER_IDLE_TIMEOUT = float(os.getenv("JOB_WORKER_IDLE_TIMEOUT", "60"))
+# 最近结束的任务保留数量，供查询任务状态
+JOB_HISTORY_SIZE = int(os.getenv("JOB_HISTORY_SIZE", "1000"))
+# 等待其他服务进程释放设备的最长时间（秒），0 表示不加跨进程锁（只运行一个服务进程时）
+JOB_DEVICE_LOCK_TIMEOUT = float(os.getenv("JOB_DEVICE_LOCK_TIMEOUT", "30"))
+
+
+class JobQueueFullError(Exception):
+    """设备的任务队列已满"""
+
+
+class DeviceLockError(Exception):
+    """无法获取设备锁（数据库不可用）"""
+
+
+class DeviceBusyError(DeviceLockError):
+    """设备一直被其他服务进程的任务占用"""
+
+
+@asynccontextmanager
+async def mysql_device_lock(device_id: int):
+    """用 MySQL 命名锁保证同一时间只有一个服务进程在操作某台设备
+
+    任务队列在各进程内，多个 uvicorn worker 都可能收到同一设备的请求；每个任务执行前
+    获取该设备的命名锁，执行完毕后释放，不同进程的任务因此在设备上依次执行。
+    """
+    if JOB_DEVICE_LOCK_TIMEOUT <= 0:
+        yield
+        return
+    name = f"device_job:{device_id}"
+    try:
+        conn = await async_engine.connect()
+    except SQLAlchemyError as e:
+        print(f"获取设备 {device_id} 的锁失败: {e}")
+        raise DeviceLockError(f"无法获取设备 {device_id} 的锁，数据库暂不可用") from e
+    try:
+        try:
+            acquired = await conn.scalar(
+                text("SELECT GET_LOCK(:name, :timeout)"), {"name": name, "timeout": JOB_DEVICE_LOCK_TIMEOUT}
+            )
+        except SQLAlchemyError as e:
+            print(f"获取设备 {device_id} 的锁失败: {e}")
+            raise DeviceLockError(f"无法获取设备 {device_id} 的锁，数据库暂不可用") from e
+        if acquired != 1:
+            raise DeviceBusyError(f"设备 {device_id} 正在执行其他任务，请稍后重试")
+        try:
+            yield
+        finally:
+            try:
+                await conn.execute(text("SELECT RELEASE_LOCK(:name)"), {"name": name})
+            except BaseException:
+                # 命名锁随会话保留，未能释放时丢弃连接，由服务器结束会话时释放
+                await conn.invalidate()
+                raise
+    finally:
+        await conn.close()
+
+
+class Job:
+    """一次设备任务（指纹录入、识别、门禁判定）"""
+
+    def __init__(self, kind: str, device_id: int, payload: Any, websocket=None):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.device_id = device_id
+        self.payload = payload
+        # 发起任务的WebSocket连接，进度和结果只发给它；HTTP请求发起的任务为 None
+        self.websocket = websocket
+        self.status = "queued"
+        self.created_at = datetime.now()
+        self.started_at: Optional[datetime] = None
+        self.finished_at: Optional[datetime] = None
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+
+    async def result(self):
+        """等待任务完成并返回处理结果，处理失败时抛出原异常"""
+        return await asyncio.shield(self.future)
+
+    def info(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.id,
+            "kind": self.kind,
+            "device_id": self.device_id,
+            "status": self.status,
+            "created_at": self.created_at.isoformat(),
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None
+        }
+
+
+# 任务处理函数：接收任务和进度回调，返回可序列化为JSON的结果
+JobHandler = Callable[[Job, Callable[[str], Awaitable[None]]], Awaitable[Any]]
+
+
+class JobEngine:
+    """按设备排队的异步任务引擎
+
+    每台设备一个有界队列和一个工作任务，同一读头上的采集依次执行、互不冲突，
+    不同设备之间并行。任务提交后立即返回任务ID，请求处理函数不必等待设备采集；
+    进度和结果只发送给发起任务的WebSocket连接，HTTP请求可等待 Job.result()。
+    队列只在本进程内，多个服务进程之间由 device_lock（默认为 MySQL 命名锁）保证
+    同一设备的任务不会同时执行。
+    """
+
+    def __init__(
+        self,
+        queue_size: int = JOB_QUEUE_SIZE,
+        idle_timeout: float = JOB_WORKER_IDLE_TIMEOUT,
+        device_lock: Callable[[int], AsyncContextManager] = mysql_device_lock
+    ):
+        self.queue_size = queue_size
+        self.idle_timeout = idle_timeout
+        self.device_lock = device_lock
+        self._handlers: Dict[str, JobHandler] = {}
+        self._queues: Dict[int, asyncio.Queue] = {}
+        self._workers: Dict[int, asyncio.Task] = {}
+        # 任务ID -> 任务，包括等待中、执行中和最近结束的任务
+        self._jobs: Dict[str, Job] = {}
+        self._manager = None
+        # 统计信息
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+
+    def register(self, kind: str, handler: JobHandler):
+        """注册一类任务的处理函数"""
+        self._handlers[kind] = handler
+
+    def attach(self, manager):
+        """绑定用于回复发起者的连接管理器"""
+        self._manager = manager
+
+    def submit(self, kind: str, device_id: int, payload: Any, websocket=None) -> Job:
+        """把任务放入设备队列，队列已满时抛出 JobQueueFullError"""
+        if kind not in self._handlers:
+            raise ValueError(f"未知的任务类型: {kind}")
+        queue = self._queues.get(device_id)
+        if queue is None:
+            queue = self._queues[device_id] = asyncio.Queue(maxsize=self.queue_size)
+        job = Job(kind, device_id, payload, websocket)
+        try:
+            queue.put_nowait(job)
+        except asyncio.QueueFull:
+            self.rejected += 1
+            raise JobQueueFullError(f"设备 {device_id} 的任务队列已满，请稍后重试")
+        self.submitted += 1
+        self._jobs[job.id] = job
+        if device_id not in self._workers:
+            self._workers[device_id] = asyncio.create_task(self._worker(device_id, queue))
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self._jobs.get(job_id)
+
+    def position(self, job: Job) -> int:
+        """任务前面还有多少个等待中的任务"""
+        queue = self._queues.get(job.device_id)
+        return queue.qsize() - 1 if queue is not None else 0
+
+    async def _worker(self, device_id: int, queue: asyncio.Queue):
+        """依次执行一台设备的任务，空闲超时后退出"""
+        try:
+            while True:
+                try:
+                    job = await asyncio.wait_for(queue.get(), self.idle_timeout)
+                except asyncio.TimeoutError:
+                    # 检查与移除之间没有 await，不会与 submit 交错
+                    if queue.empty():
+                        del self._workers[device_id]
+                        del self._queues[device_id]
+                        return
+                    continue
+                await self._run(job)
+        except asyncio.CancelledError:
+            self._workers.pop(device_id, None)
+            raise
+
+    async def _run(self, job: Job):
+        job.status = "running"
+        job.started_at = datetime.now()
+
+        async def progress(message: str):
+            await self._reply(job, {"type": f"{job.kind}_status", "status": "running", "message": message})
+
+        await progress("任务开始执行")
+        try:
+            async with self.device_lock(job.device_id):
+                result = await self._handlers[job.kind](job, progress)
+        except Exception as e:
+            job.status = "failed"
+            self.failed += 1
+            if not job.future.done():
+                job.future.set_exception(e)
+            # 仅由WebSocket发起的任务无人等待结果，避免未取出的异常告警
+            job.future.exception()
+            await self._reply(job, {"type": f"{job.kind}_result", "success": False, "message": str(e)})
+        else:
+            job.status = "completed"
+            self.completed += 1
+            if not job.future.done():
+                job.future.set_result(result)
+            if job.websocket is not None:
+                message = {"type": f"{job.kind}_result"}
+                message.update(result.model_dump(mode="json") if hasattr(result, "model_dump") else result)
+                await self._reply(job, message)
+        finally:
+            job.finished_at = datetime.now()
+            self._forget_finished()
+
+    async def _reply(self, job: Job, message: Dict[str, Any]):
+        """把任务的进度或结果发给发起任务的连接"""
+        if job.websocket is None or self._manager is None:
+            return
+        message["job_id"] = job.id
+        message["timestamp"] = datetime.now().isoformat()
+        try:
+            await self._manager.send_personal_message(message, job.websocket)
+        except Exception as e:
+            # 发起者已断开时丢弃回复
+            print(f"发送任务消息失败: {e}")
+
+    def _forget_finished(self):
+        """只保留最近结束的若干任务"""
+        if len(self._jobs) <= JOB_HISTORY_SIZE:
+            return
+        finished = [job_id for job_id, job in self._jobs.items() if job.finished_at]
+        for job_id in finished[:max(len(finished) - JOB_HISTORY_SIZE, 0)]:
+            del self._jobs[job_id]
+
+    async def stop(self):
+        """取消所有设备的工作任务和尚未完成的任务"""
+        workers = list(self._workers.values())
+        for worker in workers:
+            worker.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        self._workers.clear()
+        self._queues.clear()
+        for job in self._jobs.values():
+            if not job.future.done():
+                job.status = "cancelled"
+                job.future.cancel()
+
+    def stats(self) -> dict:
+        return {
+            "queue_size": self.queue_size,
+            "device_lock_timeout": JOB_DEVICE_LOCK_TIMEOUT,
+            "devices": len(self._workers),
+            "queued": {device_id: queue.qsize() for device_id, queue in self._queues.items()},
+            "submitted": self.submitted,
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected
+        }
+
+
+# 全局设备任务引擎
+job_engine = JobEngine()
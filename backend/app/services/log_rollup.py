@@ -0,0 +1,219 @@
+from collections import Counter
+from datetime import datetime, timedelta
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.exc import IntegrityError
+from typing import Dict, List, Optional
+import os
+import threading
+
+from app.database.database import engine
+from app.models import models
+
+# 汇总任务的执行间隔（秒），也是新日志进入汇总前的最短延迟
+ROLLUP_INTERVAL = float(os.getenv("LOG_ROLLUP_INTERVAL", "5"))
+# 单批读取的日志行数
+ROLLUP_BATCH_SIZE = int(os.getenv("LOG_ROLLUP_BATCH_SIZE", "5000"))
+# 分钟粒度汇总的保留天数，小时和天粒度长期保留
+MINUTE_RETENTION_DAYS = int(os.getenv("LOG_ROLLUP_MINUTE_RETENTION_DAYS", "7"))
+
+GRANULARITY_SECONDS = {"minute": 60, "hour": 3600, "day": 86400}
+
+
+def bucket_start(moment: datetime, granularity: str) -> datetime:
+    """把时间向下对齐到指定粒度的桶起点"""
+    if granularity == "minute":
+        return moment.replace(second=0, microsecond=0)
+    if granularity == "hour":
+        return moment.replace(minute=0, second=0, microsecond=0)
+    return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+class _Source:
+    """一类待汇总的日志表"""
+
+    def __init__(self, name: str, model, time_column):
+        self.name = name
+        self.model = model
+        self.time_column = time_column
+        self.checkpoint = f"log_rollup:{name}"
+
+
+SOURCES = (
+    _Source("recognition", models.RecognitionLog, models.RecognitionLog.recognized_at),
+    _Source("access", models.AccessControl, models.AccessControl.access_time),
+)
+
+
+class LogRollupJob:
+    """识别/访问日志的时间序列汇总任务
+
+    按 processing_checkpoints 中的水位线读取新写入的日志，按分钟、小时、天三种粒度
+    以 (设备, 分支, 状态) 计数后累加到 log_rollups，并在同一事务中推进水位线，
+    因此每行日志只被计数一次；首次运行时从头回填全部历史日志。
+
+    自增ID的分配顺序与事务提交顺序不一定一致，每轮只处理到上一轮观察到的最大ID，
+    给较早分配ID但较晚提交的事务留出一个执行间隔，避免水位线越过尚未提交的行。
+    """
+
+    def __init__(self, interval: float = ROLLUP_INTERVAL):
+        self.interval = interval
+        # 日志表名 -> 上一轮观察到的最大ID
+        self._horizons: Dict[str, int] = {}
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        # 统计信息
+        self.processed_rows: Dict[str, int] = {source.name: 0 for source in SOURCES}
+        self.last_ids: Dict[str, int] = {}
+        self.last_event_at: Dict[str, Optional[datetime]] = {}
+        self.last_run_at: Optional[datetime] = None
+        self.last_pruned_at: Optional[datetime] = None
+        self.failed_runs = 0
+
+    def start(self):
+        """启动后台汇总线程"""
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="log-rollup", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        thread = self._thread
+        if thread is None:
+            return
+        self._stop.set()
+        thread.join()
+        self._thread = None
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"日志汇总失败: {e}")
+                self.failed_runs += 1
+            self._stop.wait(self.interval)
+
+    def run_once(self):
+        """处理各日志表中水位线之后、上一轮观察到的最大ID之前的全部日志"""
+        for source in SOURCES:
+            with engine.connect() as conn:
+                current = conn.execute(select(func.max(source.model.id))).scalar() or 0
+            horizon = self._horizons.get(source.name)
+            if horizon is not None:
+                while not self._stop.is_set() and self._process_batch(source, horizon) == ROLLUP_BATCH_SIZE:
+                    pass
+            self._horizons[source.name] = current
+        self._prune_minutes()
+        self.last_run_at = datetime.now()
+
+    def _ensure_checkpoint(self, conn, name: str):
+        checkpoint = models.ProcessingCheckpoint.__table__
+        try:
+            with conn.begin_nested():
+                conn.execute(checkpoint.insert().values(name=name, last_id=0, updated_at=datetime.now()))
+        except IntegrityError:
+            # 其他进程已创建
+            pass
+
+    def _process_batch(self, source: _Source, horizon: int) -> int:
+        """处理一批日志，返回读取的行数（小于批大小表示已追平）"""
+        checkpoint = models.ProcessingCheckpoint
+        log = source.model
+        with engine.begin() as conn:
+            # 锁住水位线行，多个服务进程同时运行时只有一个在推进
+            last_id = conn.execute(
+                select(checkpoint.last_id).where(checkpoint.name == source.checkpoint).with_for_update()
+            ).scalar()
+            if last_id is None:
+                self._ensure_checkpoint(conn, source.checkpoint)
+                last_id = conn.execute(
+                    select(checkpoint.last_id).where(checkpoint.name == source.checkpoint).with_for_update()
+                ).scalar()
+
+            rows = conn.execute(
+                select(
+                    log.id, source.time_column, log.device_id, log.status, models.Device.branch_id
+                ).outerjoin(
+                    models.Device, log.device_id == models.Device.id
+                ).where(
+                    log.id > last_id,
+                    log.id <= horizon
+                ).order_by(log.id).limit(ROLLUP_BATCH_SIZE)
+            ).all()
+            if not rows:
+                return 0
+
+            counts: Counter = Counter()
+            for _, event_time, device_id, status, branch_id in rows:
+                event_time = event_time or datetime.now()
+                for granularity in GRANULARITY_SECONDS:
+                    counts[(granularity, bucket_start(event_time, granularity), device_id or 0, branch_id or 0, status)] += 1
+            self._upsert(conn, source.name, counts)
+
+            conn.execute(
+                update(checkpoint).where(checkpoint.name == source.checkpoint).values(
+                    last_id=rows[-1][0], updated_at=datetime.now()
+                )
+            )
+
+        self.processed_rows[source.name] += len(rows)
+        self.last_ids[source.name] = rows[-1][0]
+        self.last_event_at[source.name] = rows[-1][1]
+        return len(rows)
+
+    @staticmethod
+    def _upsert(conn, source_name: str, counts: Counter):
+        rows: List[Dict] = [
+            {
+                "source": source_name,
+                "granularity": granularity,
+                "bucket_start": start,
+                "device_id": device_id,
+                "branch_id": branch_id,
+                "status": status,
+                "count": count
+            }
+            for (granularity, start, device_id, branch_id, status), count in counts.items()
+        ]
+        table = models.LogRollup.__table__
+        statement = mysql_insert(table)
+        statement = statement.on_duplicate_key_update(count=table.c.count + statement.inserted.count)
+        conn.execute(statement, rows)
+
+    def _prune_minutes(self):
+        """清理过期的分钟粒度汇总，每小时最多执行一次"""
+        now = datetime.now()
+        if MINUTE_RETENTION_DAYS <= 0 or (self.last_pruned_at and now - self.last_pruned_at < timedelta(hours=1)):
+            return
+        self.last_pruned_at = now
+        with engine.begin() as conn:
+            conn.execute(delete(models.LogRollup).where(
+                models.LogRollup.granularity == "minute",
+                models.LogRollup.bucket_start < now - timedelta(days=MINUTE_RETENTION_DAYS)
+            ))
+
+    def lag(self) -> Dict[str, Optional[float]]:
+        """各日志表已汇总的最新日志距今的秒数"""
+        now = datetime.now()
+        return {
+            name: (now - event_at).total_seconds() if event_at else None
+            for name, event_at in self.last_event_at.items()
+        }
+
+    def stats(self) -> dict:
+        return {
+            "running": self._thread is not None,
+            "interval": self.interval,
+            "horizons": self._horizons,
+            "processed_rows": self.processed_rows,
+            "last_ids": self.last_ids,
+            "lag": self.lag(),
+            "last_run_at": self.last_run_at,
+            "failed_runs": self.failed_runs
+        }
+
+
+# 全局日志汇总任务
+log_rollup_job = LogRollupJob()
@@ -0,0 +1,254 @@
+"""设备中间件（ZKTeco Middleware）的异步HTTP客户端
+
+所有请求共用一个 httpx.AsyncClient，保持长连接池；每次调用有独立超时，
+连接类错误按指数退避加随机抖动重试，连续失败达到阈值后熔断一段时间，
+期间直接失败，不再占用请求处理时间等待不可用的中间件。
+"""
+from typing import Any, Dict, Optional
+import asyncio
+import os
+import random
+import threading
+import time
+
+import httpx
+
+# 中间件服务地址
+MIDDLEWARE_URL = os.getenv("MIDDLEWARE_URL", "http://localhost:9000")
+# 默认单次请求超时（秒）
+MIDDLEWARE_TIMEOUT = float(os.getenv("MIDDLEWARE_TIMEOUT", "5"))
+# 录入、识别需要等待用户按压手指，超时更长
+MIDDLEWARE_CAPTURE_TIMEOUT = float(os.getenv("MIDDLEWARE_CAPTURE_TIMEOUT", "30"))
+# 失败后的最大重试次数
+MIDDLEWARE_RETRIES = int(os.getenv("MIDDLEWARE_RETRIES", "2"))
+# 重试退避的基准时间（秒）
+MIDDLEWARE_RETRY_BACKOFF = float(os.getenv("MIDDLEWARE_RETRY_BACKOFF", "0.2"))
+# 连接池大小
+MIDDLEWARE_MAX_CONNECTIONS = int(os.getenv("MIDDLEWARE_MAX_CONNECTIONS", "50"))
+# 连续失败多少次后熔断
+MIDDLEWARE_BREAKER_THRESHOLD = int(os.getenv("MIDDLEWARE_BREAKER_THRESHOLD", "5"))
+# 熔断后多久允许试探请求（秒）
+MIDDLEWARE_BREAKER_RESET = float(os.getenv("MIDDLEWARE_BREAKER_RESET", "30"))
+
+
+class MiddlewareError(Exception):
+    """中间件调用失败"""
+
+
+class MiddlewareUnavailableError(MiddlewareError):
+    """熔断器打开，中间件暂不可用"""
+
+
+class CircuitBreaker:
+    """连续失败计数熔断器
+
+    closed：正常放行；open：直接拒绝；熔断时间过后进入 half_open，
+    只放行一个试探请求，成功则恢复，失败则重新熔断；试探请求被取消或因其他异常结束时
+    由调用方释放，下一个请求可以重新试探。状态变更加锁，可在线程池中调用。
+    """
+
+    def __init__(self, threshold: int = MIDDLEWARE_BREAKER_THRESHOLD, reset_timeout: float = MIDDLEWARE_BREAKER_RESET):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def acquire(self) -> Optional[str]:
+        """请求放行时返回当时的状态（closed 或 half_open），拒绝时返回None"""
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return state
+            if state == "half_open" and not self._probing:
+                self._probing = True
+                return state
+            return None
+
+    def allow(self) -> bool:
+        return self.acquire() is not None
+
+    def release_probe(self):
+        """试探请求结束但未记录结果（例如被取消）时释放，允许下一个请求试探"""
+        with self._lock:
+            self._probing = False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._probing = False
+            if self.opened_at is not None or self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+
+
+class MiddlewareClient:
+    """中间件异步客户端"""
+
+    def __init__(
+        self,
+        base_url: str = MIDDLEWARE_URL,
+        timeout: float = MIDDLEWARE_TIMEOUT,
+        retries: int = MIDDLEWARE_RETRIES,
+        backoff: float = MIDDLEWARE_RETRY_BACKOFF,
+        breaker: Optional[CircuitBreaker] = None,
+        transport: Optional[httpx.AsyncBaseTransport] = None
+    ):
+        self.base_url = base_url
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.breaker = breaker or CircuitBreaker()
+        # 测试时可传入 httpx.ASGITransport 直接调用替身服务
+        self._transport = transport
+        self._client: Optional[httpx.AsyncClient] = None
+        # 统计信息
+        self.request_count = 0
+        self.retry_count = 0
+        self.failure_count = 0
+        self.rejected_count = 0
+
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                timeout=self.timeout,
+                limits=httpx.Limits(
+                    max_connections=MIDDLEWARE_MAX_CONNECTIONS,
+                    max_keepalive_connections=MIDDLEWARE_MAX_CONNECTIONS
+                ),
+                transport=self._transport
+            )
+        return self._client
+
+    async def close(self):
+        """关闭连接池"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def _retry_delay(self, attempt: int) -> float:
+        # 全抖动：在 [0, backoff * 2^attempt] 内随机等待，避免多个请求同时重试
+        return random.uniform(0, self.backoff * (2 ** attempt))
+
+    async def request(
+        self,
+        method: str,
+        path: str,
+        json: Optional[Dict[str, Any]] = None,
+        timeout: Optional[float] = None,
+        idempotent: bool = True
+    ) -> Dict[str, Any]:
+        """发送请求并返回中间件的JSON响应
+
+        中间件对业务失败返回4xx和 {"success": false, "message": ...}，这类响应直接返回给调用方；
+        连接失败、超时和5xx视为中间件故障，计入熔断器。非幂等请求（录入、识别）
+        只在请求未发出的连接错误时重试，避免设备重复进入采集状态。
+        """
+        admitted = self.breaker.acquire()
+        if admitted is None:
+            self.rejected_count += 1
+            raise MiddlewareUnavailableError("中间件服务暂不可用")
+        try:
+            return await self._send(method, path, json, timeout, idempotent)
+        finally:
+            if admitted == "half_open":
+                self.breaker.release_probe()
+
+    async def _send(
+        self,
+        method: str,
+        path: str,
+        json: Optional[Dict[str, Any]],
+        timeout: Optional[float],
+        idempotent: bool
+    ) -> Dict[str, Any]:
+        client = self._get_client()
+        attempt = 0
+        while True:
+            self.request_count += 1
+            try:
+                response = await client.request(
+                    method, path, json=json,
+                    timeout=timeout if timeout is not None else self.timeout
+                )
+                if response.status_code >= 500:
+                    raise MiddlewareError(self._error_message(response))
+                result = response.json()
+            except (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout) as e:
+                error: Exception = e
+                retryable = True
+            except (httpx.HTTPError, MiddlewareError, ValueError) as e:
+                error = e
+                retryable = idempotent
+            else:
+                self.breaker.record_success()
+                return result
+
+            if not retryable or attempt >= self.retries:
+                self.failure_count += 1
+                self.breaker.record_failure()
+                if isinstance(error, MiddlewareError):
+                    raise error
+                raise MiddlewareError(f"中间件请求失败: {error!r}") from error
+            await asyncio.sleep(self._retry_delay(attempt))
+            attempt += 1
+            self.retry_count += 1
+
+    @staticmethod
+    def _error_message(response: httpx.Response) -> str:
+        try:
+            return response.json().get("message") or f"中间件返回错误状态 {response.status_code}"
+        except ValueError:
+            return f"中间件返回错误状态 {response.status_code}"
+
+    async def connect_device(self, ip_address: str, port: int) -> Dict[str, Any]:
+        return await self.request("POST", "/api/device/connect", {"ipAddress": ip_address, "port": port})
+
+    async def sync_device(self, ip_address: str, port: int) -> Dict[str, Any]:
+        return await self.request("POST", "/api/device/sync", {"ipAddress": ip_address, "port": port})
+
+    async def enroll_fingerprint(self, ip_address: str, finger_index: int) -> Dict[str, Any]:
+        return await self.request(
+            "POST", "/api/fingerprint/enroll",
+            {"ipAddress": ip_address, "fingerIndex": finger_index},
+            timeout=MIDDLEWARE_CAPTURE_TIMEOUT,
+            idempotent=False
+        )
+
+    async def recognize_fingerprint(self, ip_address: str) -> Dict[str, Any]:
+        return await self.request(
+            "POST", "/api/fingerprint/recognize",
+            {"ipAddress": ip_address},
+            timeout=MIDDLEWARE_CAPTURE_TIMEOUT,
+            idempotent=False
+        )
+
+    def stats(self) -> dict:
+        return {
+            "base_url": self.base_url,
+            "breaker_state": self.breaker.state,
+            "consecutive_failures": self.breaker.failures,
+            "request_count": self.request_count,
+            "retry_count": self.retry_count,
+            "failure_count": self.failure_count,
+            "rejected_count": self.rejected_count
+        }
+
+
+# 全局中间件客户端
+middleware_client = MiddlewareClient()
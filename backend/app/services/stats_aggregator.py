@@ -0,0 +1,267 @@
+from collections import deque
+from datetime import datetime, timedelta
+from sqlalchemy import desc, extract, func
+from sqlalchemy.orm import Session
+from typing import Any, Deque, Dict, Iterable, List, Optional, Set
+import asyncio
+import threading
+
+from app.models import models
+from app.services.event_bus import event_bus
+from app.websocket.connection_manager import event_topics
+
+# 保留的最近识别记录条数
+RECENT_LOG_LIMIT = 10
+# 小时分布的窗口长度
+HOURLY_WINDOW = 24
+# 仪表板增量推送的主题
+DASHBOARD_TOPICS = event_topics("dashboard_delta")
+
+
+def _hour_start(moment: datetime) -> datetime:
+    return moment.replace(minute=0, second=0, microsecond=0)
+
+
+class LiveStatsAggregator:
+    """仪表板实时统计
+
+    在进程内维护今日识别/通行计数、在线设备、过去24小时的小时分布和最近识别记录。
+    识别、门禁判定和设备状态变化时直接更新计数，并把变化部分通过 WebSocket
+    推送给仪表板，客户端不必轮询重新统计 recognition_logs。
+    计数只包含本进程处理的请求，增量只推送给本进程的连接。
+    启动时从数据库重建，跨零点时清零今日计数，跨整点时滑动小时窗口。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._day = datetime.now().date()
+        self.today_recognitions = 0
+        self.today_success_recognitions = 0
+        self.today_access = 0
+        self.today_access_allowed = 0
+        self._devices: Dict[int, str] = {}
+        self._online_devices: Set[int] = set()
+        # 整点时间 -> 识别次数，只保留窗口内的小时
+        self._hourly: Dict[datetime, int] = {}
+        self._recent: Deque[Dict[str, Any]] = deque(maxlen=RECENT_LOG_LIMIT)
+        self._seq = 0
+        self.loaded = False
+        self.published_deltas = 0
+
+    def rebuild(self, db: Session):
+        """从数据库重建今日计数、小时分布、在线设备和最近记录"""
+        now = datetime.now()
+        today_start = datetime(now.year, now.month, now.day)
+        window_start = _hour_start(now) - timedelta(hours=HOURLY_WINDOW - 1)
+
+        day_column = func.date(models.RecognitionLog.recognized_at)
+        hour_column = extract("hour", models.RecognitionLog.recognized_at)
+        buckets = db.query(
+            day_column, hour_column, models.RecognitionLog.status, func.count()
+        ).filter(
+            models.RecognitionLog.recognized_at >= window_start
+        ).group_by(
+            day_column, hour_column, models.RecognitionLog.status
+        ).all()
+
+        access_counts = db.query(
+            models.AccessControl.status, func.count()
+        ).filter(
+            models.AccessControl.access_time >= today_start
+        ).group_by(
+            models.AccessControl.status
+        ).all()
+
+        devices = db.query(models.Device.id, models.Device.name, models.Device.status).all()
+
+        recent_logs = db.query(
+            models.RecognitionLog,
+            models.Member.name,
+            models.Device.name
+        ).outerjoin(
+            models.Member,
+            models.RecognitionLog.member_id == models.Member.id
+        ).join(
+            models.Device,
+            models.RecognitionLog.device_id == models.Device.id
+        ).order_by(
+            desc(models.RecognitionLog.recognized_at)
+        ).limit(RECENT_LOG_LIMIT).all()
+
+        with self._lock:
+            self._day = now.date()
+            self.today_recognitions = 0
+            self.today_success_recognitions = 0
+            self._hourly = {}
+            for day, hour, log_status, count in buckets:
+                hour_start = datetime.fromisoformat(str(day)).replace(hour=int(hour))
+                self._hourly[hour_start] = self._hourly.get(hour_start, 0) + count
+                if hour_start >= today_start:
+                    self.today_recognitions += count
+                    if log_status == "success":
+                        self.today_success_recognitions += count
+
+            self.today_access = sum(count for _, count in access_counts)
+            self.today_access_allowed = sum(count for access_status, count in access_counts if access_status == "allowed")
+
+            self._devices = {device_id: name for device_id, name, _ in devices}
+            self._online_devices = {device_id for device_id, _, device_status in devices if device_status == "online"}
+
+            self._recent = deque(
+                (self._format_log(log.id, member_name, device_name, log.recognized_at, log.status, log.confidence)
+                 for log, member_name, device_name in reversed(recent_logs)),
+                maxlen=RECENT_LOG_LIMIT
+            )
+            self.loaded = True
+
+    @staticmethod
+    def _format_log(log_id, member_name, device_name, recognized_at, log_status, confidence) -> Dict[str, Any]:
+        return {
+            "id": log_id,
+            "member_name": member_name if member_name else "未识别",
+            "device_name": device_name,
+            "recognized_at": recognized_at.isoformat(),
+            "status": log_status,
+            "confidence": confidence
+        }
+
+    def _roll_locked(self, now: datetime) -> bool:
+        """跨零点清零今日计数，并丢弃滑出窗口的小时，返回是否跨了零点"""
+        window_start = _hour_start(now) - timedelta(hours=HOURLY_WINDOW - 1)
+        for hour_start in [hour for hour in self._hourly if hour < window_start]:
+            del self._hourly[hour_start]
+        if now.date() == self._day:
+            return False
+        self._day = now.date()
+        self.today_recognitions = 0
+        self.today_success_recognitions = 0
+        self.today_access = 0
+        self.today_access_allowed = 0
+        return True
+
+    def _stats_locked(self) -> Dict[str, Any]:
+        # 工作线程与事件循环推送的增量可能乱序到达，客户端按 seq 丢弃过期的统计
+        self._seq += 1
+        return {
+            "seq": self._seq,
+            "total_devices": len(self._devices),
+            "online_devices": len(self._online_devices),
+            "today_recognitions": self.today_recognitions,
+            "today_success_rate": (
+                self.today_success_recognitions / self.today_recognitions * 100
+            ) if self.today_recognitions > 0 else 0,
+            "today_access": self.today_access,
+            "today_access_allowed": self.today_access_allowed
+        }
+
+    def _hourly_locked(self, now: datetime) -> List[Dict[str, int]]:
+        window_start = _hour_start(now) - timedelta(hours=HOURLY_WINDOW - 1)
+        return [
+            {"hour": hour_start.hour, "count": self._hourly.get(hour_start, 0)}
+            for hour_start in (window_start + timedelta(hours=i) for i in range(HOURLY_WINDOW))
+        ]
+
+    def record_recognition(
+        self,
+        log_id: Optional[int],
+        member_name: Optional[str],
+        device_id: int,
+        device_name: Optional[str],
+        log_status: str,
+        confidence: Optional[int],
+        recognized_at: Optional[datetime] = None
+    ):
+        """记录一次识别结果"""
+        recognized_at = recognized_at or datetime.now()
+        hour_start = _hour_start(recognized_at)
+        log = self._format_log(
+            log_id, member_name, device_name or self._devices.get(device_id), recognized_at, log_status, confidence
+        )
+        with self._lock:
+            rolled = self._roll_locked(datetime.now())
+            self._hourly[hour_start] = self._hourly.get(hour_start, 0) + 1
+            if recognized_at.date() == self._day:
+                self.today_recognitions += 1
+                if log_status == "success":
+                    self.today_success_recognitions += 1
+            self._recent.append(log)
+            delta = {
+                "stats": self._stats_locked(),
+                "hourly": {"hour": hour_start.hour, "count": self._hourly[hour_start]},
+                "recent_log": log
+            }
+            if rolled:
+                delta["hourly_stats"] = self._hourly_locked(datetime.now())
+        self._publish(delta)
+
+    def record_access(self, access_logs: Iterable[Dict[str, Any]]):
+        """记录一批门禁判定结果"""
+        with self._lock:
+            self._roll_locked(datetime.now())
+            for access_log in access_logs:
+                # 回放的离线事件可能发生在前一天
+                access_time = access_log.get("access_time")
+                if access_time and access_time.date() != self._day:
+                    continue
+                self.today_access += 1
+                if access_log.get("status") == "allowed":
+                    self.today_access_allowed += 1
+            delta = {"stats": self._stats_locked()}
+        self._publish(delta)
+
+    def set_device(self, device_id: int, name: str, online: bool):
+        """设备新增、改名或状态变化"""
+        with self._lock:
+            was_online = device_id in self._online_devices
+            changed = self._devices.get(device_id) != name or was_online != online
+            self._devices[device_id] = name
+            if online:
+                self._online_devices.add(device_id)
+            else:
+                self._online_devices.discard(device_id)
+            delta = {"stats": self._stats_locked()}
+        if changed:
+            self._publish(delta)
+
+    def remove_device(self, device_id: int):
+        with self._lock:
+            self._devices.pop(device_id, None)
+            self._online_devices.discard(device_id)
+            delta = {"stats": self._stats_locked()}
+        self._publish(delta)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """当前完整统计，供客户端连接后初始化"""
+        now = datetime.now()
+        with self._lock:
+            self._roll_locked(now)
+            return {
+                "stats": self._stats_locked(),
+                "hourly_stats": self._hourly_locked(now),
+                "recent_logs": list(reversed(self._recent)),
+                "loaded": self.loaded
+            }
+
+    async def run_rollover(self):
+        """每到整点滑动小时窗口（零点同时清零今日计数），并推送新的小时分布"""
+        while True:
+            now = datetime.now()
+            next_hour = _hour_start(now) + timedelta(hours=1)
+            await asyncio.sleep((next_hour - now).total_seconds() + 0.01)
+            now = datetime.now()
+            with self._lock:
+                self._roll_locked(now)
+                delta = {"stats": self._stats_locked(), "hourly_stats": self._hourly_locked(now)}
+            self._publish(delta)
+
+    def _publish(self, delta: Dict[str, Any]):
+        """把变化推送给所有仪表板客户端，可在事件循环内或工作线程中调用"""
+        message = {"type": "dashboard_delta", "timestamp": datetime.now().isoformat(), **delta}
+        # 只含计数的增量可以被同类的新增量替换，慢客户端只需收到最新的计数
+        coalesce_key = "dashboard_stats" if delta.keys() == {"stats"} else None
+        self.published_deltas += 1
+        event_bus.publish_nowait(DASHBOARD_TOPICS, message, coalesce_key, local=True)
+
+
+# 全局仪表板实时统计
+live_stats = LiveStatsAggregator()
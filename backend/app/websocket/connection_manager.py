@@ -1,34 +1,236 @@
 from fastapi.websockets import WebSocket
-from typing import List, Dict
+from collections import deque
+from typing import Deque, Dict, Iterable, List, Optional, Set, Tuple
+import asyncio
 import json
+import os
+
+# 每个客户端发送队列的容量
+WS_QUEUE_SIZE = int(os.getenv("WS_QUEUE_SIZE", "100"))
+# 单条消息的发送超时（秒），超时的客户端视为已失联
+WS_SEND_TIMEOUT = float(os.getenv("WS_SEND_TIMEOUT", "5"))
+# 客户端累计被丢弃的消息数达到该值时断开，让其重连后重新同步
+WS_MAX_DROPS = int(os.getenv("WS_MAX_DROPS", "200"))
+
+# 接收全部消息的主题，未发送过订阅请求的旧客户端默认订阅该主题
+ALL_TOPICS = "*"
+
+
+def event_topics(event_type: str, device_id: Optional[int] = None, branch_id: Optional[int] = None) -> List[str]:
+    """事件对应的主题：事件类型、设备和设备所属分支，订阅其中任意一个即可收到"""
+    topics = [f"event:{event_type}"]
+    if device_id is not None:
+        topics.append(f"device:{device_id}")
+    if branch_id is not None:
+        topics.append(f"branch:{branch_id}")
+    return topics
+
+
+class ClientConnection:
+    """单个WebSocket客户端的有界发送队列和发送任务"""
+
+    def __init__(self, websocket: WebSocket, queue_size: int):
+        self.websocket = websocket
+        self.queue_size = queue_size
+        # (合并键, 已编码的消息)
+        self.queue: Deque[Tuple[Optional[str], str]] = deque()
+        self.ready = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+        self.sent = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.closing = False
+        self.topics: Set[str] = {ALL_TOPICS}
+        # 是否发送过订阅请求
+        self.subscribed = False
+
+    def enqueue(self, text: str, coalesce_key: Optional[str] = None) -> bool:
+        """放入发送队列，返回是否需要因丢弃过多而断开该客户端"""
+        if coalesce_key is not None:
+            # 同类的状态快照只需发送最新一条，替换队列中尚未发出的旧消息
+            for index, (key, _) in enumerate(self.queue):
+                if key == coalesce_key:
+                    self.queue[index] = (coalesce_key, text)
+                    self.coalesced += 1
+                    return False
+        if len(self.queue) >= self.queue_size:
+            # 队列已满时丢弃最旧的消息
+            self.queue.popleft()
+            self.dropped += 1
+        self.queue.append((coalesce_key, text))
+        self.ready.set()
+        return self.dropped >= WS_MAX_DROPS
+
 
 class ConnectionManager:
-    """WebSocket连接管理器，处理客户端连接和消息广播"""
-    
-    def __init__(self):
-        # 活跃的WebSocket连接列表
-        self.active_connections: List[WebSocket] = []
-        
+    """WebSocket连接管理器，处理客户端连接和消息广播
+
+    每个客户端有独立的有界发送队列和发送任务，广播只把编码一次的消息放入各队列，
+    不等待任何一个客户端发送完成。慢客户端的队列满时丢弃最旧的消息或合并同类消息，
+    丢弃过多或发送超时的客户端会被断开。
+
+    客户端可按分支、设备、事件类型订阅主题（branch:1、device:3、event:recognition_status），
+    管理器维护主题到连接的索引，publish 只投递给订阅了相关主题的连接。
+    """
+
+    def __init__(self, queue_size: int = WS_QUEUE_SIZE):
+        self.queue_size = queue_size
+        # 活跃的WebSocket连接
+        self.clients: Dict[WebSocket, ClientConnection] = {}
+        # 主题 -> 订阅该主题的客户端
+        self.topics: Dict[str, Set[ClientConnection]] = {}
+        # 统计信息
+        self.broadcast_count = 0
+        self.publish_count = 0
+        self.slow_disconnects = 0
+        # 已断开客户端的累计计数
+        self._closed_sent = 0
+        self._closed_dropped = 0
+        self._closed_coalesced = 0
+
+    @property
+    def active_connections(self) -> List[WebSocket]:
+        return list(self.clients)
+
     async def connect(self, websocket: WebSocket):
         """处理新的WebSocket连接"""
         await websocket.accept()
-        self.active_connections.append(websocket)
-        
+        client = ClientConnection(websocket, self.queue_size)
+        client.task = asyncio.create_task(self._sender(client))
+        self.clients[websocket] = client
+        self._index(client, client.topics)
+
     def disconnect(self, websocket: WebSocket):
         """处理WebSocket断开连接"""
-        if websocket in self.active_connections:
-            self.active_connections.remove(websocket)
-            
+        client = self.clients.pop(websocket, None)
+        if client is None:
+            return
+        self._unindex(client, client.topics)
+        self._closed_sent += client.sent
+        self._closed_dropped += client.dropped
+        self._closed_coalesced += client.coalesced
+        if client.task is not None and client.task is not asyncio.current_task():
+            client.task.cancel()
+
+    def _index(self, client: ClientConnection, topics: Iterable[str]):
+        for topic in topics:
+            self.topics.setdefault(topic, set()).add(client)
+
+    def _unindex(self, client: ClientConnection, topics: Iterable[str]):
+        for topic in topics:
+            subscribers = self.topics.get(topic)
+            if subscribers is None:
+                continue
+            subscribers.discard(client)
+            if not subscribers:
+                del self.topics[topic]
+
+    def subscribe(self, websocket: WebSocket, topics: Iterable[str]) -> List[str]:
+        """订阅主题，返回订阅后的主题列表
+
+        首次订阅具体主题时取消默认的全部订阅；需要继续接收全部消息的客户端可显式订阅 "*"。
+        """
+        client = self.clients.get(websocket)
+        if client is None:
+            return []
+        topics = {str(topic) for topic in topics}
+        if not client.subscribed:
+            client.subscribed = True
+            self._unindex(client, client.topics)
+            client.topics = set()
+        new_topics = topics - client.topics
+        client.topics |= new_topics
+        self._index(client, new_topics)
+        return sorted(client.topics)
+
+    def unsubscribe(self, websocket: WebSocket, topics: Iterable[str]) -> List[str]:
+        """取消订阅主题，返回剩余的主题列表"""
+        client = self.clients.get(websocket)
+        if client is None:
+            return []
+        removed = client.topics & {str(topic) for topic in topics}
+        client.topics -= removed
+        self._unindex(client, removed)
+        return sorted(client.topics)
+
+    async def _sender(self, client: ClientConnection):
+        """按顺序发送客户端队列中的消息"""
+        try:
+            while True:
+                await client.ready.wait()
+                while client.queue:
+                    _, text = client.queue.popleft()
+                    await asyncio.wait_for(client.websocket.send_text(text), WS_SEND_TIMEOUT)
+                    client.sent += 1
+                client.ready.clear()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"发送消息失败: {e}")
+            self.disconnect(client.websocket)
+
+    async def _drop_slow_client(self, client: ClientConnection):
+        self.slow_disconnects += 1
+        self.disconnect(client.websocket)
+        try:
+            await client.websocket.close(code=1013)
+        except Exception:
+            pass
+
+    def _enqueue(self, client: ClientConnection, text: str, coalesce_key: Optional[str] = None):
+        if client.closing:
+            return
+        if client.enqueue(text, coalesce_key):
+            client.closing = True
+            asyncio.create_task(self._drop_slow_client(client))
+
     async def send_personal_message(self, message: dict, websocket: WebSocket):
         """向特定客户端发送消息"""
-        await websocket.send_text(json.dumps(message))
-        
-    async def broadcast(self, message: dict):
-        """向所有连接的客户端广播消息"""
-        for connection in self.active_connections:
-            try:
-                await connection.send_text(json.dumps(message))
-            except Exception as e:
-                print(f"广播消息失败: {e}")
-                # 如果发送失败，可能是连接已断开，从活跃连接中移除
-                self.disconnect(connection)
+        client = self.clients.get(websocket)
+        if client is None:
+            await websocket.send_text(json.dumps(message))
+            return
+        self._enqueue(client, json.dumps(message))
+
+    async def broadcast(self, message: dict, coalesce_key: Optional[str] = None):
+        """向所有连接的客户端广播消息
+
+        消息只编码一次；coalesce_key 相同的消息在客户端队列中只保留最新一条。
+        """
+        text = json.dumps(message)
+        self.broadcast_count += 1
+        for client in list(self.clients.values()):
+            self._enqueue(client, text, coalesce_key)
+
+    async def publish(self, topics: Iterable[str], message: dict, coalesce_key: Optional[str] = None):
+        """把消息投递给订阅了任一主题的客户端（以及订阅全部消息的客户端）
+
+        开销只与相关订阅者数量有关，与连接总数无关；同时命中多个主题的客户端只收到一次。
+        """
+        recipients: Set[ClientConnection] = set(self.topics.get(ALL_TOPICS, ()))
+        for topic in topics:
+            subscribers = self.topics.get(topic)
+            if subscribers:
+                recipients |= subscribers
+        self.publish_count += 1
+        if not recipients:
+            return
+        text = json.dumps(message)
+        for client in recipients:
+            self._enqueue(client, text, coalesce_key)
+
+    def stats(self) -> dict:
+        depths = [len(client.queue) for client in self.clients.values()]
+        return {
+            "connections": len(self.clients),
+            "queue_size": self.queue_size,
+            "max_queue_depth": max(depths, default=0),
+            "total_queue_depth": sum(depths),
+            "topics": len(self.topics),
+            "broadcast_count": self.broadcast_count,
+            "publish_count": self.publish_count,
+            "sent": self._closed_sent + sum(client.sent for client in self.clients.values()),
+            "dropped": self._closed_dropped + sum(client.dropped for client in self.clients.values()),
+            "coalesced": self._closed_coalesced + sum(client.coalesced for client in self.clients.values()),
+            "slow_disconnects": self.slow_disconnects
+        }
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+仪表板统计接口基准测试
+
+向 recognition_logs 填充指定行数（默认1000万行，分布在最近若干天内），
+把识别记录全部汇总到 log_rollups 后，多次调用 get_dashboard_statistics，
+统计每次调用执行的SQL语句数和耗时分布。
+
+    python database/benchmark_dashboard.py --rows 10000000 --repeat 20
+    python database/benchmark_dashboard.py --skip-seed --repeat 50
+"""
+
+import sys
+import os
+import argparse
+import asyncio
+import random
+import statistics
+import time
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, event, func, insert, select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from app.database.database import DATABASE_URL, ASYNC_DATABASE_URL
+from app.models import models
+from app.services.dashboard_service import get_dashboard_statistics
+from app.services.log_rollup import LogRollupJob, SOURCES
+
+
+def seed(rows: int, days: int, batch_size: int, device_count: int):
+    """把识别记录补齐到指定行数"""
+    engine = create_engine(DATABASE_URL, echo=False)
+    models.Base.metadata.create_all(bind=engine)
+
+    with engine.begin() as conn:
+        device_ids = [row[0] for row in conn.execute(select(models.Device.id))]
+        if len(device_ids) < device_count:
+            conn.execute(insert(models.Device), [
+                {"name": f"基准测试设备{i}", "ip_address": f"10.0.0.{i % 250}", "port": 4370, "status": "online"}
+                for i in range(device_count - len(device_ids))
+            ])
+            device_ids = [row[0] for row in conn.execute(select(models.Device.id))]
+        member_ids = [row[0] for row in conn.execute(select(models.Member.id).limit(10000))] or [None]
+        existing = conn.execute(select(func.count(models.RecognitionLog.id))).scalar()
+
+    remaining = rows - existing
+    print(f"现有识别记录 {existing} 行，需要补充 {max(remaining, 0)} 行")
+    now = datetime.now()
+    span_seconds = days * 86400
+    table = models.RecognitionLog.__table__
+    started = time.perf_counter()
+    inserted = 0
+    while inserted < remaining:
+        count = min(batch_size, remaining - inserted)
+        batch = []
+        for _ in range(count):
+            success = random.random() < 0.9
+            batch.append({
+                "member_id": random.choice(member_ids) if success else None,
+                "device_id": random.choice(device_ids),
+                "recognized_at": now - timedelta(seconds=random.randrange(span_seconds)),
+                "status": "success" if success else "failed",
+                "confidence": random.randint(60, 100) if success else 0,
+                "recognition_type": "fingerprint"
+            })
+        with engine.begin() as conn:
+            conn.execute(table.insert(), batch)
+        inserted += count
+        elapsed = time.perf_counter() - started
+        print(f"\r已插入 {inserted}/{remaining} 行，{inserted / elapsed:.0f} 行/秒", end="", flush=True)
+    if remaining > 0:
+        print()
+    engine.dispose()
+
+
+def backfill_rollups():
+    """运行汇总任务直到追平 recognition_logs，仪表板读取的小时汇总才包含全部填充的记录"""
+    engine = create_engine(DATABASE_URL, echo=False)
+    models.Base.metadata.create_all(bind=engine)
+    source = next(source for source in SOURCES if source.name == "recognition")
+    checkpoint = models.ProcessingCheckpoint
+
+    def progress():
+        with engine.connect() as conn:
+            target = conn.execute(select(func.max(models.RecognitionLog.id))).scalar() or 0
+            done = conn.execute(
+                select(checkpoint.last_id).where(checkpoint.name == source.checkpoint)
+            ).scalar() or 0
+        return done, target
+
+    job = LogRollupJob()
+    started = time.perf_counter()
+    done, target = progress()
+    while done < target:
+        # 每轮只处理到上一轮观察到的最大ID，首轮只记录最大ID
+        job.run_once()
+        done, target = progress()
+        print(f"\r已汇总到识别记录ID {done}/{target}", end="", flush=True)
+    if job.processed_rows["recognition"]:
+        print()
+    print(f"log_rollups 已追平，本次汇总 {job.processed_rows['recognition']} 行，"
+          f"耗时 {time.perf_counter() - started:.1f} 秒")
+    engine.dispose()
+
+
+async def benchmark(repeat: int):
+    """多次调用仪表板统计，输出每次调用的语句数和耗时"""
+    engine = create_async_engine(ASYNC_DATABASE_URL, echo=False)
+    session_factory = async_sessionmaker(engine, expire_on_commit=False)
+
+    statement_count = 0
+
+    def count_statement(*args):
+        nonlocal statement_count
+        statement_count += 1
+
+    event.listen(engine.sync_engine, "before_cursor_execute", count_statement)
+
+    latencies = []
+    statements = []
+    async with session_factory() as db:
+        total_rows = await db.scalar(select(func.count(models.RecognitionLog.id)))
+        # 预热连接池和缓冲池
+        await get_dashboard_statistics(db)
+        for _ in range(repeat):
+            statement_count = 0
+            started = time.perf_counter()
+            await get_dashboard_statistics(db)
+            latencies.append((time.perf_counter() - started) * 1000)
+            statements.append(statement_count)
+    await engine.dispose()
+
+    latencies.sort()
+    print(f"recognition_logs 行数: {total_rows}")
+    print(f"调用次数: {repeat}")
+    print(f"每次调用SQL语句数: {min(statements)}-{max(statements)}")
+    print(f"耗时(ms): 平均 {statistics.mean(latencies):.1f}  "
+          f"P50 {latencies[len(latencies) // 2]:.1f}  "
+          f"P95 {latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]:.1f}  "
+          f"最大 {latencies[-1]:.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="仪表板统计接口基准测试")
+    parser.add_argument("--rows", type=int, default=10_000_000, help="识别记录目标行数 (默认: 10000000)")
+    parser.add_argument("--days", type=int, default=30, help="记录分布的天数 (默认: 30)")
+    parser.add_argument("--batch-size", type=int, default=20000, help="每批插入行数 (默认: 20000)")
+    parser.add_argument("--devices", type=int, default=20, help="设备数量 (默认: 20)")
+    parser.add_argument("--repeat", type=int, default=20, help="统计调用次数 (默认: 20)")
+    parser.add_argument("--skip-seed", action="store_true", help="跳过数据填充，直接测试")
+    args = parser.parse_args()
+
+    if not args.skip_seed:
+        seed(args.rows, args.days, args.batch_size, args.devices)
+    backfill_rollups()
+    asyncio.run(benchmark(args.repeat))
@@ -6,7 +6,7 @@ from sqlalchemy import text
 # Add the parent directory to the path so we can import the app modules
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from app.database.database import engine
+from app.database.database import async_engine
 from app.models.models import Base
 
 
@@ -17,7 +17,7 @@ async def init_db():
     print("正在创建数据库表...")
     
     # 创建所有表
-    async with engine.begin() as conn:
+    async with async_engine.begin() as conn:
         await conn.run_sync(Base.metadata.drop_all)
         await conn.run_sync(Base.metadata.create_all)
     
@@ -34,7 +34,7 @@ async def init_db():
             sql_script = f.read()
         
         # 执行SQL脚本
-        async with engine.begin() as conn:
+        async with async_engine.begin() as conn:
             # 分割SQL语句并执行
             for statement in sql_script.split(';'):
                 if statement.strip():
@@ -8,9 +8,12 @@ import sys
 import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from sqlalchemy import create_engine, text
+from sqlalchemy import create_engine, delete, func, inspect, select, text, update
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.orm import sessionmaker
 from app.database.database import DATABASE_URL, Base
 from app.models import models
+from app.services.attendance_service import rebuild_daily_summaries
 
 def create_tables():
     """创建所有数据表"""
@@ -25,6 +28,15 @@ def create_tables():
         
         print("数据表创建成功！")
         
+        # create_all 不会为已存在的表补加新增的字段
+        add_missing_columns(engine)
+        
+        # 唯一索引 (member_id, date) 建立前先合并已有的重复考勤记录
+        merge_duplicate_attendance_records(engine)
+        
+        # create_all 不会为已存在的表补建索引
+        create_missing_indexes(engine)
+        
         # 插入一些初始数据
         insert_initial_data(engine)
         
@@ -34,6 +46,95 @@ def create_tables():
     
     return True
 
+# MySQL 错误码：字段名已存在、索引名已存在
+ER_DUP_FIELDNAME = 1060
+ER_DUP_KEYNAME = 1061
+
+# 已有表中后来新增的字段：(表名, 字段名, 字段定义)
+ADDED_COLUMNS = [
+    ("branches", "auto_checkout_hours", "INT NULL"),
+    ("attendance_daily_summaries", "auto_closed", "INT NOT NULL DEFAULT 0"),
+]
+
+def add_missing_columns(engine):
+    """为已存在的表补加新增的字段，已有该字段时跳过"""
+    inspector = inspect(engine)
+    for table_name, column_name, definition in ADDED_COLUMNS:
+        if not inspector.has_table(table_name):
+            continue
+        if any(column["name"] == column_name for column in inspector.get_columns(table_name)):
+            continue
+        try:
+            with engine.begin() as conn:
+                conn.execute(text(f"ALTER TABLE {table_name} ADD COLUMN {column_name} {definition}"))
+            print(f"已为 {table_name} 添加字段 {column_name}")
+        except DBAPIError as e:
+            if e.orig is None or e.orig.args[:1] != (ER_DUP_FIELDNAME,):
+                raise RuntimeError(f"添加字段 {table_name}.{column_name} 失败: {e}") from e
+
+def create_missing_indexes(engine):
+    """为已存在的表补建模型中新增的索引
+
+    只忽略索引已存在的错误（例如另一个进程同时补建），其他错误（唯一索引遇到重复数据、
+    权限不足等）直接抛出，初始化以失败退出，不会在缺少索引的情况下继续运行。
+    """
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            try:
+                index.create(bind=engine, checkfirst=True)
+            except DBAPIError as e:
+                if e.orig is None or e.orig.args[:1] != (ER_DUP_KEYNAME,):
+                    raise RuntimeError(f"创建索引 {index.name} 失败: {e}") from e
+
+def merge_duplicate_attendance_records(engine):
+    """合并同一会员同一天的多条考勤记录
+
+    保留ID最小的一条，签到时间取最早、签退时间取最晚并重新计算停留时间，删除其余记录，
+    再按考勤记录重算涉及日期的当日汇总。
+    """
+    record = models.AttendanceRecord
+    if not inspect(engine).has_table(record.__tablename__):
+        return
+    session = sessionmaker(bind=engine)()
+    try:
+        groups = session.execute(
+            select(
+                record.member_id,
+                record.date,
+                func.min(record.id),
+                func.min(record.check_in_time),
+                func.max(record.check_out_time)
+            ).where(
+                record.date.is_not(None)
+            ).group_by(
+                record.member_id, record.date
+            ).having(func.count() > 1)
+        ).all()
+        if not groups:
+            return
+        
+        for member_id, record_date, keep_id, check_in_time, check_out_time in groups:
+            values = {"check_in_time": check_in_time, "check_out_time": check_out_time}
+            if check_in_time and check_out_time:
+                values["duration_minutes"] = int((check_out_time - check_in_time).total_seconds() // 60)
+                values["status"] = "complete"
+            session.execute(update(record).where(record.id == keep_id).values(**values))
+            session.execute(delete(record).where(
+                record.member_id == member_id,
+                record.date == record_date,
+                record.id != keep_id
+            ))
+        
+        dates = [record_date for _, record_date, *_ in groups]
+        rebuild_daily_summaries(session, min(dates), max(dates))
+        session.commit()
+        print(f"已合并 {len(groups)} 组重复的考勤记录")
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+
 def insert_initial_data(engine):
     """插入初始数据"""
     try:
@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+"""
+重建考勤每日汇总
+
+按 attendance_records 重新计算指定日期范围内的 attendance_daily_summaries，
+用于首次上线汇总表时回填历史数据，或修正手工改动考勤记录后的汇总。
+重建当天的汇总时应避开签到高峰，重建期间的签到签退可能被覆盖。
+
+    python database/rebuild_attendance_summary.py
+    python database/rebuild_attendance_summary.py --start 2024-01-01 --end 2024-01-31
+"""
+
+import sys
+import os
+import argparse
+from datetime import date
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.database.database import SessionLocal, engine
+from app.models import models
+from app.services.attendance_service import rebuild_daily_summaries
+
+
+def rebuild(start_date, end_date):
+    models.Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        rows = rebuild_daily_summaries(db, start_date, end_date)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+    scope = f"{start_date or '最早'} 至 {end_date or '最新'}"
+    print(f"已重建 {scope} 的考勤汇总，共 {rows} 行")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="重建考勤每日汇总")
+    parser.add_argument("--start", type=date.fromisoformat, default=None, help="开始日期 YYYY-MM-DD (默认: 全部)")
+    parser.add_argument("--end", type=date.fromisoformat, default=None, help="结束日期 YYYY-MM-DD (默认: 全部)")
+    args = parser.parse_args()
+
+    rebuild(args.start, args.end)
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+签到签退并发压力测试
+
+为若干测试会员同时发起大量重复的签到、签退刷卡（模拟连续双击），检查：
+每个会员当天只有一条考勤记录、签到和签退各只成功一次、当日汇总与考勤记录一致；
+并输出吞吐量、延迟分布和测试期间 InnoDB 行锁等待的增量。
+
+    python database/stress_check_in_out.py --members 500 --taps 4 --workers 64
+"""
+
+import sys
+import os
+import argparse
+import random
+import statistics
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, delete, func, insert, select, text
+from sqlalchemy.orm import sessionmaker
+from app.database.database import DATABASE_URL
+from app.models import models
+from app.services.attendance_service import check_in, check_out, get_daily_summary, rebuild_daily_summaries
+
+PHONE_PREFIX = "stress-"
+
+
+def prepare(engine, member_count: int):
+    """创建测试会员和设备，并清除它们今天的考勤记录"""
+    models.Base.metadata.create_all(bind=engine)
+    today = date.today()
+    with engine.begin() as conn:
+        existing = conn.execute(
+            select(func.count(models.Member.id)).where(models.Member.phone.like(f"{PHONE_PREFIX}%"))
+        ).scalar()
+        if existing < member_count:
+            conn.execute(insert(models.Member), [
+                {"name": f"压测会员{i}", "phone": f"{PHONE_PREFIX}{i}", "status": "active"}
+                for i in range(existing, member_count)
+            ])
+        member_ids = [row[0] for row in conn.execute(
+            select(models.Member.id).where(models.Member.phone.like(f"{PHONE_PREFIX}%")).order_by(models.Member.id).limit(member_count)
+        )]
+        device_id = conn.execute(select(models.Device.id).where(models.Device.name == "压测设备")).scalar()
+        if device_id is None:
+            device_id = conn.execute(insert(models.Device).values(
+                name="压测设备", ip_address="10.255.0.1", port=4370, status="online"
+            )).inserted_primary_key[0]
+        branch_id = conn.execute(select(models.Device.branch_id).where(models.Device.id == device_id)).scalar()
+        conn.execute(delete(models.AttendanceRecord).where(
+            models.AttendanceRecord.member_id.in_(member_ids),
+            models.AttendanceRecord.date == today
+        ))
+    # 删除记录后重算今天的汇总
+    session = sessionmaker(bind=engine)()
+    try:
+        rebuild_daily_summaries(session, today, today)
+        session.commit()
+    finally:
+        session.close()
+    return member_ids, device_id, branch_id
+
+
+def row_lock_status(engine) -> dict:
+    with engine.connect() as conn:
+        rows = conn.execute(text("SHOW GLOBAL STATUS LIKE 'Innodb_row_lock%'")).all()
+    return {name: int(value) for name, value in rows}
+
+
+def run_phase(session_factory, scans, workers: int):
+    """并发执行一组刷卡，每次刷卡返回 (会员ID, 是否成功, 延迟毫秒, 异常)"""
+
+    def scan(item):
+        check_type, member_id, device_id, branch_id = item
+        db = session_factory()
+        started = time.perf_counter()
+        try:
+            if check_type == "check_in":
+                result = check_in(db, member_id, device_id, branch_id, datetime.now())
+            else:
+                result = check_out(db, member_id, datetime.now())
+            return member_id, result.success, (time.perf_counter() - started) * 1000, None
+        except Exception as e:
+            db.rollback()
+            return member_id, False, (time.perf_counter() - started) * 1000, e
+        finally:
+            db.close()
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        outcomes = list(executor.map(scan, scans))
+    return outcomes
+
+
+def report(name: str, outcomes, elapsed: float, member_count: int) -> bool:
+    successes = Counter(member_id for member_id, success, _, error in outcomes if success)
+    errors = [error for *_, error in outcomes if error is not None]
+    latencies = sorted(latency for _, _, latency, _ in outcomes)
+    ok = len(successes) == member_count and all(count == 1 for count in successes.values()) and not errors
+    print(f"{name}: {len(outcomes)} 次刷卡，{len(outcomes) / elapsed:.0f} 次/秒，"
+          f"成功 {sum(successes.values())} 次（应为 {member_count}），错误 {len(errors)} 次")
+    print(f"    延迟(ms): 平均 {statistics.mean(latencies):.1f}  "
+          f"P50 {latencies[len(latencies) // 2]:.1f}  "
+          f"P95 {latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]:.1f}  "
+          f"最大 {latencies[-1]:.1f}")
+    for error in errors[:5]:
+        print(f"    错误: {error}")
+    return ok
+
+
+def main(member_count: int, taps: int, workers: int):
+    engine = create_engine(DATABASE_URL, echo=False, pool_size=workers, max_overflow=0)
+    session_factory = sessionmaker(bind=engine, autocommit=False, autoflush=False)
+    member_ids, device_id, branch_id = prepare(engine, member_count)
+    today = date.today()
+
+    before = row_lock_status(engine)
+    passed = True
+    for check_type in ("check_in", "check_out"):
+        scans = [(check_type, member_id, device_id, branch_id) for member_id in member_ids for _ in range(taps)]
+        random.shuffle(scans)
+        started = time.perf_counter()
+        outcomes = run_phase(session_factory, scans, workers)
+        passed = report(check_type, outcomes, time.perf_counter() - started, member_count) and passed
+    after = row_lock_status(engine)
+    print("行锁等待增量: " + "  ".join(f"{name}={after[name] - before.get(name, 0)}" for name in after))
+
+    with engine.connect() as conn:
+        duplicates = conn.execute(
+            select(models.AttendanceRecord.member_id).where(
+                models.AttendanceRecord.member_id.in_(member_ids),
+                models.AttendanceRecord.date == today
+            ).group_by(models.AttendanceRecord.member_id).having(func.count() > 1)
+        ).all()
+        incomplete = conn.execute(
+            select(func.count()).select_from(models.AttendanceRecord).where(
+                models.AttendanceRecord.member_id.in_(member_ids),
+                models.AttendanceRecord.date == today,
+                models.AttendanceRecord.check_out_time.is_(None)
+            )
+        ).scalar()
+    print(f"重复记录的会员: {len(duplicates)}，未签退的记录: {incomplete}")
+    passed = passed and not duplicates and not incomplete
+
+    # 增量维护的汇总应与按考勤记录重算的结果一致
+    session = session_factory()
+    try:
+        incremental = get_daily_summary(session, today)
+        rebuild_daily_summaries(session, today, today)
+        rebuilt = get_daily_summary(session, today)
+        session.rollback()
+    finally:
+        session.close()
+    print(f"当日汇总: 增量 {incremental}\n          重算 {rebuilt}")
+    passed = passed and incremental == rebuilt
+
+    engine.dispose()
+    print("通过" if passed else "失败")
+    return passed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="签到签退并发压力测试")
+    parser.add_argument("--members", type=int, default=500, help="测试会员数量 (默认: 500)")
+    parser.add_argument("--taps", type=int, default=4, help="每个会员每次签到/签退的重复刷卡次数 (默认: 4)")
+    parser.add_argument("--workers", type=int, default=64, help="并发线程数 (默认: 64)")
+    args = parser.parse_args()
+
+    sys.exit(0 if main(args.members, args.taps, args.workers) else 1)
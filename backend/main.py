@@ -1,15 +1,16 @@
-from fastapi import FastAPI, Depends, HTTPException, status
+from fastapi import FastAPI, Depends, HTTPException, Query, status
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from fastapi.responses import JSONResponse
 from fastapi.websockets import WebSocket, WebSocketDisconnect
+from pydantic import ValidationError
 from typing import List, Dict, Optional
 import uvicorn
 import asyncio
 import json
 from datetime import datetime, timedelta
 
-from app.database.database import engine, get_db
+from app.database.database import engine, get_db, get_async_db, SessionLocal, async_engine
 from app.models import models
 from app.api.member import router as member_router
 from app.api.device import router as device_router
@@ -17,7 +18,26 @@ from app.api.fingerprint import router as fingerprint_router
 from app.api.branch import router as branch_router
 from app.api.access import router as access_router
 from app.api.attendance import router as attendance_router
+from app.api.card import router as card_router
+from app.api.pagination import NEXT_CURSOR_HEADER
+from app.api.fingerprint import schemas as fingerprint_schemas
+from app.api.access import schemas as access_schemas
 from app.websocket.connection_manager import ConnectionManager
+from app.services.access_index import permission_index
+from app.services.access_audit import access_audit_writer
+from app.services.fingerprint_matcher import template_gallery
+from app.services.candidate_index import candidate_index
+from app.services.card_index import card_index
+from app.services.index_sync import index_resync_job
+from app.services.middleware_client import middleware_client
+from app.services.stats_aggregator import live_stats
+from app.services.event_bus import event_bus
+from app.services.log_rollup import log_rollup_job, GRANULARITY_SECONDS
+from app.services.attendance_consumer import attendance_consumer
+from app.services.attendance_sweeper import attendance_sweeper
+from app.services.job_engine import job_engine, JobQueueFullError
+from app.services.fingerprint_service import run_enroll_job, run_recognize_job
+from app.services.access_service import check_access_async
 
 # 创建数据库表
 models.Base.metadata.create_all(bind=engine)
@@ -31,11 +51,23 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER],
 )
 
 # WebSocket连接管理器
 manager = ConnectionManager()
 
+# 设备任务的处理函数，进度和结果通过连接管理器发给发起者
+job_engine.register("enrollment", run_enroll_job)
+job_engine.register("recognition", run_recognize_job)
+job_engine.attach(manager)
+
+# WebSocket消息类型 -> (任务类型, 请求模型)
+WS_JOB_REQUESTS = {
+    "enrollment_request": ("enrollment", fingerprint_schemas.FingerprintEnrollRequest),
+    "recognition_request": ("recognition", fingerprint_schemas.FingerprintRecognitionRequest),
+}
+
 # 注册路由
 app.include_router(member_router.router, prefix="/api/members", tags=["members"])
 app.include_router(device_router.router, prefix="/api/devices", tags=["devices"])
@@ -43,17 +75,150 @@ app.include_router(fingerprint_router.router, prefix="/api/fingerprints", tags=[
 app.include_router(branch_router.router, prefix="/api/branches", tags=["branches"])
 app.include_router(access_router.router, prefix="/api/access", tags=["access"])
 app.include_router(attendance_router.router, prefix="/api/attendance", tags=["attendance"])
+app.include_router(card_router.router, prefix="/api/cards", tags=["cards"])
+
+@app.on_event("startup")
+def load_in_memory_indexes():
+    """启动时加载进程内索引"""
+    db = SessionLocal()
+    try:
+        permission_index.load(db)
+        candidate_index.load(db)
+        card_index.load(db)
+    except Exception as e:
+        # 加载失败时，首次门禁请求会再次尝试加载
+        print(f"加载访问权限索引失败: {e}")
+    try:
+        template_gallery.restore(db)
+    except Exception as e:
+        print(f"加载指纹模板库失败: {e}")
+    try:
+        live_stats.rebuild(db)
+    except Exception as e:
+        print(f"重建仪表板统计失败: {e}")
+    finally:
+        db.close()
+
+@app.on_event("startup")
+async def start_event_bus():
+    """连接事件总线，总线收到的事件推送给本进程的WebSocket连接"""
+    await event_bus.start(manager)
+
+@app.on_event("startup")
+async def start_live_stats():
+    """仪表板统计在整点滑动小时窗口"""
+    app.state.live_stats_task = asyncio.create_task(live_stats.run_rollover())
+
+@app.on_event("startup")
+def start_background_workers():
+    """启动后台写入任务"""
+    access_audit_writer.start()
+    template_gallery.start_compactor()
+    log_rollup_job.start()
+    index_resync_job.start()
+    attendance_consumer.start()
+    attendance_sweeper.start()
+
+@app.on_event("shutdown")
+def stop_background_workers():
+    """停止后台任务，并写入队列中剩余的日志"""
+    access_audit_writer.stop()
+    template_gallery.close()
+    log_rollup_job.stop()
+    index_resync_job.stop()
+    attendance_consumer.stop()
+    attendance_sweeper.stop()
+
+@app.on_event("shutdown")
+async def stop_live_stats():
+    """停止整点滑动任务"""
+    app.state.live_stats_task.cancel()
+
+@app.on_event("shutdown")
+async def stop_job_engine():
+    """取消设备任务"""
+    await job_engine.stop()
+
+@app.on_event("shutdown")
+async def stop_event_bus():
+    """断开事件总线"""
+    await event_bus.stop()
+
+@app.on_event("shutdown")
+async def close_middleware_client():
+    """关闭中间件连接池"""
+    await middleware_client.close()
+
+@app.on_event("shutdown")
+async def dispose_async_engine():
+    """关闭异步数据库连接池"""
+    await async_engine.dispose()
 
 @app.get("/")
 async def root():
     return {"message": "ZKTeco K40生物识别系统API"}
 
 @app.get("/api/dashboard/stats")
-async def get_dashboard_stats(db = Depends(get_db)):
+async def get_dashboard_stats(db = Depends(get_async_db)):
     """获取仪表板统计数据"""
     from app.services.dashboard_service import get_dashboard_statistics
     return await get_dashboard_statistics(db)
 
+@app.get("/api/dashboard/timeseries")
+async def get_dashboard_timeseries(
+    source: str = Query("recognition", pattern="^(recognition|access)$", description="recognition 或 access"),
+    start: Optional[datetime] = Query(None, description="开始时间，默认为结束时间前24小时"),
+    end: Optional[datetime] = Query(None, description="结束时间，默认为当前时间"),
+    granularity: Optional[str] = Query(None, pattern="^(minute|hour|day)$", description="不指定时按时间范围自动选择"),
+    device_id: Optional[int] = None,
+    branch_id: Optional[int] = None,
+    status: Optional[str] = None,
+    db = Depends(get_async_db)
+):
+    """获取识别/访问次数的时间序列，读取分钟/小时/天汇总表"""
+    from app.services.dashboard_service import get_timeseries, minute_retention_start, TIMESERIES_MAX_POINTS
+    end = end or datetime.now()
+    start = start or end - timedelta(hours=24)
+    if start >= end:
+        raise HTTPException(status_code=400, detail="开始时间必须早于结束时间")
+    retention_start = minute_retention_start()
+    if granularity == "minute" and retention_start and start < retention_start:
+        # 过期的分钟汇总已被清理，查询只会得到全0
+        raise HTTPException(status_code=400, detail="分钟粒度只保留最近的数据，请使用小时或天粒度")
+    if granularity and (end - start).total_seconds() / GRANULARITY_SECONDS[granularity] > TIMESERIES_MAX_POINTS:
+        raise HTTPException(status_code=400, detail="时间范围过大，请使用更粗的粒度")
+    return await get_timeseries(db, source, start, end, granularity, device_id, branch_id, status)
+
+@app.get("/api/dashboard/rollup/stats")
+def get_rollup_stats():
+    """获取日志汇总任务的进度和延迟"""
+    return log_rollup_job.stats()
+
+@app.get("/api/dashboard/live")
+def get_live_dashboard_stats():
+    """获取进程内维护的实时统计，客户端以此初始化后通过 WebSocket 接收 dashboard_delta 增量"""
+    return live_stats.snapshot()
+
+@app.get("/api/ws/stats")
+def get_websocket_stats():
+    """获取WebSocket连接数、发送队列深度、丢弃的消息数和事件总线状态"""
+    stats = manager.stats()
+    stats["event_bus"] = event_bus.stats()
+    return stats
+
+@app.get("/api/jobs/stats")
+def get_job_stats():
+    """获取各设备任务队列的长度和任务计数"""
+    return job_engine.stats()
+
+@app.get("/api/jobs/{job_id}")
+def get_job(job_id: str):
+    """查询设备任务状态"""
+    job = job_engine.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    return job.info()
+
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
     await manager.connect(websocket)
@@ -63,20 +228,56 @@ async def websocket_endpoint(websocket: WebSocket):
             message = json.loads(data)
             
             # 处理不同类型的消息
-            if message.get("type") == "enrollment_request":
-                # 处理指纹录入请求
-                await manager.broadcast({"type": "enrollment_status", "message": "开始录入指纹..."})
-                # 这里应该调用中间件服务
-            
-            elif message.get("type") == "recognition_request":
-                # 处理指纹识别请求
-                await manager.broadcast({"type": "recognition_status", "message": "开始识别指纹..."})
-                # 这里应该调用中间件服务
+            if message.get("type") in ("subscribe", "unsubscribe"):
+                # 订阅或取消订阅主题，如 {"type": "subscribe", "topics": ["branch:1", "event:recognition_status"]}
+                topics = message.get("topics")
+                if not isinstance(topics, list):
+                    topics = []
+                if message["type"] == "subscribe":
+                    subscribed = manager.subscribe(websocket, topics)
+                else:
+                    subscribed = manager.unsubscribe(websocket, topics)
+                await manager.send_personal_message({"type": "subscriptions", "topics": subscribed}, websocket)
             
             elif message.get("type") == "access_control_request":
-                # 处理访问控制请求
-                await manager.broadcast({"type": "access_control_result", "message": "处理访问控制..."})
-                # 这里应该调用访问控制逻辑
+                # 门禁判定直接查询进程内权限索引，不排入设备任务队列，结果只发给本连接
+                try:
+                    request = access_schemas.AccessControlRequest(**message)
+                    result = await check_access_async(request)
+                except Exception as e:
+                    reply = {"success": False, "message": str(e)}
+                else:
+                    reply = result.model_dump(mode="json")
+                await manager.send_personal_message({
+                    "type": "access_control_result",
+                    **reply,
+                    "request_id": message.get("request_id"),
+                    "timestamp": datetime.now().isoformat()
+                }, websocket)
+            
+            elif message.get("type") in WS_JOB_REQUESTS:
+                # 指纹录入和识别请求排入设备任务队列，立即返回任务ID，
+                # 进度（*_status）和结果（*_result）只发给本连接
+                kind, request_model = WS_JOB_REQUESTS[message["type"]]
+                try:
+                    request = request_model(**message)
+                    job = job_engine.submit(kind, request.device_id, request, websocket)
+                except (ValidationError, JobQueueFullError) as e:
+                    await manager.send_personal_message({
+                        "type": f"{kind}_result",
+                        "success": False,
+                        "message": str(e),
+                        "request_id": message.get("request_id")
+                    }, websocket)
+                    continue
+                await manager.send_personal_message({
+                    "type": "job_accepted",
+                    "job_id": job.id,
+                    "kind": kind,
+                    "device_id": job.device_id,
+                    "position": job_engine.position(job),
+                    "request_id": message.get("request_id")
+                }, websocket)
     
     except WebSocketDisconnect:
         manager.disconnect(websocket)
@@ -0,0 +1,118 @@
+"""设备中间件的本地替身服务
+
+实现与 C# 中间件相同的设备连接、同步、指纹录入和识别接口，用于在没有
+ZKTeco 设备和中间件的环境中联调后端，也可以在测试中通过 httpx.ASGITransport
+直接挂载到 MiddlewareClient 上。
+
+    python mock_middleware.py --port 9000 --latency 0.05 --failure-rate 0.1
+"""
+import argparse
+import asyncio
+import base64
+import os
+import random
+
+import uvicorn
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+# 每次请求的模拟延迟（秒）
+LATENCY = float(os.getenv("MOCK_MIDDLEWARE_LATENCY", "0"))
+# 返回500错误的概率，用于验证重试和熔断
+FAILURE_RATE = float(os.getenv("MOCK_MIDDLEWARE_FAILURE_RATE", "0"))
+# 模拟模板长度，与后端模板库的特征维度一致
+TEMPLATE_SIZE = 512
+
+app = FastAPI(title="ZKTeco中间件替身服务")
+connected_devices = set()
+
+
+class DeviceConnectRequest(BaseModel):
+    ipAddress: str
+    port: int = 4370
+
+
+class FingerprintEnrollmentRequest(BaseModel):
+    ipAddress: str
+    fingerIndex: int
+
+
+class FingerprintRecognitionRequest(BaseModel):
+    ipAddress: str
+
+
+async def simulate():
+    """模拟设备耗时，并按配置的概率返回故障"""
+    if LATENCY:
+        await asyncio.sleep(LATENCY)
+    if FAILURE_RATE and random.random() < FAILURE_RATE:
+        return JSONResponse(status_code=500, content={"success": False, "message": "模拟中间件故障"})
+    return None
+
+
+def random_template() -> str:
+    return base64.b64encode(os.urandom(TEMPLATE_SIZE)).decode()
+
+
+@app.post("/api/device/connect")
+async def connect(request: DeviceConnectRequest):
+    error = await simulate()
+    if error:
+        return error
+    connected_devices.add(request.ipAddress)
+    return {"success": True, "message": "设备连接成功", "deviceInfo": {"ipAddress": request.ipAddress, "port": request.port}}
+
+
+@app.post("/api/device/disconnect")
+async def disconnect(request: DeviceConnectRequest):
+    error = await simulate()
+    if error:
+        return error
+    connected_devices.discard(request.ipAddress)
+    return {"success": True, "message": "设备断开连接成功"}
+
+
+@app.post("/api/device/sync")
+async def sync(request: DeviceConnectRequest):
+    error = await simulate()
+    if error:
+        return error
+    if request.ipAddress not in connected_devices:
+        return JSONResponse(status_code=400, content={"success": False, "message": "设备未连接，请先连接设备"})
+    return {"success": True, "message": "数据同步成功", "fingerprintCount": 0, "userCount": 0, "logCount": 0}
+
+
+@app.post("/api/fingerprint/enroll")
+async def enroll(request: FingerprintEnrollmentRequest):
+    error = await simulate()
+    if error:
+        return error
+    if request.fingerIndex < 1 or request.fingerIndex > 10:
+        return JSONResponse(status_code=400, content={"success": False, "message": "手指索引必须在1-10之间"})
+    if request.ipAddress not in connected_devices:
+        return JSONResponse(status_code=400, content={"success": False, "message": "设备未连接，请先连接设备"})
+    return {"success": True, "message": "指纹录入成功", "templateData": random_template(), "quality": random.randint(60, 100)}
+
+
+@app.post("/api/fingerprint/recognize")
+async def recognize(request: FingerprintRecognitionRequest):
+    error = await simulate()
+    if error:
+        return error
+    if request.ipAddress not in connected_devices:
+        return JSONResponse(status_code=400, content={"success": False, "message": "设备未连接，请先连接设备"})
+    return {"success": True, "message": "指纹采集成功", "templateData": random_template()}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="ZKTeco中间件替身服务")
+    parser.add_argument("--host", default="127.0.0.1", help="监听主机 (默认: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=9000, help="监听端口 (默认: 9000)")
+    parser.add_argument("--latency", type=float, default=LATENCY, help="每次请求的模拟延迟（秒）")
+    parser.add_argument("--failure-rate", type=float, default=FAILURE_RATE, help="返回500错误的概率")
+    args = parser.parse_args()
+
+    LATENCY = args.latency
+    FAILURE_RATE = args.failure_rate
+    uvicorn.run(app, host=args.host, port=args.port)
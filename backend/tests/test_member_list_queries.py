@@ -0,0 +1,114 @@
+"""会员列表的查询次数不随每页会员数增长"""
+from datetime import datetime
+import asyncio
+
+import httpx
+import pytest
+from fastapi import FastAPI
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.api.member import router as member_router
+from app.database.database import get_db
+from app.models import models
+
+
+@pytest.fixture
+def engine():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    models.Base.metadata.create_all(bind=engine)
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def client(engine):
+    session_factory = sessionmaker(bind=engine, autocommit=False, autoflush=False)
+
+    def override_get_db():
+        db = session_factory()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    app = FastAPI()
+    app.include_router(member_router.router, prefix="/api/members")
+    app.dependency_overrides[get_db] = override_get_db
+
+    def get(path: str, params: dict) -> httpx.Response:
+        async def request():
+            async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as http:
+                return await http.get(path, params=params)
+        return asyncio.run(request())
+
+    return get
+
+
+def add_members(engine, count: int):
+    """添加会员，每人两枚指纹和一条成功识别记录"""
+    session = sessionmaker(bind=engine)()
+    try:
+        device = models.Device(name="测试设备", ip_address="10.0.0.1", port=4370)
+        session.add(device)
+        session.flush()
+        for i in range(count):
+            member = models.Member(name=f"会员{i}", phone=f"1380000{i:04d}")
+            session.add(member)
+            session.flush()
+            for finger_index in (1, 2):
+                session.add(models.FingerprintTemplate(
+                    member_id=member.id, template_data=b"\x00" * 16, finger_index=finger_index
+                ))
+            session.add(models.RecognitionLog(
+                member_id=member.id, device_id=device.id, recognized_at=datetime.now(), status="success"
+            ))
+        session.commit()
+    finally:
+        session.close()
+
+
+def count_statements(engine, client, params) -> int:
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        response = client("/api/members/", params)
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+    assert response.status_code == 200
+    assert len(response.json()) == params["limit"]
+    return len(statements)
+
+
+def test_member_page_statement_count_is_constant(engine, client):
+    add_members(engine, 20)
+
+    single = count_statements(engine, client, {"limit": 1})
+    full = count_statements(engine, client, {"limit": 20})
+
+    assert single == full
+
+
+def test_member_page_includes_summary_columns(engine, client):
+    add_members(engine, 3)
+
+    members = client("/api/members/", {"limit": 3}).json()
+
+    assert [member["fingerprint_count"] for member in members] == [2, 2, 2]
+    assert all(member["last_recognition"] for member in members)
+
+
+def test_member_cursor_ignores_skip(engine, client):
+    add_members(engine, 6)
+
+    first = client("/api/members/", {"limit": 2})
+    second = client("/api/members/", {"limit": 2, "skip": 2, "cursor": first.headers["X-Next-Cursor"]})
+
+    first_ids = [member["id"] for member in first.json()]
+    second_ids = [member["id"] for member in second.json()]
+    assert second_ids == [first_ids[-1] + 1, first_ids[-1] + 2]
@@ -81,11 +81,7 @@ namespace ZKTecoMiddleware.Controllers
                         PropertyNameCaseInsensitive = true
                     });
                     
-                    // 3. 处理考勤记录（如果访问被允许）
-                    if (accessResult.Allowed)
-                    {
-                        await ProcessAttendance(recognitionResult.UserId, request.DeviceId, request.AccessType);
-                    }
+                    // 考勤由后端根据允许通行的访问日志自动记录，这里不再调用签到签退接口
                     
                     return Ok(new { 
                         success = true, 
@@ -236,45 +232,6 @@ namespace ZKTecoMiddleware.Controllers
             }
         }
         
-        /// <summary>
-        /// 处理考勤记录
-        /// </summary>
-        private async Task ProcessAttendance(int memberId, int deviceId, string accessType)
-        {
-            try
-            {
-                // 根据访问类型确定签到或签退
-                string checkType = accessType == "entry" ? "check_in" : "check_out";
-                
-                var attendanceRequest = new
-                {
-                    member_id = memberId,
-                    device_id = deviceId,
-                    check_type = checkType
-                };
-                
-                var json = JsonSerializer.Serialize(attendanceRequest);
-                var content = new StringContent(json, Encoding.UTF8, "application/json");
-                
-                // 异步处理考勤，不等待结果
-                _ = Task.Run(async () =>
-                {
-                    try
-                    {
-                        await _httpClient.PostAsync($"{_backendApiUrl}/attendance/check", content);
-                    }
-                    catch
-                    {
-                        // 忽略考勤记录错误
-                    }
-                });
-            }
-            catch
-            {
-                // 忽略考勤记录错误
-            }
-        }
-        
         /// <summary>
         /// 获取设备今日访问统计
         /// </summary>
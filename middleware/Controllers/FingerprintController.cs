@@ -159,6 +159,7 @@ namespace ZKTecoMiddleware.Controllers
                         success = true, 
                         message = "指纹识别成功", 
                         userId = result.UserId,
+                        templateData = result.TemplateData,
                         confidence = result.Confidence,
                         recognitionTime = result.RecognitionTime
                     });
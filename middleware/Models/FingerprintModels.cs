@@ -75,6 +75,11 @@ namespace ZKTecoMiddleware.Models
         /// </summary>
         public int? UserId { get; set; }
         
+        /// <summary>
+        /// 采集到的指纹模板数据（Base64编码），由后端进行1:N比对
+        /// </summary>
+        public string TemplateData { get; set; }
+        
         /// <summary>
         /// 识别置信度（0-100）
         /// </summary>
@@ -185,6 +185,7 @@ namespace ZKTecoMiddleware.Services
                         Success = true,
                         Message = "指纹识别成功",
                         UserId = random.Next(1, 100),
+                        TemplateData = Convert.ToBase64String(new byte[2048]), // 模拟采集到的指纹模板数据
                         Confidence = random.Next(70, 100),
                         RecognitionTime = DateTime.Now
                     };